@@ -0,0 +1,208 @@
+"""
+Expected-vs-actual attendance matrix.
+
+For a date range, each employee × day cell is one of:
+
+    W  worked         clocked in and out
+    I  incomplete     clocked in, never clocked out
+    A  absent         one of their groups allows the day, but no log
+    -  not scheduled  no group allows the day and there is no log
+
+The database does the work with one query per chunk of employees. The
+days of the range are joined to the group weekday masks through
+UserGroup, giving the scheduled (user, day) pairs. Those are anti-joined
+to AttendanceLog on its (user, date) unique index to find the absences,
+and the range's logs give the rest. Only cells that aren't "-" come back,
+and each employee's row is packed into one string with a character per day.
+
+Schedules come from the current group assignments, which keep no
+history. The range ends today at the latest, and archived months are
+filled in from the archive files.
+"""
+import csv
+import io
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .archive import archived_months, hot_days, load_month, month_bounds, to_date
+from .models import AttendanceGroup, AttendanceLog, UserGroup, weekday_bit
+from users.models import User
+
+
+WORKED = 'W'
+INCOMPLETE = 'I'
+ABSENT = 'A'
+NOT_SCHEDULED = '-'
+
+STATUSES = [
+    (WORKED, 'Worked'),
+    (INCOMPLETE, 'Incomplete'),
+    (ABSENT, 'Absent'),
+    (NOT_SCHEDULED, 'Not scheduled'),
+]
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+
+# Employees per page of the grid
+PAGE_SIZE = 100
+
+# Employees per query
+CHUNK_SIZE = 500
+
+
+def parse_range(start_date=None, end_date=None):
+    """
+    (start, end) dates for the matrix; raises ValueError for bad input.
+
+    Defaults to the last DEFAULT_DAYS days, and never ends after today.
+    """
+    today = timezone.localdate()
+    end = to_date(end_date) if end_date else today
+    if end is None:
+        raise ValueError(f'Invalid end date: {end_date}')
+    end = min(end, today)
+    start = to_date(start_date) if start_date else end - timedelta(days=DEFAULT_DAYS - 1)
+    if start is None:
+        raise ValueError(f'Invalid start date: {start_date}')
+    if start > end:
+        raise ValueError('The start date must not be after the end date (or today).')
+    if (end - start).days + 1 > MAX_DAYS:
+        raise ValueError(f'The range can cover at most {MAX_DAYS} days.')
+    return start, end
+
+
+def parse_group(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def get_days(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def get_employees(group_id=None):
+    """Employees shown in the matrix, by username"""
+    employees = User.objects.filter(is_active=True, role='EMPLOYEE')
+    if group_id:
+        employees = employees.filter(user_groups__group_id=group_id)
+    return employees.order_by('username')
+
+
+def matrix_sql(day_count, user_count, group_id=None):
+    quote = connection.ops.quote_name
+    log_table = quote(AttendanceLog._meta.db_table)
+    days = ', '.join(['(%s, %s)'] * day_count)
+    users = ', '.join(['%s'] * user_count)
+    group_filter = ' AND ug.group_id = %s' if group_id else ''
+    return f"""
+        WITH days (day, bit) AS (VALUES {days}),
+        scheduled AS (
+            SELECT DISTINCT ug.user_id, days.day
+            FROM {quote(UserGroup._meta.db_table)} ug
+            JOIN {quote(AttendanceGroup._meta.db_table)} g ON g.id = ug.group_id
+            JOIN days ON (g.allowed_days_mask & days.bit) <> 0
+            WHERE ug.user_id IN ({users}){group_filter}
+        )
+        SELECT s.user_id, s.day, '{ABSENT}'
+        FROM scheduled s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {log_table} l WHERE l.user_id = s.user_id AND l.date = s.day
+        )
+        UNION ALL
+        SELECT l.user_id, l.date,
+               CASE WHEN l.check_out IS NULL THEN '{INCOMPLETE}' ELSE '{WORKED}' END
+        FROM {log_table} l
+        WHERE l.user_id IN ({users}) AND l.date BETWEEN %s AND %s
+    """
+
+
+def fill_archived(rows, start, end):
+    """Mark logs of archived months, which the query can't see, in rows"""
+    for key, info in archived_months(start, end):
+        if not rows.keys() & set(info['user_ids']):
+            continue
+        columns = load_month(key, info)
+        first, _ = month_bounds(key)
+        # The query already marked rows that are still in the hot table
+        hot = hot_days(key)
+        for user_id, day, check_out in zip(columns['user_id'], columns['day'], columns['check_out']):
+            cells = rows.get(user_id)
+            day = first.replace(day=day)
+            offset = (day - start).days
+            if cells is not None and 0 <= offset < len(cells) and (user_id, day) not in hot:
+                cells[offset] = ord(INCOMPLETE if check_out is None else WORKED)
+
+
+def get_cells(user_ids, start, end, group_id=None):
+    """{user_id: cell string} for some employees, one character per day"""
+    days = get_days(start, end)
+    params = [value for day in days for value in (day, weekday_bit(day))]
+    params += user_ids
+    if group_id:
+        params.append(group_id)
+    params += [*user_ids, start, end]
+
+    rows = {user_id: bytearray(NOT_SCHEDULED * len(days), 'ascii') for user_id in user_ids}
+    with connection.cursor() as cursor:
+        cursor.execute(matrix_sql(len(days), len(user_ids), group_id), params)
+        for user_id, day, status in cursor.fetchall():
+            rows[user_id][(to_date(day) - start).days] = ord(status)
+
+    fill_archived(rows, start, end)
+    return {user_id: cells.decode('ascii') for user_id, cells in rows.items()}
+
+
+def iter_matrix(employees, start, end, group_id=None, chunk_size=CHUNK_SIZE):
+    """Yield (employee values, cells) for an employee queryset, a chunk at a time"""
+    chunk = []
+    for values in employees.values('id', 'username', 'first_name', 'last_name').iterator(chunk_size=chunk_size):
+        chunk.append(values)
+        if len(chunk) == chunk_size:
+            yield from shape_chunk(chunk, start, end, group_id)
+            chunk = []
+    if chunk:
+        yield from shape_chunk(chunk, start, end, group_id)
+
+
+def shape_chunk(chunk, start, end, group_id):
+    cells = get_cells([values['id'] for values in chunk], start, end, group_id)
+    for values in chunk:
+        yield values, cells[values['id']]
+
+
+def display_name(values):
+    return f"{values['first_name']} {values['last_name']}".strip() or values['username']
+
+
+def count_statuses(cells):
+    return {code: cells.count(code) for code, _ in STATUSES}
+
+
+# Export
+
+MATRIX_COUNT_HEADERS = ['worked', 'incomplete', 'absent']
+
+
+def iter_matrix_csv(employees, start, end, group_id=None):
+    """The matrix as CSV chunks: one row per employee, a column per day"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        ['username', 'name'] + [day.isoformat() for day in get_days(start, end)] + MATRIX_COUNT_HEADERS
+    )
+    for values, cells in iter_matrix(employees, start, end, group_id):
+        counts = count_statuses(cells)
+        writer.writerow(
+            [values['username'], display_name(values)] + list(cells)
+            + [counts[WORKED], counts[INCOMPLETE], counts[ABSENT]]
+        )
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
@@ -1,6 +1,83 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import AttendanceGroup, UserGroup, AttendanceLog
+from .models import (
+    AttendanceGroup, UserGroup, AttendanceLog, AttendanceDailySummary, ApiClient, ExportJob, KioskDevice,
+    OutboxEvent, WebhookDelivery, WebhookEndpoint,
+)
+from .rollups import rebuild_days
+
+
+def estimated_row_count(model, using):
+    """The planner's row estimate for model's table, or None if unknown"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 (or 0) until the table has been analyzed
+    return row[0] if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that skips the exact COUNT(*) of very large, unfiltered lists.
+    
+    Counting millions of rows means scanning them all, on every page. When
+    nothing narrows the list and the table statistics say it holds at least
+    ATTENDANCE_ADMIN_ESTIMATE_THRESHOLD rows (default: 100000), the estimate
+    is shown instead. Filtered or searched lists are still counted exactly.
+    """
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            threshold = getattr(settings, 'ATTENDANCE_ADMIN_ESTIMATE_THRESHOLD', 100000)
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        return super().count
+
+
+class UsernameFilter(admin.SimpleListFilter):
+    """Text box filtering by exact username, instead of listing every user"""
+    title = 'user'
+    parameter_name = 'username'
+    template = 'admin/attendance/input_filter.html'
+    
+    def lookups(self, request, model_admin):
+        # Must be non-empty for the filter to be shown
+        return (('', ''),)
+    
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if value:
+            return queryset.filter(user__username=value)
+        return queryset
+    
+    def choices(self, changelist):
+        # The other active filters, kept as hidden inputs of the form
+        query_parts = [
+            (key, value)
+            for key, values in changelist.get_filters_params().items()
+            if key != self.parameter_name
+            for value in (values if isinstance(values, list) else [values])
+        ]
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'query_parts': query_parts,
+            'value': self.value() or '',
+        }
 
 
 @admin.register(AttendanceGroup)
@@ -8,20 +85,25 @@ class AttendanceGroupAdmin(admin.ModelAdmin):
     list_display = ('name', 'display_allowed_days', 'user_count', 'created_at')
     search_fields = ('name',)
     
+    def get_queryset(self, request):
+        # One grouped query instead of a COUNT per row
+        return super().get_queryset(request).annotate(user_total=Count('group_users'))
+    
     def display_allowed_days(self, obj):
         return obj.get_allowed_days_display()
     display_allowed_days.short_description = 'Allowed Days'
     
     def user_count(self, obj):
-        count = obj.group_users.count()
-        return format_html('<strong>{}</strong> users', count)
+        return format_html('<strong>{}</strong> users', obj.user_total)
     user_count.short_description = 'Users'
+    user_count.admin_order_field = 'user_total'
 
 
 @admin.register(UserGroup)
 class UserGroupAdmin(admin.ModelAdmin):
     list_display = ('user', 'group', 'assigned_at')
     list_filter = ('group', 'assigned_at')
+    list_select_related = ('user', 'group')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'group__name')
     autocomplete_fields = ['user', 'group']
 
@@ -29,9 +111,15 @@ class UserGroupAdmin(admin.ModelAdmin):
 @admin.register(AttendanceLog)
 class AttendanceLogAdmin(admin.ModelAdmin):
     list_display = ('user', 'date', 'check_in', 'check_out', 'display_total_hours', 'display_status')
-    list_filter = ('date', 'user')
+    list_filter = ('date', UsernameFilter)
+    list_select_related = ('user',)
     search_fields = ('user__username', 'user__first_name', 'user__last_name')
     date_hierarchy = 'date'
+    # Walks the (date, user) index backwards instead of sorting by username
+    ordering = ('-date', '-user_id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = ['user']
     readonly_fields = ('created_at', 'updated_at', 'get_total_hours_display')
     
     fieldsets = (
@@ -59,3 +147,104 @@ class AttendanceLogAdmin(admin.ModelAdmin):
         else:
             return format_html('<span style="color: gray;">○ Pending</span>')
     display_status.short_description = 'Status'
+    
+    # Edits bypass record_clock_in/out, so recount the affected days
+    def save_model(self, request, obj, form, change):
+        old_date = form.initial.get('date') if change else None
+        super().save_model(request, obj, form, change)
+        rebuild_days({obj.date, old_date} - {None})
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_days([obj.date])
+    
+    def delete_queryset(self, request, queryset):
+        dates = set(queryset.values_list('date', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_days(dates)
+
+
+@admin.register(AttendanceDailySummary)
+class AttendanceDailySummaryAdmin(admin.ModelAdmin):
+    list_display = ('date', 'group', 'expected_count', 'clocked_in_count', 'completed_count', 'total_worked')
+    list_filter = ('group',)
+    date_hierarchy = 'date'
+    list_select_related = ('group',)
+    
+    # Rows are maintained by punches and the rebuild_rollups command
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(KioskDevice)
+class KioskDeviceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name',)
+    
+    def has_add_permission(self, request):
+        # Tokens are only shown once, by the create_kiosk_device command
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'format', 'compress', 'status', 'rows_written', 'total_rows', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'format')
+    list_select_related = ('requested_by',)
+    readonly_fields = [field.name for field in ExportJob._meta.fields]
+    
+    # Jobs are queued from the reports page and run by run_export_worker
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ApiClient)
+class ApiClientAdmin(admin.ModelAdmin):
+    list_display = ('name', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name',)
+    
+    def has_add_permission(self, request):
+        # Tokens are only shown once, by the create_api_client command
+        return False
+
+
+@admin.register(WebhookEndpoint)
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'is_active', 'max_concurrency', 'batch_size', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'url')
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('event', 'endpoint', 'status', 'attempts', 'next_attempt_at', 'delivered_at', 'last_error')
+    list_filter = ('status', 'endpoint')
+    list_select_related = ('event', 'endpoint')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    # Written by dispatch_webhooks only
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'created_at', 'dispatched_at')
+    list_filter = ('event_type',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,285 @@
+"""
+Cold storage for old attendance logs.
+
+The archive_attendance command moves whole months of AttendanceLog out
+of the hot table into one compressed file per month under
+ATTENDANCE_ARCHIVE_DIR. Each file stores the month column by column
+(ids, user ids, days of the month, check in/out as microseconds since
+midnight, timestamps), which compresses far better than rows, and
+manifest.json records which months exist, their date bounds, row counts,
+user ids and checksums.
+
+Reports and the Excel export read archived months through this module
+when a requested range reaches back far enough. The manifest decides
+which months are needed, so recent ranges never touch the files.
+
+A (user, date) can be both archived and still in the hot table: rows
+changed while the command ran are kept for its next run, and a run that
+stops between writing the manifest and deleting leaves the whole month.
+The hot row is the current one, so readers skip the archived copy.
+"""
+import hashlib
+import json
+import lzma
+import os
+import tempfile
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.utils.dateparse import parse_date
+
+from .models import AttendanceLog
+from users.models import User
+
+
+ARCHIVE_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+
+COLUMNS = ('id', 'user_id', 'day', 'check_in', 'check_out', 'created_at', 'updated_at')
+
+# Decoded months kept in memory per process
+MONTH_CACHE_SIZE = 12
+
+_month_cache = OrderedDict()
+
+
+def get_archive_dir():
+    default = os.path.join(getattr(settings, 'BASE_DIR', os.getcwd()), 'archive')
+    return str(getattr(settings, 'ATTENDANCE_ARCHIVE_DIR', default))
+
+
+def month_key(day):
+    return day.strftime('%Y-%m')
+
+
+def month_bounds(key):
+    """First and last date of a YYYY-MM month"""
+    first = datetime.strptime(key, '%Y-%m').date()
+    following = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return first, following - timedelta(days=1)
+
+
+def to_date(value):
+    """Accept a date or a YYYY-MM-DD string; anything else is no bound"""
+    if isinstance(value, date) or value is None:
+        return value
+    try:
+        return parse_date(str(value))
+    except ValueError:
+        return None
+
+
+def time_to_micros(value):
+    if value is None:
+        return None
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+
+def micros_to_time(value):
+    if value is None:
+        return None
+    seconds, micros = divmod(value, 1000000)
+    return time(seconds // 3600, seconds % 3600 // 60, seconds % 60, micros)
+
+
+# Manifest
+
+def read_manifest(archive_dir=None):
+    path = os.path.join(archive_dir or get_archive_dir(), MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': ARCHIVE_VERSION, 'months': {}}
+
+
+def atomic_write(path, data):
+    """Write bytes to path through a temporary file and a rename"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_manifest(manifest, archive_dir=None):
+    path = os.path.join(archive_dir or get_archive_dir(), MANIFEST_NAME)
+    atomic_write(path, json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+
+def archived_months(start_date=None, end_date=None, user_id=None, manifest=None):
+    """Manifest entries (key, info) overlapping a date range, oldest first"""
+    manifest = manifest or read_manifest()
+    start_date = to_date(start_date)
+    end_date = to_date(end_date)
+    months = []
+    for key, info in sorted(manifest['months'].items()):
+        if start_date and info['last_date'] < start_date.isoformat():
+            continue
+        if end_date and info['first_date'] > end_date.isoformat():
+            continue
+        if user_id and int(user_id) not in info['user_ids']:
+            continue
+        months.append((key, info))
+    return months
+
+
+# Month files
+
+def encode_month(rows):
+    """Compress (id, user_id, date, check_in, check_out, created_at, updated_at) rows"""
+    columns = {name: [] for name in COLUMNS}
+    for pk, user_id, day, check_in, check_out, created_at, updated_at in rows:
+        columns['id'].append(pk)
+        columns['user_id'].append(user_id)
+        columns['day'].append(day.day)
+        columns['check_in'].append(time_to_micros(check_in))
+        columns['check_out'].append(time_to_micros(check_out))
+        columns['created_at'].append(created_at.isoformat())
+        columns['updated_at'].append(updated_at.isoformat())
+    payload = {'version': ARCHIVE_VERSION, 'rows': len(columns['id']), 'columns': columns}
+    return lzma.compress(json.dumps(payload, separators=(',', ':')).encode())
+
+
+def decode_month(data):
+    payload = json.loads(lzma.decompress(data))
+    if payload.get('version') != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive version: {payload.get('version')!r}")
+    return payload['columns']
+
+
+def load_month(key, info, archive_dir=None):
+    """Decoded columns of an archived month, cached per process"""
+    path = os.path.join(archive_dir or get_archive_dir(), info['file'])
+    cache_key = (path, info['sha256'])
+    if cache_key in _month_cache:
+        _month_cache.move_to_end(cache_key)
+        return _month_cache[cache_key]
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != info['sha256']:
+        raise ValueError(f'Archive file {path} does not match its checksum')
+    columns = decode_month(data)
+
+    _month_cache[cache_key] = columns
+    if len(_month_cache) > MONTH_CACHE_SIZE:
+        _month_cache.popitem(last=False)
+    return columns
+
+
+def write_month(key, rows, archive_dir=None):
+    """
+    Merge rows into a month's archive file and return its manifest entry.
+
+    Rows already in the file with the same id are replaced by the new
+    ones, which come from the hot table and are at least as recent.
+    """
+    archive_dir = archive_dir or get_archive_dir()
+    manifest = read_manifest(archive_dir)
+    first, last = month_bounds(key)
+
+    merged = {}
+    if key in manifest['months']:
+        columns = load_month(key, manifest['months'][key], archive_dir)
+        for values in zip(*(columns[name] for name in COLUMNS)):
+            pk, user_id, day, check_in, check_out, created_at, updated_at = values
+            merged[pk] = (
+                pk, user_id, first.replace(day=day),
+                micros_to_time(check_in), micros_to_time(check_out),
+                datetime.fromisoformat(created_at), datetime.fromisoformat(updated_at),
+            )
+    for row in rows:
+        merged[row[0]] = row
+
+    ordered = sorted(merged.values(), key=lambda row: (row[2], row[1], row[0]))
+    data = encode_month(ordered)
+    digest = hashlib.sha256(data).hexdigest()
+    # A new name per content, so readers of the current manifest keep
+    # finding the file it points to until the manifest is replaced
+    relative = os.path.join(key[:4], f'{key}-{digest[:12]}.json.xz')
+    atomic_write(os.path.join(archive_dir, relative), data)
+
+    return {
+        'file': relative,
+        'rows': len(ordered),
+        'first_date': first.isoformat(),
+        'last_date': last.isoformat(),
+        'user_ids': sorted({row[1] for row in ordered}),
+        'sha256': digest,
+    }
+
+
+# Read path
+
+def hot_days(key, user_id=None):
+    """(user_id, date) pairs of a month that are still in the hot table"""
+    first, last = month_bounds(key)
+    logs = AttendanceLog.objects.filter(date__range=(first, last))
+    if user_id:
+        logs = logs.filter(user_id=user_id)
+    return set(logs.values_list('user_id', 'date'))
+
+
+def is_archived(day, manifest=None):
+    manifest = manifest or read_manifest()
+    return month_key(day) in manifest['months']
+
+
+def iter_month_values(key, info, start_date=None, end_date=None, user_id=None):
+    """
+    Yield an archived month's rows as dicts shaped like the hot-table
+    report values (REPORT_FIELDS), with current user names.
+
+    Rows still in the hot table are left to the hot-table query.
+    """
+    columns = load_month(key, info)
+    first, _ = month_bounds(key)
+    start_date = to_date(start_date)
+    end_date = to_date(end_date)
+    user_id = int(user_id) if user_id else None
+    hot = hot_days(key, user_id)
+
+    users = {
+        row[0]: row[1:]
+        for row in User.objects.filter(id__in=info['user_ids']).values_list(
+            'id', 'username', 'first_name', 'last_name'
+        )
+    }
+
+    for pk, row_user_id, day, check_in, check_out in zip(
+        columns['id'], columns['user_id'], columns['day'], columns['check_in'], columns['check_out']
+    ):
+        if user_id and row_user_id != user_id:
+            continue
+        day = first.replace(day=day)
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+        if (row_user_id, day) in hot:
+            continue
+        user = users.get(row_user_id)
+        if user is None:
+            # Deleted users take their logs with them, as in the hot table
+            continue
+        worked = None
+        if check_in is not None and check_out is not None:
+            worked = timedelta(microseconds=check_out - check_in)
+        yield {
+            'id': pk,
+            'date': day,
+            'check_in': micros_to_time(check_in),
+            'check_out': micros_to_time(check_out),
+            'worked': worked,
+            'user__username': user[0],
+            'user__first_name': user[1],
+            'user__last_name': user[2],
+        }
@@ -0,0 +1,84 @@
+"""
+Group assignment changes.
+
+Assignments are applied as a diff against the current memberships, in
+one transaction, with bulk_create for the additions. bulk_create sends
+no post_save, so eligibility entries are invalidated, expected headcounts
+refreshed and outbox events written here explicitly.
+"""
+from django.db import transaction
+
+from .eligibility import invalidate_users
+from .models import AttendanceGroup, UserGroup
+from .outbox import membership_event, record_events
+from .rollups import refresh_expected_on_commit
+
+
+def parse_ids(values):
+    """Convert submitted ids to ints, dropping anything that isn't one"""
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def existing_group_ids(group_ids):
+    """The subset of group_ids that exist, validated in one query"""
+    return set(AttendanceGroup.objects.filter(id__in=group_ids).values_list('id', flat=True))
+
+
+def set_user_groups(user_id, group_ids):
+    """
+    Make a user's memberships exactly group_ids.
+
+    Only the difference is written. Returns (added, removed) group ids.
+    """
+    with transaction.atomic():
+        current = set(
+            UserGroup.objects.select_for_update()
+            .filter(user_id=user_id)
+            .values_list('group_id', flat=True)
+        )
+        added = group_ids - current
+        removed = current - group_ids
+
+        if removed:
+            UserGroup.objects.filter(user_id=user_id, group_id__in=removed).delete()
+        UserGroup.objects.bulk_create(
+            [UserGroup(user_id=user_id, group_id=group_id) for group_id in added]
+        )
+        if added:
+            invalidate_users([user_id])
+            refresh_expected_on_commit()
+            record_events(*(membership_event('group_assigned', user_id, group_id) for group_id in added))
+
+    return added, removed
+
+
+def bulk_assign_group(group_id, user_ids):
+    """Add a group to many users, skipping existing members. Returns user ids added."""
+    with transaction.atomic():
+        members = set(
+            UserGroup.objects.filter(group_id=group_id, user_id__in=user_ids)
+            .values_list('user_id', flat=True)
+        )
+        added = user_ids - members
+        UserGroup.objects.bulk_create(
+            [UserGroup(user_id=user_id, group_id=group_id) for user_id in added],
+            ignore_conflicts=True
+        )
+        invalidate_users(added)
+        if added:
+            refresh_expected_on_commit()
+        record_events(*(membership_event('group_assigned', user_id, group_id) for user_id in added))
+    return added
+
+
+def bulk_remove_group(group_id, user_ids):
+    """Remove a group from many users. Returns the number of memberships removed."""
+    with transaction.atomic():
+        removed, _ = UserGroup.objects.filter(group_id=group_id, user_id__in=user_ids).delete()
+    return removed
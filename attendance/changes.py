@@ -0,0 +1,260 @@
+"""
+Incremental change feed for sync clients (payroll, data warehouse).
+
+The feed merges three keyset-paginated streams, each ordered by its own
+(timestamp, id):
+
+    attendance_log  AttendanceLog rows by (updated_at, id)
+    user_group      UserGroup rows by (assigned_at, id); assignments are
+                    only ever inserted or deleted
+    deleted         DeletedRecord tombstones by (deleted_at, id)
+
+The cursor handed to clients is a signed, opaque string holding the
+position reached in each stream. Rows stamped within the last
+ATTENDANCE_CHANGES_LAG_SECONDS are held back: their timestamp is taken
+before their transaction commits, so a slower transaction could still
+commit a row behind a cursor that has already moved past it. The lag
+must cover the time from stamp to commit of every writer; the batch
+ingest, the longest one, stamps its rows just before writing them.
+
+Tombstones are purged after ATTENDANCE_CHANGES_RETENTION_DAYS
+(purge_tombstones, run by the purge_change_tombstones command), and
+cursors expire after the same period so a client can't skip deletions
+that were purged while it was away; it has to sync again from scratch.
+
+Settings:
+    ATTENDANCE_CHANGES_LAG_SECONDS        age a change must reach before
+                                          it is served (default: 30)
+    ATTENDANCE_CHANGES_RETENTION_DAYS     days tombstones are kept and
+                                          cursors stay valid (default: 30)
+"""
+import heapq
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ApiClient, AttendanceLog, DeletedRecord, UserGroup
+
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+CURSOR_SALT = 'attendance.changes.cursor'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorExpired(InvalidCursor):
+    pass
+
+
+def get_lag():
+    return timedelta(seconds=getattr(settings, 'ATTENDANCE_CHANGES_LAG_SECONDS', 30))
+
+
+def get_retention():
+    return timedelta(days=getattr(settings, 'ATTENDANCE_CHANGES_RETENTION_DAYS', 30))
+
+
+def get_api_client(request):
+    """Return the ApiClient authenticated by the request, or None"""
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return ApiClient.authenticate(token.strip())
+
+
+def parse_page_size(value):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+# Cursor
+
+def encode_cursor(positions):
+    return signing.dumps(
+        {name: [at.isoformat(), pk] for name, (at, pk) in positions.items()},
+        salt=CURSOR_SALT,
+        compress=True,
+    )
+
+
+def decode_cursor(cursor):
+    """{stream: (timestamp, id)} from a cursor; empty for the first page"""
+    if not cursor:
+        return {}
+    # A cursor issued before the oldest kept tombstone (plus the lag it
+    # was held back by) may point past purged deletions
+    max_age = get_retention() - get_lag()
+    try:
+        raw = signing.loads(cursor, salt=CURSOR_SALT, max_age=max_age)
+    except signing.SignatureExpired:
+        raise CursorExpired('Cursor expired')
+    except signing.BadSignature:
+        raise InvalidCursor('Invalid cursor')
+    try:
+        positions = {name: (parse_datetime(at), int(pk)) for name, (at, pk) in raw.items()}
+    except (TypeError, ValueError, AttributeError):
+        raise InvalidCursor('Invalid cursor')
+    if any(at is None for at, _ in positions.values()) or not set(positions) <= set(STREAMS):
+        raise InvalidCursor('Invalid cursor')
+    return positions
+
+
+# Tombstones
+
+_tombstones = threading.local()
+
+
+@contextmanager
+def without_log_tombstones():
+    """
+    Delete logs without leaving tombstones in this thread.
+
+    For rows that move elsewhere rather than go away: archived logs are
+    still served by reports and exports.
+    """
+    previous = getattr(_tombstones, 'suppressed', False)
+    _tombstones.suppressed = True
+    try:
+        yield
+    finally:
+        _tombstones.suppressed = previous
+
+
+def record_log_deletion(log):
+    """Tombstone for a deleted AttendanceLog, unless suppressed"""
+    if getattr(_tombstones, 'suppressed', False):
+        return
+    DeletedRecord.objects.create(
+        kind=DeletedRecord.KIND_ATTENDANCE_LOG,
+        object_id=log.pk,
+        data={'user_id': log.user_id, 'date': log.date.isoformat()},
+    )
+
+
+def record_user_group_deletion(user_group):
+    DeletedRecord.objects.create(
+        kind=DeletedRecord.KIND_USER_GROUP,
+        object_id=user_group.pk,
+        data={'user_id': user_group.user_id, 'group_id': user_group.group_id},
+    )
+
+
+def purge_tombstones():
+    """Delete tombstones older than the retention period; returns the count"""
+    deleted, _ = DeletedRecord.objects.filter(deleted_at__lt=timezone.now() - get_retention()).delete()
+    return deleted
+
+
+# Streams: each returns (timestamp, id, change) tuples after a position
+
+def after(queryset, field, position):
+    if position is None:
+        return queryset
+    at, pk = position
+    return queryset.filter(Q(**{f'{field}__gt': at}) | Q(**{field: at, 'id__gt': pk}))
+
+
+def log_changes(position, horizon, limit):
+    logs = after(AttendanceLog.objects.filter(updated_at__lte=horizon), 'updated_at', position)
+    rows = logs.order_by('updated_at', 'id').values_list(
+        'id', 'user_id', 'user__username', 'date', 'check_in', 'check_out', 'updated_at'
+    )[:limit]
+    return [
+        (updated_at, pk, {
+            'type': 'attendance_log',
+            'op': 'upsert',
+            'id': pk,
+            'user_id': user_id,
+            'username': username,
+            'date': day.isoformat(),
+            'check_in': check_in.isoformat() if check_in else None,
+            'check_out': check_out.isoformat() if check_out else None,
+            'changed_at': updated_at.isoformat(),
+        })
+        for pk, user_id, username, day, check_in, check_out, updated_at in rows
+    ]
+
+
+def user_group_changes(position, horizon, limit):
+    memberships = after(UserGroup.objects.filter(assigned_at__lte=horizon), 'assigned_at', position)
+    rows = memberships.order_by('assigned_at', 'id').values_list(
+        'id', 'user_id', 'group_id', 'group__name', 'assigned_at'
+    )[:limit]
+    return [
+        (assigned_at, pk, {
+            'type': 'user_group',
+            'op': 'upsert',
+            'id': pk,
+            'user_id': user_id,
+            'group_id': group_id,
+            'group_name': group_name,
+            'changed_at': assigned_at.isoformat(),
+        })
+        for pk, user_id, group_id, group_name, assigned_at in rows
+    ]
+
+
+def deleted_changes(position, horizon, limit):
+    tombstones = after(DeletedRecord.objects.filter(deleted_at__lte=horizon), 'deleted_at', position)
+    rows = tombstones.order_by('deleted_at', 'id').values_list(
+        'id', 'kind', 'object_id', 'data', 'deleted_at'
+    )[:limit]
+    return [
+        (deleted_at, pk, {
+            'type': kind,
+            'op': 'delete',
+            'id': object_id,
+            **data,
+            'changed_at': deleted_at.isoformat(),
+        })
+        for pk, kind, object_id, data, deleted_at in rows
+    ]
+
+
+STREAMS = {
+    'attendance_log': log_changes,
+    'user_group': user_group_changes,
+    'deleted': deleted_changes,
+}
+
+
+def get_changes(cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of changes after cursor, oldest first.
+
+    Returns (changes, next_cursor, has_more). next_cursor is returned
+    even when nothing changed, so clients can always store the last one.
+    """
+    positions = decode_cursor(cursor)
+    horizon = timezone.now() - get_lag()
+
+    # limit + 1 per stream tells whether anything is left after this page
+    fetched = {
+        name: [(at, pk, name, change) for at, pk, change in stream(positions.get(name), horizon, limit + 1)]
+        for name, stream in STREAMS.items()
+    }
+    merged = heapq.merge(*fetched.values(), key=lambda item: (item[0], item[1], item[2]))
+
+    changes = []
+    for at, pk, name, change in merged:
+        if len(changes) == limit:
+            break
+        positions[name] = (at, pk)
+        changes.append(change)
+
+    has_more = sum(len(items) for items in fetched.values()) > len(changes)
+    return changes, encode_cursor(positions), has_more
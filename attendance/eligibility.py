@@ -0,0 +1,88 @@
+"""
+Per-user clock-in eligibility cache.
+
+Each user's entry holds the union of allowed weekdays across their
+attendance groups, plus the group names for display, so checking
+whether a user may clock in costs no database queries on a cache hit.
+Entries are invalidated by the signal handlers in attendance/signals.py.
+
+Settings:
+    ATTENDANCE_CACHE_ALIAS          cache to use (default: 'default', which
+                                    is local memory unless CACHES is set)
+    ATTENDANCE_ELIGIBILITY_TIMEOUT  entry lifetime in seconds (default: 3600)
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import UserGroup, weekday_bit
+
+
+def get_cache():
+    return caches[getattr(settings, 'ATTENDANCE_CACHE_ALIAS', 'default')]
+
+
+def eligibility_key(user_id):
+    return f'attendance:eligibility:{user_id}'
+
+
+def load_eligibility(user_id):
+    """Build a user's eligibility entry from the database"""
+    groups = (
+        UserGroup.objects.filter(user_id=user_id)
+        .select_related('group')
+        .order_by('group__name')
+    )
+    entry = {'mask': 0, 'groups': []}
+    for ug in groups:
+        entry['mask'] |= ug.group.allowed_days_mask
+        entry['groups'].append({
+            'id': ug.group.id,
+            'name': ug.group.name,
+            'days': ug.group.get_allowed_days_display(),
+            'mask': ug.group.allowed_days_mask,
+        })
+    return entry
+
+
+def get_eligibility(user_id):
+    """Return a user's cached eligibility entry, loading it on a miss"""
+    cache = get_cache()
+    key = eligibility_key(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = load_eligibility(user_id)
+        cache.set(key, entry, getattr(settings, 'ATTENDANCE_ELIGIBILITY_TIMEOUT', 60 * 60))
+    return entry
+
+
+def is_allowed_on(user_id, date):
+    """Check if any of the user's groups allows date"""
+    return bool(get_eligibility(user_id)['mask'] & weekday_bit(date))
+
+
+def allowed_group_ids(entry, date):
+    """Ids of the groups in an eligibility entry that allow date"""
+    bit = weekday_bit(date)
+    return [group['id'] for group in entry['groups'] if group['mask'] & bit]
+
+
+def allowed_group_names(entry, date):
+    """Names of the groups in an eligibility entry that allow date"""
+    bit = weekday_bit(date)
+    return [group['name'] for group in entry['groups'] if group['mask'] & bit]
+
+
+def invalidate_users(user_ids):
+    """
+    Drop cached entries once the current transaction commits, so a
+    concurrent reader cannot re-cache the pre-commit state.
+    """
+    keys = [eligibility_key(user_id) for user_id in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def invalidate_group(group_id):
+    """Drop the cached entries of every member of a group"""
+    invalidate_users(UserGroup.objects.filter(group_id=group_id).values_list('user_id', flat=True))
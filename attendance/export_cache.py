@@ -0,0 +1,192 @@
+"""
+Disk cache for generated export files.
+
+An entry is named after what it contains: a hash of the format and
+filters, then a hash of the data version (export_version: max
+updated_at and row count of the covered logs, archived month checksums,
+and the newest updated_at of the users whose names appear). Editing or
+deleting a log, or renaming one of its users, changes the version of
+every range that includes it and of no other, so those entries simply
+stop matching; when that range is exported again the new entry replaces
+the superseded one. Closed months that nobody edits keep serving the
+same file.
+
+Only ranges that ended before today are cached; open ranges change
+with every punch. Files are written to a temporary name and moved into
+place, and the least recently used entries are evicted once the cache
+grows past its size limit.
+
+Settings:
+    ATTENDANCE_EXPORT_CACHE_DIR        where entries are kept
+                                       (default: BASE_DIR/export_cache)
+    ATTENDANCE_EXPORT_CACHE_MAX_BYTES  total size kept; 0 disables the
+                                       cache (default: 1 GB)
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.utils import timezone
+
+from .archive import to_date
+
+
+READ_CHUNK = 64 * 1024
+
+TMP_PREFIX = '.tmp-'
+
+
+def get_cache_dir():
+    default = os.path.join(getattr(settings, 'BASE_DIR', os.getcwd()), 'export_cache')
+    return str(getattr(settings, 'ATTENDANCE_EXPORT_CACHE_DIR', default))
+
+
+def get_max_bytes():
+    return getattr(settings, 'ATTENDANCE_EXPORT_CACHE_MAX_BYTES', 1024 ** 3)
+
+
+def digest(value):
+    payload = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def entry_name(extension, version, start_date=None, end_date=None, user_id=None):
+    """
+    Cache entry for an export, or None if it shouldn't be cached.
+
+    The range must have ended before today, and the filters must parse.
+    """
+    if not get_max_bytes():
+        return None
+    end = to_date(end_date) if end_date else None
+    if end is None or end >= timezone.localdate():
+        return None
+    start = to_date(start_date) if start_date else None
+    if start_date and start is None:
+        return None
+    try:
+        user_id = int(user_id) if user_id else None
+    except (TypeError, ValueError):
+        return None
+
+    filters = digest([extension, start, end, user_id])[:24]
+    return f'{filters}-{digest(version)[:32]}.{extension}'
+
+
+def open_entry(name):
+    """Open a cached entry for reading, or return None on a miss"""
+    path = os.path.join(get_cache_dir(), name)
+    try:
+        fileobj = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    # Marks the entry as recently used
+    os.utime(path)
+    return fileobj
+
+
+def remove_superseded(name):
+    """Delete the entries for the same export with another data version"""
+    directory = get_cache_dir()
+    prefix = name.split('-', 1)[0] + '-'
+    try:
+        siblings = [f for f in os.listdir(directory) if f.startswith(prefix) and f != name]
+    except FileNotFoundError:
+        siblings = []
+    for sibling in siblings:
+        remove(os.path.join(directory, sibling))
+
+
+def remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict(max_bytes=None):
+    """Delete least recently used entries until the cache fits; returns files deleted"""
+    max_bytes = get_max_bytes() if max_bytes is None else max_bytes
+    directory = get_cache_dir()
+    entries = []
+    try:
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.startswith(TMP_PREFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        remove(path)
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def store(name, write):
+    """
+    Write an entry with write(fileobj) and return it opened for reading.
+
+    The open file stays readable even if eviction removes the entry
+    before the response is sent.
+    """
+    directory = get_cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        remove(tmp_path)
+        raise
+    fileobj = open(path, 'rb')
+    remove_superseded(name)
+    evict()
+    return fileobj
+
+
+def iter_file(fileobj):
+    """Chunks of an open entry; closes it when done"""
+    with fileobj:
+        while chunk := fileobj.read(READ_CHUNK):
+            yield chunk
+
+
+def tee(name, chunks):
+    """
+    Pass chunks through while writing them to an entry.
+
+    The entry is only kept if the stream is consumed to the end, so an
+    interrupted download leaves nothing behind.
+    """
+    directory = get_cache_dir()
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=TMP_PREFIX)
+    complete = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(tmp_path, os.path.join(directory, name))
+        complete = True
+    finally:
+        if not complete:
+            remove(tmp_path)
+    remove_superseded(name)
+    evict()
+
+
+def clear():
+    """Delete every entry; returns files deleted"""
+    return evict(max_bytes=-1)
@@ -0,0 +1,297 @@
+"""
+Background export jobs.
+
+submit() queues an ExportJob, or returns the identical one already in
+flight, and the run_export_worker command generates the files. There is
+no broker: workers poll the table and claim a pending job with a
+conditional UPDATE, so any number of them can run side by side. A
+thread touches a running job's heartbeat_at every HEARTBEAT_INTERVAL
+seconds, whatever phase the job is in, and jobs whose worker stopped
+touching it are put back in the queue up to MAX_ATTEMPTS times. Every
+update a worker makes to a job is conditional on still owning it, so a
+worker that was presumed dead can't overwrite the job's new run.
+
+Settings:
+    ATTENDANCE_EXPORT_DIR             where finished exports are written
+                                      (default: BASE_DIR/exports)
+    ATTENDANCE_EXPORT_RETENTION_DAYS  days finished jobs and their files
+                                      are kept (default: 7)
+"""
+import os
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .archive import archived_months
+from .exports import (
+    STREAM_FORMATS, encode_values, export_filename, filter_logs, iter_export_values,
+    parse_filters, shape_export_row, write_xlsx,
+)
+from .models import AttendanceLog, ExportJob
+
+
+# Rows written between progress updates
+PROGRESS_EVERY = 5000
+
+# Seconds between heartbeats; well under run_export_worker's --stale-after
+HEARTBEAT_INTERVAL = 30
+
+# Claims of a job before a stalled run fails it instead of requeueing it
+MAX_ATTEMPTS = 3
+
+# Lookups and inserts tried when queueing races with identical exports
+SUBMIT_ATTEMPTS = 3
+
+
+class JobLost(Exception):
+    """The job was requeued while this worker was still running it"""
+
+
+def get_export_dir():
+    default = os.path.join(getattr(settings, 'BASE_DIR', os.getcwd()), 'exports')
+    return str(getattr(settings, 'ATTENDANCE_EXPORT_DIR', default))
+
+
+def job_extension(job):
+    extension = STREAM_FORMATS[job.format][1] if job.format in STREAM_FORMATS else 'xlsx'
+    return f'{extension}.gz' if job.compress else extension
+
+
+def download_name(job):
+    return export_filename(job_extension(job))
+
+
+def result_file(job):
+    """Absolute path of a finished job's file, or None if it is gone"""
+    if job.status != ExportJob.STATUS_DONE or not job.result_path:
+        return None
+    path = os.path.join(get_export_dir(), os.path.basename(job.result_path))
+    return path if os.path.isfile(path) else None
+
+
+# Queue
+
+def submit(requested_by, fmt, compress=False, start_date=None, end_date=None, user_id=None):
+    """
+    Queue an export and return (job, created).
+
+    An identical export (same format and filters) that is still pending
+    or running is returned instead of queueing a second one.
+    """
+    if fmt not in dict(ExportJob.FORMAT_CHOICES):
+        raise ValueError(f'Unknown export format: {fmt}')
+    # Workbooks are already zip files
+    compress = bool(compress) and fmt != 'xlsx'
+    filters = parse_filters(start_date, end_date, user_id)
+    key = ExportJob.make_dedup_key(fmt, compress, filters)
+
+    in_flight = ExportJob.objects.filter(dedup_key=key, status__in=ExportJob.IN_FLIGHT)
+    for attempt in range(SUBMIT_ATTEMPTS):
+        job = in_flight.first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = ExportJob.objects.create(
+                    requested_by=requested_by,
+                    format=fmt,
+                    compress=compress,
+                    filters=filters,
+                    dedup_key=key,
+                )
+            return job, True
+        except IntegrityError:
+            # The same export was queued between the lookup and the insert,
+            # and may even have finished since; look again
+            if attempt == SUBMIT_ATTEMPTS - 1:
+                raise
+
+
+def claim_next(worker):
+    """Mark the oldest pending job as running for worker and return it"""
+    candidates = (
+        ExportJob.objects.filter(status=ExportJob.STATUS_PENDING)
+        .order_by('created_at')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_PENDING).update(
+            status=ExportJob.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ExportJob.objects.get(pk=job_id)
+        # Another worker got it first
+    return None
+
+
+def requeue_stale(stale_after):
+    """
+    Return running jobs without a recent heartbeat to the queue.
+
+    Jobs that have already been claimed MAX_ATTEMPTS times are failed
+    instead. Returns (requeued, failed) counts.
+    """
+    now = timezone.now()
+    stale = ExportJob.objects.filter(
+        status=ExportJob.STATUS_RUNNING, heartbeat_at__lt=now - timedelta(seconds=stale_after)
+    )
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ExportJob.STATUS_FAILED,
+        error=f'The worker stopped responding {MAX_ATTEMPTS} times',
+        finished_at=now,
+    )
+    requeued = stale.filter(attempts__lt=MAX_ATTEMPTS).update(
+        status=ExportJob.STATUS_PENDING, worker='', rows_written=0
+    )
+    return requeued, failed
+
+
+def purge_expired():
+    """Delete finished jobs (and their files) past the retention period"""
+    days = getattr(settings, 'ATTENDANCE_EXPORT_RETENTION_DAYS', 7)
+    expired = ExportJob.objects.filter(
+        status__in=[ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED],
+        finished_at__lt=timezone.now() - timedelta(days=days),
+    )
+    for job in expired.only('id', 'status', 'result_path'):
+        path = result_file(job)
+        if path:
+            os.remove(path)
+    return expired.delete()[0]
+
+
+# Execution
+
+def count_rows(start_date=None, end_date=None, user_id=None):
+    """Rows an export will write; archived months count in full"""
+    logs = filter_logs(AttendanceLog.objects.all(), start_date, end_date, user_id)
+    archived = sum(info['rows'] for _, info in archived_months(start_date, end_date, user_id))
+    return logs.count() + archived
+
+
+def owned(job):
+    """
+    The job's row, while it is still running for the claim that job holds.
+
+    The attempt number tells a requeued job reclaimed by the same worker
+    name (same host and pid) apart from the stale run that lost it.
+    """
+    return ExportJob.objects.filter(
+        pk=job.pk, status=ExportJob.STATUS_RUNNING, worker=job.worker, attempts=job.attempts,
+    )
+
+
+class Heartbeat:
+    """
+    Touch a running job's heartbeat_at from a background thread.
+
+    Counting rows and saving a workbook can take minutes without a row
+    going by, so the heartbeat can't ride on progress updates.
+    """
+
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL):
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lost = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not owned(self.job).update(heartbeat_at=timezone.now()):
+                        self.lost = True
+                        return
+                except DatabaseError:
+                    # Try again on the next beat
+                    pass
+        finally:
+            connection.close()
+
+
+def track_progress(job, values):
+    """Pass values through, saving the count every PROGRESS_EVERY rows"""
+    written = 0
+    for written, value in enumerate(values, 1):
+        yield value
+        if written % PROGRESS_EVERY == 0:
+            owned(job).update(rows_written=written)
+    job.rows_written = written
+
+
+def run_job(job):
+    """Generate a claimed job's file and mark it done; raises JobLost if it was requeued"""
+    filters = job.filters
+    directory = get_export_dir()
+    os.makedirs(directory, exist_ok=True)
+    # Per attempt, so a presumed-dead worker never replaces the file of the run that took over
+    name = f'export-{job.pk}-{job.attempts}.{job_extension(job)}'
+
+    with Heartbeat(job) as heartbeat:
+        job.total_rows = count_rows(filters['start_date'], filters['end_date'], filters['user_id'])
+        owned(job).update(total_rows=job.total_rows)
+
+        values = track_progress(
+            job, iter_export_values(filters['start_date'], filters['end_date'], filters['user_id'])
+        )
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if job.format == 'xlsx':
+                    write_xlsx((shape_export_row(v) for v in values), f)
+                else:
+                    for chunk in encode_values(job.format, values, job.compress):
+                        f.write(chunk)
+            os.replace(tmp_path, os.path.join(directory, name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    finished = not heartbeat.lost and owned(job).update(
+        status=ExportJob.STATUS_DONE,
+        result_path=name,
+        rows_written=job.rows_written,
+        finished_at=timezone.now(),
+    )
+    if not finished:
+        os.remove(os.path.join(directory, name))
+        raise JobLost(f'Export #{job.pk} was requeued while running; its result was discarded')
+
+
+def mark_failed(job, error):
+    owned(job).update(
+        status=ExportJob.STATUS_FAILED,
+        error=str(error)[:2000],
+        finished_at=timezone.now(),
+    )
+
+
+def job_payload(job):
+    """JSON-ready status of a job, for the reports page poller"""
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.get_progress(),
+        'rows_written': job.rows_written,
+        'total_rows': job.total_rows,
+        'finished': job.is_finished(),
+        'error': job.error,
+    }
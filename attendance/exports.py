@@ -0,0 +1,447 @@
+"""
+Attendance export helpers.
+
+Exports are generated from ``values_list`` iterators so no model instances
+are built, and workbooks are written with openpyxl's write-only mode so
+memory stays flat regardless of how many rows are exported.
+
+CSV and newline-delimited JSON exports skip the workbook entirely: rows
+are encoded in batches and streamed, optionally gzip-compressed on the
+fly. Their output is deterministic for a given data version, so
+interrupted downloads can be resumed with a Range request.
+
+Exports of ranges that have already ended are kept in the disk cache of
+export_cache.py and served from there until their data changes.
+"""
+import csv
+import hashlib
+import heapq
+import io
+import json
+import os
+import re
+import tempfile
+import zlib
+from itertools import islice
+
+from django.db.models import Count, Max
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+
+from . import export_cache
+from .archive import archived_months, iter_month_values, to_date
+from .models import AttendanceLog
+from users.models import User
+
+
+EXPORT_HEADERS = ['User', 'Date', 'Check In', 'Check Out', 'Total Hours']
+
+# Only the columns needed to shape an export row
+EXPORT_FIELDS = (
+    'user__first_name',
+    'user__last_name',
+    'user__username',
+    'date',
+    'check_in',
+    'check_out',
+    'worked',
+)
+
+EXPORT_CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def parse_filters(start_date=None, end_date=None, user_id=None):
+    """
+    Validate the standard report filters; raises ValueError for bad input.
+
+    Returns the filters with dates as ISO strings and the user as an int,
+    None where a filter is not given.
+    """
+    filters = {'start_date': None, 'end_date': None, 'user_id': None}
+    for name, value in (('start_date', start_date), ('end_date', end_date)):
+        if value:
+            parsed = to_date(value)
+            if parsed is None:
+                raise ValueError(f'Invalid {name.replace("_", " ")}: {value}')
+            filters[name] = parsed.isoformat()
+    if user_id:
+        try:
+            filters['user_id'] = int(user_id)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid user: {user_id}') from None
+    return filters
+
+
+def filter_logs(queryset, start_date=None, end_date=None, user_id=None):
+    """Apply the standard report filters to an AttendanceLog queryset"""
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    if user_id:
+        queryset = queryset.filter(user_id=user_id)
+    return queryset
+
+
+def get_export_queryset(start_date=None, end_date=None, user_id=None):
+    """Return the filtered export rows as a values_list queryset"""
+    logs = AttendanceLog.objects.with_worked().order_by('date', 'user__username')
+    logs = filter_logs(logs, start_date, end_date, user_id)
+    return logs.values_list(*EXPORT_FIELDS)
+
+
+def duration_hours(duration):
+    """Convert a database-computed duration to hours, 0 if missing"""
+    if duration is None:
+        return 0
+    return duration.total_seconds() / 3600
+
+
+def shape_export_row(values):
+    """Turn a raw EXPORT_FIELDS tuple into a display row"""
+    first_name, last_name, username, day, check_in, check_out, worked = values
+    full_name = f"{first_name} {last_name}".strip()
+    return [
+        full_name or username,
+        day.strftime('%Y-%m-%d'),
+        check_in.strftime('%I:%M %p') if check_in else 'N/A',
+        check_out.strftime('%I:%M %p') if check_out else 'N/A',
+        f"{duration_hours(worked):.2f}" if worked is not None else 'N/A',
+    ]
+
+
+def iter_export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream shaped rows from the database in chunks"""
+    for values in queryset.iterator(chunk_size=chunk_size):
+        yield shape_export_row(values)
+
+
+def iter_archived_export_values(months, start_date=None, end_date=None, user_id=None):
+    """EXPORT_FIELDS tuples from archived months, in export order"""
+    for key, info in months:
+        values = sorted(
+            iter_month_values(key, info, start_date, end_date, user_id),
+            key=lambda v: (v['date'], v['user__username'])
+        )
+        for v in values:
+            yield tuple(v[field] for field in EXPORT_FIELDS)
+
+
+def iter_export_values(start_date=None, end_date=None, user_id=None,
+                       chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    EXPORT_FIELDS tuples for a range, including archived months.
+
+    Archived months are only read when the range reaches them, and are
+    merged in order with the hot table rows.
+    """
+    hot = get_export_queryset(start_date, end_date, user_id).iterator(chunk_size=chunk_size)
+    months = archived_months(start_date, end_date, user_id)
+    if not months:
+        return hot
+    archived = iter_archived_export_values(months, start_date, end_date, user_id)
+    return heapq.merge(hot, archived, key=lambda values: (values[3], values[2]))
+
+
+def write_xlsx(rows, fileobj, headers=EXPORT_HEADERS, title="Attendance Report"):
+    """
+    Write rows to fileobj as a styled write-only workbook.
+
+    Rows are flushed to disk as they are appended, so only the current
+    row is held in memory.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title)
+
+    # Column widths must be set before any row is written
+    for index in range(len(headers)):
+        ws.column_dimensions[get_column_letter(index + 1)].width = 25 if index == 0 else 15
+
+    # Style headers
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    header_alignment = Alignment(horizontal='center')
+
+    header_row = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+        header_row.append(cell)
+    ws.append(header_row)
+
+    count = 0
+    for row in rows:
+        ws.append(row)
+        count += 1
+
+    wb.save(fileobj)
+    return count
+
+
+def export_filename(extension, prefix='attendance_report'):
+    return f"{prefix}_{timezone.localdate().strftime('%Y%m%d')}.{extension}"
+
+
+def xlsx_response(rows, headers=EXPORT_HEADERS, title="Attendance Report",
+                  prefix='attendance_report'):
+    """
+    Build the workbook into a temporary file and stream it back in chunks.
+
+    An xlsx file is a zip whose central directory is written last, so
+    nothing is sent until the whole workbook is built: memory stays flat
+    but the time to first byte still grows with the row count. Use the
+    CSV/NDJSON exports (or a background job) when that matters.
+    """
+    fileobj = tempfile.TemporaryFile()
+    write_xlsx(rows, fileobj, headers, title)
+    fileobj.seek(0)
+
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename=export_filename('xlsx', prefix),
+        content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+# Machine-readable formats
+
+DATA_HEADERS = ['username', 'first_name', 'last_name', 'date', 'check_in', 'check_out', 'total_hours']
+
+# format: (content type, file extension)
+STREAM_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+# Rows encoded together into each chunk handed to the server
+STREAM_BATCH_ROWS = 500
+
+GZIP_LEVEL = 6
+
+RANGE_HEADER = re.compile(r'^bytes=(\d+)-(\d*)$')
+
+
+def shape_data_row(values):
+    """Turn a raw EXPORT_FIELDS tuple into ISO-formatted DATA_HEADERS values"""
+    first_name, last_name, username, day, check_in, check_out, worked = values
+    return [
+        username,
+        first_name,
+        last_name,
+        day.isoformat(),
+        check_in.isoformat() if check_in else None,
+        check_out.isoformat() if check_out else None,
+        round(duration_hours(worked), 2) if worked is not None else None,
+    ]
+
+
+def iter_batches(values, size=STREAM_BATCH_ROWS):
+    values = iter(values)
+    while batch := list(islice(values, size)):
+        yield batch
+
+
+def iter_csv_chunks(values):
+    """Encoded CSV chunks, header first; missing values are empty"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(DATA_HEADERS)
+    for batch in iter_batches(values):
+        writer.writerows(shape_data_row(v) for v in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only, no rows
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson_chunks(values):
+    """Encoded chunks of one JSON object per line; missing values are null"""
+    encode = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+    for batch in iter_batches(values):
+        lines = [encode(dict(zip(DATA_HEADERS, shape_data_row(v)))) for v in batch]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """
+    Gzip a byte stream as it is produced.
+
+    zlib writes a zero timestamp in the gzip header, so the same input
+    always compresses to the same bytes.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def encode_values(fmt, values, compress=False):
+    """Encode EXPORT_FIELDS tuples in a STREAM_FORMATS format"""
+    chunks = iter_csv_chunks(values) if fmt == 'csv' else iter_ndjson_chunks(values)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def iter_data_chunks(fmt, compress=False, start_date=None, end_date=None, user_id=None):
+    """Encoded export in a STREAM_FORMATS format, including archived months"""
+    return encode_values(fmt, iter_export_values(start_date, end_date, user_id), compress)
+
+
+def export_version(start_date=None, end_date=None, user_id=None):
+    """
+    Identifies the data behind an export.
+
+    Every write to a log bumps its updated_at and deletions lower the
+    count; archived months are identified by their file checksums.
+    Exports also show user names, so the newest updated_at of the users
+    behind the rows is included.
+    """
+    logs = filter_logs(AttendanceLog.objects.all(), start_date, end_date, user_id)
+    state = logs.aggregate(last=Max('updated_at'), count=Count('id'), users=Max('user__updated_at'))
+    months = archived_months(start_date, end_date, user_id)
+    archived_users = None
+    if months:
+        user_ids = {int(user_id)} if user_id else {pk for _, info in months for pk in info['user_ids']}
+        archived_users = User.objects.filter(id__in=user_ids).aggregate(
+            last=Max('updated_at'), count=Count('id')
+        )
+    return {
+        'last_updated': state['last'],
+        'count': state['count'],
+        'users_updated': state['users'],
+        'archived': [info['sha256'] for _, info in months],
+        'archived_users': archived_users,
+    }
+
+
+def export_etag(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return '"%s"' % hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def parse_range(header):
+    """(first, last or None) for a single 'bytes=first-[last]' range, else None"""
+    match = RANGE_HEADER.match(header.strip())
+    if not match:
+        return None
+    first = int(match.group(1))
+    last = int(match.group(2)) if match.group(2) else None
+    if last is not None and last < first:
+        return None
+    return first, last
+
+
+def iter_file_range(fileobj, first, last):
+    """Chunks of the bytes first..last (inclusive) of a file; closes it when done"""
+    with fileobj:
+        fileobj.seek(first)
+        remaining = last - first + 1
+        while remaining > 0 and (chunk := fileobj.read(min(export_cache.READ_CHUNK, remaining))):
+            remaining -= len(chunk)
+            yield chunk
+
+
+def stream_response(request, make_chunks, open_file, content_type, filename, etag):
+    """
+    Stream an export, honouring a single byte Range.
+
+    make_chunks() streams the export; open_file() returns the whole
+    export as a file opened for reading, which a Range request is sliced
+    from, so the export is built at most once per request. An If-Range
+    that no longer matches gets the whole export.
+    """
+    requested = parse_range(request.headers.get('Range', ''))
+    if_range = request.headers.get('If-Range')
+    if requested is not None and if_range is not None and if_range != etag:
+        requested = None
+
+    if requested is None:
+        response = StreamingHttpResponse(make_chunks(), content_type=content_type)
+    else:
+        fileobj = open_file()
+        length = os.fstat(fileobj.fileno()).st_size
+        first, last = requested
+        if first >= length:
+            fileobj.close()
+            response = HttpResponse(status=416, content_type=content_type)
+            response['Content-Range'] = f'bytes */{length}'
+            return response
+        last = length - 1 if last is None else min(last, length - 1)
+        response = StreamingHttpResponse(
+            iter_file_range(fileobj, first, last), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {first}-{last}/{length}'
+        response['Content-Length'] = str(last - first + 1)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def data_export_response(request, fmt, compress=False, start_date=None, end_date=None, user_id=None):
+    """CSV or NDJSON export of the report filters as a resumable stream"""
+    content_type, extension = STREAM_FORMATS[fmt]
+    if compress:
+        content_type, extension = 'application/gzip', f'{extension}.gz'
+
+    version = export_version(start_date, end_date, user_id)
+    etag = export_etag(fmt, compress, start_date, end_date, user_id, version)
+    cache_name = export_cache.entry_name(extension, version, start_date, end_date, user_id)
+
+    def write(fileobj):
+        for chunk in iter_data_chunks(fmt, compress, start_date, end_date, user_id):
+            fileobj.write(chunk)
+
+    def make_chunks():
+        cached = export_cache.open_entry(cache_name) if cache_name else None
+        if cached is not None:
+            return export_cache.iter_file(cached)
+        chunks = iter_data_chunks(fmt, compress, start_date, end_date, user_id)
+        return export_cache.tee(cache_name, chunks) if cache_name else chunks
+
+    def open_file():
+        if cache_name:
+            return export_cache.open_entry(cache_name) or export_cache.store(cache_name, write)
+        # Open ranges aren't cached; the export is written to a temporary file
+        fileobj = tempfile.TemporaryFile()
+        write(fileobj)
+        fileobj.seek(0)
+        return fileobj
+
+    return stream_response(
+        request, make_chunks, open_file, content_type, export_filename(extension), etag
+    )
+
+
+def excel_export_response(start_date=None, end_date=None, user_id=None):
+    """Excel export of the report filters, served from the export cache when possible"""
+    def rows():
+        return (shape_export_row(values) for values in iter_export_values(start_date, end_date, user_id))
+
+    version = export_version(start_date, end_date, user_id)
+    cache_name = export_cache.entry_name('xlsx', version, start_date, end_date, user_id)
+    if cache_name is None:
+        return xlsx_response(rows())
+
+    fileobj = export_cache.open_entry(cache_name)
+    if fileobj is None:
+        fileobj = export_cache.store(cache_name, lambda f: write_xlsx(rows(), f))
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename=export_filename('xlsx'),
+        content_type=XLSX_CONTENT_TYPE,
+    )
@@ -0,0 +1,305 @@
+"""
+Batch ingestion of buffered punches from offline terminals.
+
+A batch is a list of punches, each a dict with the employee ("user" for
+a username or "badge" for a badge ID), an ISO 8601 "timestamp" and a
+"direction" of "in" or "out". Punches are resolved with the same rules
+as the live clock_in/clock_out path:
+
+- clocking in requires a group allowing that weekday
+- the first check in and the first check out of a day win, later ones
+  are skipped rather than overwriting recorded times
+- a check out needs a check in before it
+
+Users, eligibility and existing logs are preloaded with a handful of
+queries, and writes go through bulk_create/bulk_update in chunked
+transactions. The daily rollups of every date touched are rebuilt once
+at the end rather than per punch.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AttendanceLog, UserGroup, weekday_bit
+from .outbox import punch_event, record_events
+from .rollups import rebuild_days
+from users.models import User
+
+
+INGEST_CHUNK_SIZE = 1000
+
+# Largest batch accepted by the HTTP endpoint
+BATCH_MAX_PUNCHES = 10000
+
+# Attempts at a chunk whose rows keep being created by live punches
+INGEST_ATTEMPTS = 3
+
+# Rejected punches listed individually in a report
+MAX_REPORTED_REJECTIONS = 100
+
+APPLIED = 'applied'
+SKIPPED = 'skipped'
+REJECTED = 'rejected'
+
+
+class IngestReport:
+    """Counts of applied, skipped and rejected punches"""
+
+    def __init__(self):
+        self.applied = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.rejections = []
+
+    def add(self, index, outcome, reason=None):
+        if outcome == APPLIED:
+            self.applied += 1
+        elif outcome == SKIPPED:
+            self.skipped += 1
+        else:
+            self.rejected += 1
+            if len(self.rejections) < MAX_REPORTED_REJECTIONS:
+                self.rejections.append({'index': index, 'reason': reason})
+
+    def as_dict(self):
+        return {
+            'applied': self.applied,
+            'skipped': self.skipped,
+            'rejected': self.rejected,
+            'rejections': self.rejections,
+        }
+
+
+def in_chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def parse_punch(raw):
+    """
+    Validate one raw punch.
+
+    Returns (punch, None) or (None, reason), where punch holds the
+    identifier, local date, local time and direction.
+    """
+    if not isinstance(raw, dict):
+        return None, 'punch must be an object'
+
+    direction = raw.get('direction')
+    if direction not in ('in', 'out'):
+        return None, f'invalid direction: {direction!r}'
+
+    username = raw.get('user')
+    badge = raw.get('badge')
+    if not username and not badge:
+        return None, 'missing user or badge'
+
+    try:
+        at = parse_datetime(str(raw.get('timestamp', '')))
+    except ValueError:
+        at = None
+    if at is None:
+        return None, f'invalid timestamp: {raw.get("timestamp")!r}'
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+    at = timezone.localtime(at)
+
+    return {
+        'user': str(username) if username else None,
+        'badge': str(badge) if badge and not username else None,
+        'date': at.date(),
+        'time': at.time(),
+        'direction': direction,
+    }, None
+
+
+def load_user_ids(punches, chunk_size):
+    """Map usernames and badge IDs to active user ids"""
+    usernames = {p['user'] for p in punches if p['user']}
+    badges = {p['badge'] for p in punches if p['badge']}
+    users = User.objects.filter(is_active=True)
+
+    by_username = {}
+    for chunk in in_chunks(usernames, chunk_size):
+        by_username.update(users.filter(username__in=chunk).values_list('username', 'id'))
+    by_badge = {}
+    for chunk in in_chunks(badges, chunk_size):
+        by_badge.update(users.filter(badge_id__in=chunk).values_list('badge_id', 'id'))
+    return by_username, by_badge
+
+
+def load_allowed_masks(user_ids, chunk_size):
+    """Union of allowed-days masks per user"""
+    masks = defaultdict(int)
+    for chunk in in_chunks(user_ids, chunk_size):
+        rows = UserGroup.objects.filter(user_id__in=chunk).values_list('user_id', 'group__allowed_days_mask')
+        for user_id, mask in rows:
+            masks[user_id] |= mask
+    return masks
+
+
+def resolve_day(check_in, check_out, in_time, out_time):
+    """
+    Merge a day's first in/out punch into the recorded times.
+
+    Returns (check_in, check_out, in_outcome, out_outcome) where each
+    outcome is (outcome, reason) or None when there was no such punch.
+    """
+    in_outcome = out_outcome = None
+
+    if in_time is not None:
+        if check_in is None:
+            check_in = in_time
+            in_outcome = (APPLIED, None)
+        else:
+            in_outcome = (SKIPPED, 'already clocked in')
+
+    if out_time is not None:
+        if check_out is not None:
+            out_outcome = (SKIPPED, 'already clocked out')
+        elif check_in is None:
+            out_outcome = (REJECTED, 'no clock in before clock out')
+        elif out_time <= check_in:
+            out_outcome = (REJECTED, 'check out must be after check in')
+        else:
+            check_out = out_time
+            out_outcome = (APPLIED, None)
+
+    return check_in, check_out, in_outcome, out_outcome
+
+
+def apply_days(days, report):
+    """
+    Write one chunk of (user_id, date) -> {'in': (index, time), 'out': ...}
+    in a single transaction, locking the existing rows.
+    """
+    user_ids = {user_id for user_id, _ in days}
+    dates = {day for _, day in days}
+
+    with transaction.atomic():
+        existing = {
+            (log.user_id, log.date): log
+            for log in AttendanceLog.objects.select_for_update().filter(
+                user_id__in=user_ids,
+                date__in=dates
+            )
+            if (log.user_id, log.date) in days
+        }
+
+        new_logs = []
+        changed_logs = []
+        outcomes = []
+        events = []
+
+        for key, punches in days.items():
+            in_index, in_time = punches.get('in', (None, None))
+            out_index, out_time = punches.get('out', (None, None))
+
+            log = existing.get(key)
+            check_in, check_out, in_outcome, out_outcome = resolve_day(
+                log.check_in if log else None,
+                log.check_out if log else None,
+                in_time,
+                out_time
+            )
+
+            if in_outcome:
+                outcomes.append((in_index, *in_outcome))
+                if in_outcome[0] == APPLIED:
+                    events.append(punch_event('clock_in', *key, in_time))
+            if out_outcome:
+                outcomes.append((out_index, *out_outcome))
+                if out_outcome[0] == APPLIED:
+                    events.append(punch_event('clock_out', *key, out_time))
+
+            if log is None:
+                if check_in is not None:
+                    new_logs.append(AttendanceLog(
+                        user_id=key[0],
+                        date=key[1],
+                        check_in=check_in,
+                        check_out=check_out
+                    ))
+            elif (check_in, check_out) != (log.check_in, log.check_out):
+                log.check_in = check_in
+                log.check_out = check_out
+                changed_logs.append(log)
+
+        # Stamped after the row locks were waited for, right before the
+        # writes, so the change feed's lag only has to cover the writes
+        now = timezone.now()
+        for log in changed_logs:
+            log.updated_at = now
+        AttendanceLog.objects.bulk_create(new_logs)
+        AttendanceLog.objects.bulk_update(changed_logs, ['check_in', 'check_out', 'updated_at'])
+        record_events(*events)
+
+    for index, outcome, reason in outcomes:
+        report.add(index, outcome, reason)
+
+
+def reject_chunk(days, report):
+    """Report every punch of a chunk that could not be written"""
+    for punches in days.values():
+        for index, _ in punches.values():
+            report.add(index, REJECTED, 'conflicting concurrent punches, resend later')
+
+
+def ingest_punches(raw_punches, chunk_size=INGEST_CHUNK_SIZE):
+    """Ingest a batch of raw punches and return an IngestReport"""
+    report = IngestReport()
+
+    punches = []
+    for index, raw in enumerate(raw_punches):
+        punch, reason = parse_punch(raw)
+        if punch is None:
+            report.add(index, REJECTED, reason)
+        else:
+            punch['index'] = index
+            punches.append(punch)
+
+    by_username, by_badge = load_user_ids(punches, chunk_size)
+    for punch in punches:
+        if punch['user']:
+            punch['user_id'] = by_username.get(punch['user'])
+        else:
+            punch['user_id'] = by_badge.get(punch['badge'])
+
+    masks = load_allowed_masks({p['user_id'] for p in punches if p['user_id']}, chunk_size)
+
+    # Keep the earliest punch of each direction per user and day
+    days = {}
+    for punch in sorted(punches, key=lambda p: (p['date'], p['time'], p['index'])):
+        index = punch['index']
+        if punch['user_id'] is None:
+            report.add(index, REJECTED, 'unknown user or badge')
+            continue
+        if punch['direction'] == 'in' and not masks[punch['user_id']] & weekday_bit(punch['date']):
+            report.add(index, REJECTED, f'not allowed to clock in on {punch["date"].strftime("%A")}')
+            continue
+
+        day = days.setdefault((punch['user_id'], punch['date']), {})
+        if punch['direction'] in day:
+            report.add(index, SKIPPED)
+        else:
+            day[punch['direction']] = (index, punch['time'])
+
+    keys = list(days)
+    for chunk_keys in in_chunks(keys, chunk_size):
+        chunk = {key: days[key] for key in chunk_keys}
+        # A live punch may create one of the rows after it was read;
+        # each retry sees the rows created so far as existing
+        for attempt in range(INGEST_ATTEMPTS):
+            try:
+                apply_days(chunk, report)
+                break
+            except IntegrityError:
+                if attempt == INGEST_ATTEMPTS - 1:
+                    reject_chunk(chunk, report)
+
+    rebuild_days(sorted({day for _, day in keys}))
+
+    return report
@@ -0,0 +1,166 @@
+"""
+Opt-in request instrumentation.
+
+Add ``attendance.instrumentation.RequestMetricsMiddleware`` to MIDDLEWARE
+(after AuthenticationMiddleware) to record, for every request, the view
+name, total time, time spent in SQL, query count, duplicate queries and
+response size. Records are kept in a bounded in-memory ring buffer per
+process and shown on the admin Request Metrics page; they can also be
+appended to a JSON lines file.
+
+Settings:
+    ATTENDANCE_METRICS_BUFFER_SIZE  records kept per process (default: 1000)
+    ATTENDANCE_METRICS_LOG_FILE     JSON lines file to append records to
+                                    (default: none)
+"""
+import json
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+class MetricsBuffer:
+    """Thread-safe ring buffer of request records"""
+
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.records = deque(maxlen=size)
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.records)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+
+buffer = MetricsBuffer(getattr(settings, 'ATTENDANCE_METRICS_BUFFER_SIZE', 1000))
+
+_log_lock = threading.Lock()
+
+
+def write_log(record):
+    path = getattr(settings, 'ATTENDANCE_METRICS_LOG_FILE', None)
+    if not path:
+        return
+    line = json.dumps(record, separators=(',', ':')) + '\n'
+    with _log_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+class QueryRecorder:
+    """execute_wrapper collecting each statement and its duration"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    # The URL name, or the view's dotted path when it has none
+    return match.view_name
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        # Statements are compared with their placeholders, so the same
+        # query run for each row of a page counts as duplicates
+        statements = Counter(sql for sql, _ in recorder.queries)
+        top_sql, top_count = statements.most_common(1)[0] if statements else ('', 0)
+
+        record = {
+            'at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': view_name(request),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'sql_ms': round(sum(duration for _, duration in recorder.queries) * 1000, 2),
+            'queries': len(recorder.queries),
+            'duplicates': len(recorder.queries) - len(statements),
+            'top_sql': top_sql if top_count > 1 else '',
+            'top_sql_count': top_count,
+            # Streamed bodies are produced after the view returns
+            'response_bytes': None if response.streaming else len(response.content),
+        }
+        buffer.add(record)
+        write_log(record)
+        return response
+
+
+def is_enabled():
+    return 'attendance.instrumentation.RequestMetricsMiddleware' in settings.MIDDLEWARE
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def slowest_endpoints(records, limit=20):
+    """Per-view aggregates ordered by p95 total time"""
+    by_view = {}
+    for record in records:
+        by_view.setdefault(record['view'], []).append(record)
+
+    rows = []
+    for name, view_records in by_view.items():
+        totals = [r['total_ms'] for r in view_records]
+        count = len(view_records)
+        rows.append({
+            'view': name,
+            'count': count,
+            'avg_ms': sum(totals) / count,
+            'p95_ms': percentile(totals, 0.95),
+            'max_ms': max(totals),
+            'avg_sql_ms': sum(r['sql_ms'] for r in view_records) / count,
+            'avg_queries': sum(r['queries'] for r in view_records) / count,
+            'max_duplicates': max(r['duplicates'] for r in view_records),
+        })
+    rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return rows[:limit]
+
+
+def n_plus_one_offenders(records, limit=20):
+    """Views with the most repeated statement, worst request per view"""
+    worst = {}
+    for record in records:
+        if record['top_sql_count'] < 2:
+            continue
+        current = worst.get(record['view'])
+        if current is None or record['top_sql_count'] > current['top_sql_count']:
+            worst[record['view']] = record
+    rows = sorted(worst.values(), key=lambda record: record['top_sql_count'], reverse=True)
+    return rows[:limit]
@@ -0,0 +1,101 @@
+"""
+Kiosk punches from shared terminals.
+
+Terminals authenticate with a device token (``Authorization: Bearer
+<token>``) instead of a user session, and identify the employee by badge
+ID or PIN. Eligibility and the one-row-per-day rule are the same as for
+the clock_in/clock_out views.
+
+A 4-digit PIN space is small, so each device may only fail to match a
+badge or PIN a limited number of times; once it reaches the limit it is
+locked out until the window expires. Counters live in the same cache as
+the eligibility entries.
+
+Settings:
+    ATTENDANCE_KIOSK_MAX_FAILURES   unknown badges/PINs allowed per device
+                                    and window (default: 10)
+    ATTENDANCE_KIOSK_LOCKOUT        window and lockout length in seconds
+                                    (default: 900)
+"""
+from django.conf import settings
+
+from .eligibility import get_cache, is_allowed_on
+from .models import KioskDevice
+from .rollups import record_clock_in, record_clock_out
+from users.models import User
+
+
+DIRECTIONS = ('in', 'out', 'auto')
+
+
+def get_device(request):
+    """Return the KioskDevice authenticated by the request, or None"""
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return KioskDevice.authenticate(token.strip())
+
+
+def failures_key(device_id):
+    return f'attendance:kiosk_failures:{device_id}'
+
+
+def get_lockout():
+    return getattr(settings, 'ATTENDANCE_KIOSK_LOCKOUT', 15 * 60)
+
+
+def is_locked_out(device):
+    """Check if a device has used up its failed lookups for the window"""
+    failures = get_cache().get(failures_key(device.pk), 0)
+    return failures >= getattr(settings, 'ATTENDANCE_KIOSK_MAX_FAILURES', 10)
+
+
+def record_failure(device):
+    """
+    Count an unknown badge or PIN against a device.
+
+    The window starts with the first failure and is not extended by later
+    ones, nor reset by successful punches.
+    """
+    cache = get_cache()
+    key = failures_key(device.pk)
+    cache.add(key, 0, get_lockout())
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.add(key, 1, get_lockout())
+
+
+def find_kiosk_user(badge=None, pin=None):
+    """Resolve an active user by badge ID or PIN in one query"""
+    users = User.objects.filter(is_active=True).only('id', 'username', 'first_name', 'last_name')
+    if badge:
+        return users.filter(badge_id=badge).first()
+    if pin:
+        return users.filter(kiosk_pin_digest=User.make_kiosk_pin_digest(pin)).first()
+    return None
+
+
+def record_punch(user_id, day, at, direction='auto'):
+    """
+    Record a punch and return its outcome.
+
+    'auto' clocks in when the day is allowed and the user has not clocked
+    in yet, and clocks out otherwise. Outcomes are those of
+    record_clock_in/record_clock_out, plus 'not_allowed'.
+    """
+    allowed = is_allowed_on(user_id, day)
+
+    if direction in ('in', 'auto') and allowed:
+        result = record_clock_in(user_id, day, at)
+        if direction == 'in' or result == 'clocked_in':
+            return result
+    elif direction == 'in':
+        return 'not_allowed'
+
+    result = record_clock_out(user_id, day, at)
+    if direction == 'auto' and not allowed and result in ('no_record', 'not_clocked_in'):
+        return 'not_allowed'
+    return result
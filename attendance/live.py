@@ -0,0 +1,169 @@
+"""
+Live attendance events for the admin dashboard.
+
+Punches publish small clock_in/clock_out events once their transaction
+commits, and the async ``live_events`` view streams them to connected
+dashboards as Server-Sent Events, so a punch costs one short message per
+open board instead of a full dashboard render.
+
+Events go through a hub whose backend is set with the
+ATTENDANCE_LIVE_BACKEND setting (a dotted path). The default
+LocalBackend fans events out in memory and needs no broker, but only
+reaches dashboards connected to the same process; deployments with
+several ASGI workers can plug in a backend over a shared broker by
+implementing publish() and subscribe().
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .exports import duration_hours
+from .models import AttendanceLog
+
+
+# Events buffered per connection before a slow client is told to reload
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+
+class Subscription:
+    """One connected dashboard: an asyncio queue on its event loop"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        """Called on the subscriber's loop"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client missed events; it is told to reload instead
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait({'type': 'reload'})
+
+    async def get(self, timeout):
+        """Next event, or None after timeout seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class LocalBackend:
+    """In-process fan-out to every subscription of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, event):
+        # Sync views publish from worker threads, so hand the event to
+        # each subscriber's own loop
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # The loop has been closed
+                self.unsubscribe(subscription)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'ATTENDANCE_LIVE_BACKEND', 'attendance.live.LocalBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def publish(event):
+    """Publish an event once the current transaction commits"""
+    transaction.on_commit(lambda: get_backend().publish(event))
+
+
+def publish_punch(user_id, date):
+    """Publish the current state of a user's log for date after a punch"""
+    values = AttendanceLog.objects.filter(user_id=user_id, date=date).with_worked().values(
+        'check_in',
+        'check_out',
+        'worked',
+        'user__username',
+        'user__first_name',
+        'user__last_name',
+        'user__email',
+    ).first()
+    if values is None:
+        return
+
+    full_name = f"{values['user__first_name']} {values['user__last_name']}".strip()
+    check_out = values['check_out']
+    publish({
+        'type': 'clock_out' if check_out else 'clock_in',
+        'user_id': user_id,
+        'date': date.isoformat(),
+        'name': full_name or values['user__username'],
+        'initials': (
+            (values['user__first_name'][:1] or values['user__username'][:1])
+            + values['user__last_name'][:1]
+        ),
+        'email': values['user__email'],
+        'check_in': values['check_in'].isoformat(timespec='seconds'),
+        'check_in_display': values['check_in'].strftime('%I:%M %p'),
+        'check_out_display': check_out.strftime('%I:%M %p') if check_out else None,
+        'hours': round(duration_hours(values['worked']), 2),
+    })
+
+
+def format_event(event):
+    """Encode an event as an SSE message"""
+    data = json.dumps(event, separators=(',', ':'))
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def stream(subscription):
+    """Yield SSE messages for a subscription until the client goes away"""
+    try:
+        # Tell EventSource to wait a few seconds before reconnecting
+        yield 'retry: 5000\n\n'
+        while True:
+            event = await subscription.get(HEARTBEAT_INTERVAL)
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(event)
+            if event['type'] == 'reload':
+                return
+    finally:
+        subscription.close()
@@ -0,0 +1,141 @@
+import os
+import time as time_module
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from attendance.archive import get_archive_dir, month_key, read_manifest, write_manifest, write_month
+from attendance.changes import without_log_tombstones
+from attendance.models import AttendanceLog
+
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'date', 'check_in', 'check_out', 'created_at', 'updated_at')
+
+
+def months_ago(day, months):
+    """First day of the month `months` months before day's month"""
+    index = day.year * 12 + day.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = 'Moves whole months of old attendance logs into compressed archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-months',
+            type=int,
+            default=13,
+            help='Months kept in the database, counting the current one (default: 13)'
+        )
+        parser.add_argument(
+            '--before',
+            help='Archive months before this date instead, YYYY-MM-DD (rounded down to the month)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows deleted per transaction (default: 5000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the months that would be archived without changing anything'
+        )
+
+    def get_cutoff(self, options):
+        if options['before']:
+            try:
+                before = parse_date(options['before'])
+            except ValueError:
+                before = None
+            if before is None:
+                raise CommandError(f"Invalid --before date: {options['before']!r}")
+            return before.replace(day=1)
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months must be at least 1')
+        return months_ago(timezone.localdate(), options['keep_months'] - 1)
+
+    def archive_month(self, month, chunk_size):
+        key = month_key(month)
+        logs = AttendanceLog.objects.filter(date__year=month.year, date__month=month.month)
+
+        # Rows changed after this point stay in the table for the next run
+        snapshot = timezone.now()
+        rows = list(logs.order_by('date', 'user_id', 'id').values_list(*ARCHIVE_FIELDS))
+
+        archive_dir = get_archive_dir()
+        entry = write_month(key, rows, archive_dir)
+        manifest = read_manifest(archive_dir)
+        previous = manifest['months'].get(key)
+        manifest['months'][key] = entry
+        write_manifest(manifest, archive_dir)
+        if previous and previous['file'] != entry['file']:
+            try:
+                os.remove(os.path.join(archive_dir, previous['file']))
+            except FileNotFoundError:
+                pass
+
+        ids = [row[0] for row in rows]
+        deleted = 0
+        for start in range(0, len(ids), chunk_size):
+            # Archived logs aren't gone, so sync clients get no deletions
+            with transaction.atomic(), without_log_tombstones():
+                count, _ = logs.filter(
+                    id__in=ids[start:start + chunk_size],
+                    updated_at__lte=snapshot
+                ).delete()
+            deleted += count
+        return len(rows), deleted, entry
+
+    def handle(self, *args, **options):
+        cutoff = self.get_cutoff(options)
+        chunk_size = options['chunk_size']
+
+        months = list(
+            AttendanceLog.objects.filter(date__lt=cutoff)
+            .annotate(month=TruncMonth('date'))
+            .values_list('month')
+            .annotate(count=Count('id'))
+            .order_by('month')
+        )
+        if not months:
+            self.stdout.write(self.style.SUCCESS(f'✓ Nothing to archive before {cutoff}'))
+            return
+
+        self.stdout.write(self.style.WARNING(
+            f'{"Would archive" if options["dry_run"] else "Archiving"} '
+            f'{len(months)} month(s) before {cutoff} into {get_archive_dir()}...'
+        ))
+
+        started = time_module.perf_counter()
+        total_rows = total_deleted = 0
+        for month, count in months:
+            if options['dry_run']:
+                self.stdout.write(f'  {month_key(month)}: {count} rows')
+                continue
+            rows, deleted, entry = self.archive_month(month, chunk_size)
+            total_rows += rows
+            total_deleted += deleted
+            self.stdout.write(
+                f'  {month_key(month)}: {rows} rows archived, {deleted} deleted '
+                f'({entry["rows"]} in {entry["file"]})'
+            )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run: nothing was written'))
+            return
+
+        elapsed = time_module.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Rows archived: {total_rows}'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Rows deleted: {total_deleted}'))
+        if total_deleted < total_rows:
+            self.stdout.write(self.style.WARNING(
+                f'{total_rows - total_deleted} rows changed while archiving and were kept; run again to move them'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'\n=== Done in {elapsed:.2f}s ==='))
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, time as dtime, timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.exports import (
+    gzip_chunks, iter_csv_chunks, iter_export_values, iter_ndjson_chunks, shape_export_row, write_xlsx,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Process peak resident set size in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def write_chunks(chunks, fileobj):
+    for chunk in chunks:
+        fileobj.write(chunk)
+
+
+# format: writes raw export tuples to a file
+WRITERS = {
+    'xlsx': lambda values, f: write_xlsx((shape_export_row(v) for v in values), f),
+    'csv': lambda values, f: write_chunks(iter_csv_chunks(values), f),
+    'csv.gz': lambda values, f: write_chunks(gzip_chunks(iter_csv_chunks(values)), f),
+    'ndjson': lambda values, f: write_chunks(iter_ndjson_chunks(values), f),
+    'ndjson.gz': lambda values, f: write_chunks(gzip_chunks(iter_ndjson_chunks(values)), f),
+}
+
+
+class CountingIterator:
+    """Counts the rows an export consumed (the db source may have fewer)"""
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        value = next(self.iterator)
+        self.count += 1
+        return value
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the streaming exports (peak memory and throughput), one process per run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            default='10000,100000,1000000',
+            help='Comma-separated row counts to benchmark (default: 10000,100000,1000000)'
+        )
+        parser.add_argument(
+            '--formats',
+            default='xlsx',
+            help=f'Comma-separated formats to benchmark (default: xlsx; available: {", ".join(WRITERS)})'
+        )
+        parser.add_argument(
+            '--source',
+            choices=['synthetic', 'db'],
+            default='synthetic',
+            help='Generated rows, or the first N rows of the real export query '
+                 '(run generate_load_data first) (default: synthetic)'
+        )
+        parser.add_argument(
+            '--tracemalloc',
+            action='store_true',
+            help='Measure peak Python allocations with tracemalloc (much slower)'
+        )
+        # Internal: run a single format/size in this process and print JSON
+        parser.add_argument('--run-one', help=argparse.SUPPRESS)
+
+    def synthetic_rows(self, count):
+        """Yield raw export tuples shaped like the values_list query"""
+        start = date(2020, 1, 1)
+        for i in range(count):
+            check_in = dtime(8, i % 60)
+            check_out = dtime(17, i % 60) if i % 10 else None
+            worked = (
+                datetime.combine(start, check_out) - datetime.combine(start, check_in)
+                if check_out else None
+            )
+            yield (
+                f'First{i % 5000}',
+                f'Last{i % 5000}',
+                f'user{i % 5000}',
+                start + timedelta(days=i // 5000),
+                check_in,
+                check_out,
+                worked,
+            )
+
+    def source_rows(self, source, count):
+        if source == 'db':
+            return islice(iter_export_values(), count)
+        return self.synthetic_rows(count)
+
+    def run_one(self, fmt, size, source, use_tracemalloc):
+        """Measure one export in this process; returns the result dict"""
+        with tempfile.TemporaryFile() as fileobj:
+            if use_tracemalloc:
+                tracemalloc.start()
+            else:
+                # Growth over the peak reached while starting up
+                baseline = peak_rss_mb()
+            rows = CountingIterator(self.source_rows(source, size))
+            started = time.perf_counter()
+            WRITERS[fmt](rows, fileobj)
+            elapsed = time.perf_counter() - started
+            if use_tracemalloc:
+                peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                tracemalloc.stop()
+            else:
+                peak = peak_rss_mb() - baseline
+            file_size = fileobj.tell()
+        return {'rows': rows.count, 'seconds': elapsed, 'peak_mb': peak, 'file_mb': file_size / 1024 / 1024}
+
+    def run_subprocess(self, fmt, size, options):
+        """
+        Run one format/size in a fresh interpreter, so the RSS high-water
+        mark only covers that run.
+        """
+        command = [
+            sys.executable, '-m', 'django', 'benchmark_export',
+            '--run-one', f'{fmt}:{size}', '--source', options['source'],
+        ]
+        if options['tracemalloc']:
+            command.append('--tracemalloc')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            raise CommandError(f'{fmt} with {size} rows failed:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        use_tracemalloc = options['tracemalloc'] or resource is None
+        if options['run_one']:
+            fmt, size = options['run_one'].split(':')
+            result = self.run_one(fmt, int(size), options['source'], use_tracemalloc)
+            self.stdout.write(json.dumps(result))
+            return
+
+        sizes = [int(size) for size in options['rows'].split(',') if size.strip()]
+        formats = [fmt.strip() for fmt in options['formats'].split(',') if fmt.strip()]
+        unknown = set(formats) - set(WRITERS)
+        if unknown:
+            raise CommandError(f'Unknown format(s): {", ".join(sorted(unknown))}')
+
+        self.stdout.write(self.style.WARNING(f"Benchmarking streaming exports ({options['source']} rows)..."))
+        memory_label = 'Alloc MB' if use_tracemalloc else 'RSS +MB'
+        self.stdout.write(
+            f"{'Format':>9}  {'Rows':>10}  {'Seconds':>9}  {'Rows/s':>10}  {memory_label:>8}  {'File MB':>8}"
+        )
+
+        for fmt, size in ((fmt, size) for fmt in formats for size in sizes):
+            result = self.run_subprocess(fmt, size, options)
+            rate = result['rows'] / result['seconds'] if result['seconds'] else 0
+            self.stdout.write(
+                f"{fmt:>9}  {result['rows']:>10}  {result['seconds']:>9.2f}  {rate:>10.0f}  "
+                f"{result['peak_mb']:>8.2f}  {result['file_mb']:>8.2f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('\n=== Benchmark complete ==='))
+
@@ -0,0 +1,243 @@
+import io
+import json
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from attendance.eligibility import get_cache
+from attendance.models import AttendanceGroup, AttendanceLog, UserGroup
+from attendance.rollups import _ensured_dates
+from users.models import User
+
+
+# Dataset sizes passed to generate_load_data
+DATASETS = {
+    'small': {'users': 50, 'groups': 5, 'days': 30},
+    'medium': {'users': 500, 'groups': 20, 'days': 90},
+    'large': {'users': 2000, 'groups': 40, 'days': 180},
+}
+
+# (name, method, url name, user, query string)
+VIEWS = (
+    ('employee_dashboard', 'get', 'employee_dashboard', 'employee', ''),
+    ('clock_in', 'post', 'clock_in', 'employee', ''),
+    ('admin_dashboard', 'get', 'admin_dashboard', 'admin', ''),
+    ('manage_users', 'get', 'manage_users', 'admin', ''),
+    ('reports', 'get', 'reports', 'admin', ''),
+    ('export_excel', 'get', 'export_excel', 'admin', ''),
+    ('absence_matrix', 'get', 'absence_matrix', 'admin', ''),
+    ('export_absence_matrix', 'get', 'export_absence_matrix', 'admin', ''),
+)
+
+BENCH_PASSWORD = 'benchmark123'
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the main views (time, queries, memory) and compares them with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='small,medium,large',
+            help=f'Comma-separated datasets to run (default: small,medium,large; available: {", ".join(DATASETS)})'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per view (default: 5)')
+        parser.add_argument('--seed', type=int, default=42, help='Data generator seed (default: 42)')
+        parser.add_argument(
+            '--output',
+            default='benchmark_results.json',
+            help='Where to write the results (default: benchmark_results.json)'
+        )
+        parser.add_argument('--baseline', help='Results file to compare against')
+        parser.add_argument(
+            '--time-ratio',
+            type=float,
+            default=1.5,
+            help='Fail when median time exceeds baseline by this factor (default: 1.5)'
+        )
+        parser.add_argument(
+            '--time-floor-ms',
+            type=float,
+            default=5,
+            help='Ignore time differences below this many milliseconds (default: 5)'
+        )
+        parser.add_argument(
+            '--query-slack',
+            type=int,
+            default=0,
+            help='Extra queries allowed over the baseline (default: 0)'
+        )
+        parser.add_argument(
+            '--memory-ratio',
+            type=float,
+            default=1.5,
+            help='Fail when peak memory exceeds baseline by this factor (default: 1.5)'
+        )
+
+    def load_dataset(self, size, seed):
+        """Fill the (empty) test database with a generated dataset"""
+        call_command('flush', interactive=False, verbosity=0)
+        # Ids are reused after a flush, so state keyed by id or date that
+        # outlives the database would belong to the previous dataset
+        get_cache().clear()
+        _ensured_dates.clear()
+        call_command('generate_load_data', seed=seed, prefix='bench', stdout=io.StringIO(), **DATASETS[size])
+
+        admin = User.objects.create_user(
+            username='bench_admin', password=BENCH_PASSWORD, role='ADMIN', is_staff=True
+        )
+        employee = User.objects.create_user(
+            username='bench_employee', password=BENCH_PASSWORD, first_name='Bench', last_name='Employee'
+        )
+        group = AttendanceGroup.objects.create(name='Bench All Days', allowed_days=list(range(7)))
+        UserGroup.objects.create(user=employee, group=group)
+
+        clients = {}
+        for role, user in (('admin', admin), ('employee', employee)):
+            clients[role] = Client()
+            clients[role].force_login(user)
+        return clients, employee
+
+    def request(self, client, method, url):
+        response = getattr(client, method)(url)
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {url} returned {response.status_code}')
+        if response.streaming:
+            # Exports are generated while streamed
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, clients, employee, view, repeat):
+        name, method, url_name, role, query = view
+        client = clients[role]
+        url = reverse(url_name) + query
+
+        def reset():
+            # clock_in should record a punch on every run
+            if name == 'clock_in':
+                AttendanceLog.objects.filter(user=employee, date=timezone.localdate()).delete()
+
+        # Warm up caches (eligibility, today's rollup row) before timing
+        reset()
+        self.request(client, method, url)
+
+        timings = []
+        queries = None
+        for _ in range(repeat):
+            reset()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                self.request(client, method, url)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = len(captured)
+
+        # Memory is measured in its own run, tracemalloc slows everything down
+        reset()
+        tracemalloc.start()
+        self.request(client, method, url)
+        peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+        return {
+            'time_ms': round(statistics.median(timings), 2),
+            'time_ms_min': round(min(timings), 2),
+            'queries': queries,
+            'peak_kb': round(peak_kb, 1),
+        }
+
+    def compare(self, results, baseline, options):
+        """Return a list of regression messages"""
+        regressions = []
+        for size, views in results.items():
+            for name, current in views.items():
+                previous = baseline.get('results', {}).get(size, {}).get(name)
+                if previous is None:
+                    continue
+                label = f'{size}/{name}'
+                if current['queries'] > previous['queries'] + options['query_slack']:
+                    regressions.append(
+                        f"{label}: {current['queries']} queries (baseline {previous['queries']})"
+                    )
+                if (current['time_ms'] > previous['time_ms'] * options['time_ratio']
+                        and current['time_ms'] - previous['time_ms'] > options['time_floor_ms']):
+                    regressions.append(
+                        f"{label}: {current['time_ms']:.1f} ms (baseline {previous['time_ms']:.1f} ms)"
+                    )
+                if current['peak_kb'] > previous['peak_kb'] * options['memory_ratio']:
+                    regressions.append(
+                        f"{label}: {current['peak_kb']:.0f} KB peak (baseline {previous['peak_kb']:.0f} KB)"
+                    )
+        return regressions
+
+    def handle(self, *args, **options):
+        sizes = [size.strip() for size in options['sizes'].split(',') if size.strip()]
+        unknown = set(sizes) - set(DATASETS)
+        if unknown:
+            raise CommandError(f'Unknown dataset(s): {", ".join(sorted(unknown))}')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Could not read baseline {options["baseline"]}: {exc}')
+
+        self.stdout.write(self.style.WARNING('Creating a throwaway test database...'))
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        results = {}
+        try:
+            for size in sizes:
+                self.stdout.write(self.style.WARNING(f'\nDataset: {size} {DATASETS[size]}'))
+                clients, employee = self.load_dataset(size, options['seed'])
+                self.stdout.write(f"{'View':<22}  {'Median ms':>9}  {'Min ms':>8}  {'Queries':>7}  {'Peak KB':>9}")
+                results[size] = {}
+                for view in VIEWS:
+                    result = self.measure(clients, employee, view, options['repeat'])
+                    results[size][view[0]] = result
+                    self.stdout.write(
+                        f"{view[0]:<22}  {result['time_ms']:>9.1f}  {result['time_ms_min']:>8.1f}  "
+                        f"{result['queries']:>7}  {result['peak_kb']:>9.0f}"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': timezone.now().isoformat(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'datasets': {size: DATASETS[size] for size in sizes},
+                'results': results,
+            }, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Results written to {options["output"]}'))
+
+        # A query count that grows with the data usually means an N+1
+        for name, *_ in VIEWS:
+            counts = [results[size][name]['queries'] for size in sizes]
+            if len(set(counts)) > 1:
+                self.stdout.write(self.style.WARNING(
+                    f'! {name}: query count changes with dataset size ({" -> ".join(map(str, counts))})'
+                ))
+
+        if baseline is not None:
+            regressions = self.compare(results, baseline, options)
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(f'✗ {regression}'))
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'✓ No regressions against {options["baseline"]}'))
+
+        self.stdout.write(self.style.SUCCESS('\n=== Benchmark complete ==='))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from attendance.export_cache import clear, get_cache_dir
+
+
+class Command(BaseCommand):
+    help = 'Deletes every cached export file (run after changing how exports are generated)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING(f'Clearing export cache in {get_cache_dir()}...'))
+        deleted = clear()
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {deleted} cached file(s)'))
+        self.stdout.write(self.style.SUCCESS('\n=== Export cache cleared ==='))
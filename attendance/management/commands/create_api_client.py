@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from attendance.models import ApiClient
+
+
+class Command(BaseCommand):
+    help = 'Registers a change feed client (or rotates its token) and prints the token'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Unique client name, e.g. "Payroll"')
+        parser.add_argument(
+            '--rotate',
+            action='store_true',
+            help='Issue a new token for an existing client'
+        )
+
+    def handle(self, *args, **options):
+        name = options['name']
+        client = ApiClient.objects.filter(name=name).first()
+        
+        if client is not None and not options['rotate']:
+            raise CommandError(f'Client "{name}" already exists, use --rotate to issue a new token')
+        if client is None:
+            client = ApiClient(name=name)
+        
+        token = client.set_new_token()
+        client.is_active = True
+        client.save()
+        
+        self.stdout.write(self.style.SUCCESS(f'✓ Client "{client.name}" ready'))
+        self.stdout.write(self.style.WARNING('Token (shown only once):'))
+        self.stdout.write(token)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from attendance.models import KioskDevice
+
+
+class Command(BaseCommand):
+    help = 'Registers a kiosk terminal (or rotates its token) and prints the device token'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Unique device name, e.g. "Lobby Terminal"')
+        parser.add_argument(
+            '--rotate',
+            action='store_true',
+            help='Issue a new token for an existing device'
+        )
+
+    def handle(self, *args, **options):
+        name = options['name']
+        device = KioskDevice.objects.filter(name=name).first()
+        
+        if device is not None and not options['rotate']:
+            raise CommandError(f'Device "{name}" already exists, use --rotate to issue a new token')
+        if device is None:
+            device = KioskDevice(name=name)
+        
+        token = device.set_new_token()
+        device.is_active = True
+        device.save()
+        
+        self.stdout.write(self.style.SUCCESS(f'✓ Device "{device.name}" ready'))
+        self.stdout.write(self.style.WARNING('Token (shown only once):'))
+        self.stdout.write(token)
@@ -0,0 +1,96 @@
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from attendance.models import WebhookEndpoint
+from attendance.outbox import claim_batch, deliver_batch, fan_out, purge_delivered
+
+
+# Seconds between purges of delivered events
+PURGE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Delivers outbox events to the configured webhook endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds between checks for new events when idle (default: 1)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Requests in flight across all endpoints (default: 8)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once nothing is due instead of waiting for new events'
+        )
+
+    def send(self, endpoint, batch):
+        try:
+            delivered = deliver_batch(endpoint, batch)
+            if delivered:
+                self.stdout.write(self.style.SUCCESS(f'✓ {endpoint.name}: {len(batch)} event(s) delivered'))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f'! {endpoint.name}: {len(batch)} event(s) failed ({batch[0].last_error}), will retry'
+                ))
+        except Exception as exc:
+            # The lease runs out and the batch is picked up again
+            self.stdout.write(self.style.ERROR(f'✗ {endpoint.name}: {exc}'))
+        finally:
+            # Each pool thread has its own connection
+            connection.close()
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Webhook dispatcher started...'))
+
+        in_flight = {}  # future -> endpoint id
+        purged_at = 0.0
+        pool = ThreadPoolExecutor(max_workers=max(1, options['workers']))
+        try:
+            while True:
+                close_old_connections()
+                fanned_out = fan_out()
+                if time.monotonic() - purged_at > PURGE_INTERVAL:
+                    purge_delivered()
+                    purged_at = time.monotonic()
+
+                # Each endpoint gets at most max_concurrency requests at once
+                busy = Counter(in_flight.values())
+                claimed = 0
+                for endpoint in WebhookEndpoint.objects.filter(is_active=True):
+                    while busy[endpoint.id] < max(1, endpoint.max_concurrency):
+                        batch = claim_batch(endpoint)
+                        if not batch:
+                            break
+                        in_flight[pool.submit(self.send, endpoint, batch)] = endpoint.id
+                        busy[endpoint.id] += 1
+                        claimed += 1
+
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del in_flight[future]
+                        future.result()
+                elif fanned_out or claimed:
+                    continue
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nStopping, waiting for requests in flight...'))
+        finally:
+            pool.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS('\n=== Webhook dispatcher stopped ==='))
@@ -0,0 +1,58 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from attendance.ingest import INGEST_CHUNK_SIZE, ingest_punches
+
+
+class Command(BaseCommand):
+    help = 'Ingests buffered terminal punches from a JSON or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='JSON list of punches, or CSV with user/badge, timestamp and direction columns ("-" for JSON on stdin)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=INGEST_CHUNK_SIZE,
+            help=f'Days written per transaction (default: {INGEST_CHUNK_SIZE})'
+        )
+
+    def read_punches(self, path):
+        if path == '-':
+            data = json.load(sys.stdin)
+        elif path.lower().endswith('.csv'):
+            with open(path, newline='', encoding='utf-8') as f:
+                return list(csv.DictReader(f))
+        else:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        
+        if isinstance(data, dict):
+            data = data.get('punches')
+        if not isinstance(data, list):
+            raise CommandError('Expected a list of punches or {"punches": [...]}')
+        return data
+
+    def handle(self, *args, **options):
+        try:
+            punches = self.read_punches(options['path'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Could not read punches: {exc}')
+        
+        self.stdout.write(self.style.WARNING(f'Ingesting {len(punches)} punches...'))
+        started = time.perf_counter()
+        report = ingest_punches(punches, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        
+        self.stdout.write(self.style.SUCCESS(f'✓ Applied: {report.applied}'))
+        self.stdout.write(self.style.WARNING(f'! Skipped: {report.skipped}'))
+        if report.rejected:
+            self.stdout.write(self.style.ERROR(f'✗ Rejected: {report.rejected}'))
+            for rejection in report.rejections:
+                self.stdout.write(f'  #{rejection["index"]}: {rejection["reason"]}')
+        self.stdout.write(self.style.SUCCESS(f'\n=== Done in {elapsed:.2f}s ==='))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from attendance.changes import get_retention, purge_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Deletes change feed tombstones older than ATTENDANCE_CHANGES_RETENTION_DAYS (run daily)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING(
+            f'Purging change feed tombstones older than {get_retention().days} days...'
+        ))
+        deleted = purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {deleted} tombstone(s)'))
+        self.stdout.write(self.style.SUCCESS('\n=== Tombstones purged ==='))
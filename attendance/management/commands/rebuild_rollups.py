@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+from attendance.models import AttendanceLog
+from attendance.rollups import rebuild_days
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily attendance rollups from the attendance logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='First date to rebuild, YYYY-MM-DD (default: the earliest log)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Last date to rebuild, YYYY-MM-DD (default: the latest log)'
+        )
+
+    def parse(self, value, name):
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError(f'Invalid --{name} date: {value!r}')
+        return parsed
+
+    def handle(self, *args, **options):
+        bounds = AttendanceLog.objects.aggregate(first=Min('date'), last=Max('date'))
+        start = self.parse(options['start'], 'start') if options['start'] else bounds['first']
+        end = self.parse(options['end'], 'end') if options['end'] else bounds['last']
+        if start is None or end is None:
+            self.stdout.write(self.style.WARNING('No attendance logs to summarize'))
+            return
+        if end < start:
+            raise CommandError('--end must not be before --start')
+
+        self.stdout.write(self.style.WARNING(f'Rebuilding rollups from {start} to {end}...'))
+
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+        # Archived months are no longer in the table; their rows are kept
+        rebuilt = rebuild_days(days)
+        if len(rebuilt) < len(days):
+            self.stdout.write(self.style.WARNING(f'Skipped {len(days) - len(rebuilt)} days in archived months'))
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt {len(rebuilt)} days'))
@@ -0,0 +1,101 @@
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from attendance.export_jobs import JobLost, claim_next, mark_failed, purge_expired, requeue_stale, run_job
+
+
+# Seconds between purges of expired jobs
+PURGE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background export jobs (polls the database, no broker needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Jobs run at the same time (default: 2)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds between checks for new jobs when idle (default: 2)'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=300,
+            help='Requeue running jobs without a heartbeat for this many seconds (default: 300)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs'
+        )
+
+    def execute_job(self, job):
+        try:
+            run_job(job)
+            self.stdout.write(self.style.SUCCESS(f'✓ Export #{job.pk} done ({job.rows_written} rows)'))
+        except JobLost as exc:
+            self.stdout.write(self.style.WARNING(str(exc)))
+        except Exception as exc:
+            mark_failed(job, exc)
+            self.stdout.write(self.style.ERROR(f'✗ Export #{job.pk} failed: {exc}'))
+        finally:
+            # Each pool thread has its own connection
+            connection.close()
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(self.style.WARNING(
+            f'Export worker {worker} started (concurrency {concurrency})...'
+        ))
+
+        active = set()
+        purged_at = 0.0
+        processed = 0
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            while True:
+                close_old_connections()
+                requeued, failed = requeue_stale(options['stale_after'])
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} stalled job(s)'))
+                if failed:
+                    self.stdout.write(self.style.ERROR(f'✗ Failed {failed} job(s) that stalled too often'))
+                if time.monotonic() - purged_at > PURGE_INTERVAL:
+                    purge_expired()
+                    purged_at = time.monotonic()
+
+                # Only claim what can start right away, so other workers
+                # can pick up the rest
+                while len(active) < concurrency:
+                    job = claim_next(worker)
+                    if job is None:
+                        break
+                    self.stdout.write(f'Export #{job.pk}: {job.format} {job.filters}')
+                    active.add(pool.submit(self.execute_job, job))
+                    processed += 1
+
+                if not active:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                active = wait(active, timeout=options['poll_interval'], return_when=FIRST_COMPLETED).not_done
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nStopping, waiting for running jobs to finish...'))
+        finally:
+            pool.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f'\n=== Export worker stopped ({processed} jobs) ==='))
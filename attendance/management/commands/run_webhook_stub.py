@@ -0,0 +1,63 @@
+import hmac
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from attendance.outbox import SIGNATURE_HEADER, sign
+
+
+class Command(BaseCommand):
+    help = 'Runs a local webhook receiver that prints the event batches it gets (for testing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8099, help='Port to listen on (default: 8099)')
+        parser.add_argument('--secret', default='', help='Check request signatures with this secret')
+        parser.add_argument(
+            '--fail-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered with 503, to exercise retries (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        command = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if options['secret']:
+                    expected = sign(options['secret'], body)
+                    if not hmac.compare_digest(expected, self.headers.get(SIGNATURE_HEADER, '')):
+                        command.stdout.write(command.style.ERROR('✗ Bad signature'))
+                        self.send_response(401)
+                        self.end_headers()
+                        return
+                if random.random() < options['fail_rate']:
+                    command.stdout.write(command.style.WARNING('! Answering 503'))
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                events = json.loads(body)['events']
+                for event in events:
+                    command.stdout.write(f"#{event['id']} {event['type']} {json.dumps(event['data'])}")
+                command.stdout.write(command.style.SUCCESS(f'✓ Received {len(events)} event(s)'))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(self.style.WARNING(
+            f'Webhook stub listening on http://127.0.0.1:{options["port"]}/ (Ctrl+C to stop)'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS('\n=== Webhook stub stopped ==='))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from attendance.models import AttendanceGroup, days_to_mask
+
+
+class Command(BaseCommand):
+    help = 'Backfills the weekday bitmask of every group from its allowed_days list'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.WARNING('Syncing allowed days masks...'))
+        
+        groups = list(AttendanceGroup.objects.only('id', 'allowed_days', 'allowed_days_mask'))
+        changed = []
+        for group in groups:
+            mask = days_to_mask(group.allowed_days)
+            if group.allowed_days_mask != mask:
+                group.allowed_days_mask = mask
+                changed.append(group)
+        
+        AttendanceGroup.objects.bulk_update(changed, ['allowed_days_mask'], batch_size=500)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Updated {len(changed)} of {len(groups)} groups'
+        ))
@@ -1,8 +1,53 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, DurationField, ExpressionWrapper, F, Q, Sum, When
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from users.models import User
+import hashlib
 import json
+import secrets
+from datetime import timedelta
+
+
+def weekday_bit(date):
+    """Bit for a date's weekday in an allowed-days mask (Monday = 1)"""
+    return 1 << date.weekday()
+
+
+def days_to_mask(days):
+    """Convert a list of weekday integers (0-6) into a bitmask"""
+    mask = 0
+    for day in days:
+        mask |= 1 << day
+    return mask
+
+
+class AttendanceGroupQuerySet(models.QuerySet):
+    
+    def allowing(self, date):
+        """Groups whose allowed days include the weekday of date"""
+        bit = weekday_bit(date)
+        return self.alias(day_bit=F('allowed_days_mask').bitand(bit)).filter(day_bit=bit)
+    
+    # save() keeps allowed_days_mask in sync; the bulk paths below do the
+    # same so the mask can't silently go stale
+    
+    def update(self, **kwargs):
+        if 'allowed_days' in kwargs and 'allowed_days_mask' not in kwargs:
+            days = kwargs['allowed_days']
+            if not isinstance(days, (list, tuple)):
+                raise TypeError('allowed_days must be a list in update(); expressions would leave the mask stale')
+            kwargs['allowed_days_mask'] = days_to_mask(days)
+        return super().update(**kwargs)
+    
+    def bulk_update(self, objs, fields, batch_size=None):
+        if 'allowed_days' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.allowed_days_mask = days_to_mask(obj.allowed_days)
+            fields = [*fields, 'allowed_days_mask'] if 'allowed_days_mask' not in fields else fields
+        return super().bulk_update(objs, fields, batch_size=batch_size)
 
 
 class AttendanceGroup(models.Model):
@@ -36,9 +81,20 @@ class AttendanceGroup(models.Model):
         help_text='Days of week when employees can clock in (0=Mon, 6=Sun)'
     )
     
+    # Bit n is set when weekday n is allowed, kept in sync with allowed_days
+    # by save(), update() and bulk_update(). Not indexed: a B-tree can't
+    # serve "mask & bit = bit", and the groups table is small enough to scan
+    allowed_days_mask = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Allowed Days Mask'
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AttendanceGroupQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Attendance Group'
         verbose_name_plural = 'Attendance Groups'
@@ -61,6 +117,13 @@ class AttendanceGroup(models.Model):
             if not isinstance(day, int) or day < 0 or day > 6:
                 raise ValidationError(f'Invalid day: {day}. Must be integer between 0-6.')
     
+    def save(self, *args, **kwargs):
+        self.allowed_days_mask = days_to_mask(self.allowed_days)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'allowed_days' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'allowed_days_mask'}
+        super().save(*args, **kwargs)
+    
     def is_day_allowed(self, date):
         """Check if a given date is allowed for this group"""
         return date.weekday() in self.allowed_days
@@ -91,11 +154,130 @@ class UserGroup(models.Model):
         verbose_name_plural = 'User Group Assignments'
         unique_together = ['user', 'group']
         ordering = ['user__username', 'group__name']
+        indexes = [
+            # Assignments are only inserted or deleted, so this orders the change feed
+            models.Index(fields=['assigned_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} → {self.group.name}"
 
 
+class AttendanceLogQuerySet(models.QuerySet):
+    """Database-side hours math and punches for attendance logs"""
+    
+    PERIODS = {
+        'day': TruncDay,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
+    
+    COMPLETE = Q(check_in__isnull=False, check_out__isnull=False)
+    
+    @classmethod
+    def worked_expression(cls):
+        """check_out - check_in as a duration, NULL unless both are set"""
+        return Case(
+            When(cls.COMPLETE, then=ExpressionWrapper(
+                F('check_out') - F('check_in'),
+                output_field=DurationField()
+            )),
+            default=None,
+            output_field=DurationField(),
+        )
+    
+    def with_worked(self):
+        """Annotate each log with its worked duration as `worked`"""
+        return self.annotate(worked=self.worked_expression())
+    
+    def _insert_once(self, **fields):
+        """
+        INSERT a log, returning False instead of raising when the
+        (user, date) row already exists.
+        """
+        connection = transaction.get_connection(self.db)
+        try:
+            if connection.in_atomic_block:
+                # Savepoint so a conflict doesn't break the outer transaction
+                with transaction.atomic(using=self.db):
+                    self.create(**fields)
+            else:
+                self.create(**fields)
+        except IntegrityError:
+            return False
+        return True
+    
+    def clock_in(self, user_id, date, at):
+        """
+        Record a check in without a read-modify-write cycle.
+        
+        The common case is a single INSERT. On a (user, date) conflict a
+        conditional UPDATE fills check_in only if it is still empty.
+        Returns 'clocked_in' or 'already_clocked_in'.
+        """
+        if self._insert_once(user_id=user_id, date=date, check_in=at):
+            return 'clocked_in'
+        
+        updated = self.filter(
+            user_id=user_id,
+            date=date,
+            check_in__isnull=True
+        ).update(check_in=at, updated_at=timezone.now())
+        return 'clocked_in' if updated else 'already_clocked_in'
+    
+    def clock_out(self, user_id, date, at):
+        """
+        Record a check out with one conditional UPDATE.
+        
+        Only a row that is clocked in and not yet out is touched. When
+        nothing matches, the row is read once to explain why.
+        Returns 'clocked_out', 'already_clocked_out', 'not_clocked_in'
+        or 'no_record'.
+        """
+        updated = self.filter(
+            user_id=user_id,
+            date=date,
+            check_in__isnull=False,
+            check_out__isnull=True
+        ).update(check_out=at, updated_at=timezone.now())
+        if updated:
+            return 'clocked_out'
+        
+        state = self.filter(user_id=user_id, date=date).values_list('check_in', 'check_out').first()
+        if state is None:
+            return 'no_record'
+        if state[0] is None:
+            return 'not_clocked_in'
+        return 'already_clocked_out'
+    
+    def summary(self, period='month'):
+        """
+        Per-user, per-period totals computed in a single GROUP BY.
+        
+        Each row holds the bucket start date, the user fields, the total
+        worked duration, the number of days worked and the number of
+        incomplete days.
+        """
+        trunc = self.PERIODS[period]
+        return (
+            self.order_by()
+            .annotate(period=trunc('date'))
+            .values(
+                'period',
+                'user_id',
+                'user__username',
+                'user__first_name',
+                'user__last_name',
+            )
+            .annotate(
+                total_worked=Sum(self.worked_expression()),
+                days_worked=Count('id', filter=Q(check_in__isnull=False)),
+                incomplete_days=Count('id', filter=~self.COMPLETE),
+            )
+            .order_by('period', 'user__username')
+        )
+
+
 class AttendanceLog(models.Model):
     """
     Records clock in/out times for employees.
@@ -132,14 +314,21 @@ class AttendanceLog(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AttendanceLogQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Attendance Log'
         verbose_name_plural = 'Attendance Logs'
         unique_together = ['user', 'date']
         ordering = ['-date', 'user__username']
         indexes = [
-            models.Index(fields=['date', 'user']),
+            # updated_at is a trailing key column (not INCLUDE, which SQLite
+            # lacks) so the watermark aggregates behind conditional GETs
+            # can be answered from the index alone
+            models.Index(fields=['date', 'user', 'updated_at'], name='attendance_log_date_user_idx'),
             models.Index(fields=['-date']),
+            # Change feed keyset
+            models.Index(fields=['updated_at', 'id']),
         ]
     
     def __str__(self):
@@ -179,3 +368,495 @@ class AttendanceLog(models.Model):
     def is_active(self):
         """Check if user is currently clocked in"""
         return self.check_in is not None and self.check_out is None
+
+
+class AttendanceDailySummary(models.Model):
+    """
+    Per-day attendance counters, maintained alongside every punch.
+    
+    One row per date covers all employees (group is NULL) and one row
+    per date and group covers that group's members. Rows are updated in
+    the same transaction as each clock-in/clock-out and can be rebuilt
+    from AttendanceLog with the rebuild_rollups command.
+    """
+    
+    date = models.DateField(
+        verbose_name='Date'
+    )
+    
+    group = models.ForeignKey(
+        AttendanceGroup,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='daily_summaries'
+    )
+    
+    clocked_in_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Clocked In'
+    )
+    
+    completed_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Completed'
+    )
+    
+    total_worked = models.DurationField(
+        default=timedelta,
+        verbose_name='Total Worked'
+    )
+    
+    expected_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Expected Headcount'
+    )
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Attendance Daily Summary'
+        verbose_name_plural = 'Attendance Daily Summaries'
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date'],
+                condition=Q(group__isnull=True),
+                name='unique_daily_summary_total'
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'group'],
+                condition=Q(group__isnull=False),
+                name='unique_daily_summary_group'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.group.name if self.group_id else 'All'}"
+    
+    def get_total_hours(self):
+        return self.total_worked.total_seconds() / 3600
+
+
+class KioskDevice(models.Model):
+    """
+    A shared wall terminal allowed to record punches by badge or PIN.
+    
+    Only a SHA-256 digest of the device token is stored. Tokens are long
+    random strings, so a fast unsalted digest is enough and keeps the
+    per-request check to one indexed lookup.
+    """
+    
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Device Name'
+    )
+    
+    token_digest = models.CharField(
+        max_length=64,
+        unique=True,
+        editable=False
+    )
+    
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name='Active'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Kiosk Device'
+        verbose_name_plural = 'Kiosk Devices'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    @staticmethod
+    def make_token_digest(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    def set_new_token(self):
+        """Generate a fresh token, store its digest and return the token"""
+        token = secrets.token_urlsafe(32)
+        self.token_digest = self.make_token_digest(token)
+        return token
+    
+    @classmethod
+    def authenticate(cls, token):
+        """Return the active device for token, or None"""
+        if not token:
+            return None
+        return cls.objects.filter(
+            token_digest=cls.make_token_digest(token),
+            is_active=True
+        ).only('id', 'name').first()
+
+
+class ExportJob(models.Model):
+    """
+    An attendance export generated in the background by run_export_worker.
+    
+    Jobs are deduplicated on dedup_key (format and filters): while a job
+    is pending or running, identical requests get that job back instead
+    of queueing another one.
+    """
+    
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+    
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_DONE = 'DONE'
+    STATUS_FAILED = 'FAILED'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    IN_FLIGHT = [STATUS_PENDING, STATUS_RUNNING]
+    
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='export_jobs'
+    )
+    
+    format = models.CharField(
+        max_length=10,
+        choices=FORMAT_CHOICES,
+        verbose_name='Format'
+    )
+    
+    compress = models.BooleanField(
+        default=False,
+        verbose_name='Gzip'
+    )
+    
+    # start_date, end_date and user_id, as given to the export helpers
+    filters = models.JSONField(
+        default=dict,
+        verbose_name='Filters'
+    )
+    
+    dedup_key = models.CharField(
+        max_length=64,
+        editable=False
+    )
+    
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Status'
+    )
+    
+    rows_written = models.PositiveIntegerField(default=0)
+    
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    
+    result_path = models.CharField(
+        max_length=255,
+        blank=True,
+        verbose_name='Result File'
+    )
+    
+    error = models.TextField(blank=True)
+    
+    worker = models.CharField(max_length=100, blank=True)
+    
+    # Times a worker has claimed the job; requeues stop at a limit
+    attempts = models.PositiveSmallIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched while running, so jobs of a dead worker can be requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Export Job'
+        verbose_name_plural = 'Export Jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'],
+                condition=Q(status__in=['PENDING', 'RUNNING']),
+                name='unique_export_job_in_flight'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Export #{self.pk} ({self.format}, {self.get_status_display()})"
+    
+    @staticmethod
+    def make_dedup_key(fmt, compress, filters):
+        payload = json.dumps([fmt, bool(compress), filters], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+    
+    def get_progress(self):
+        """Percent done; capped below 100 until the job has finished"""
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.rows_written * 100 / self.total_rows))
+
+
+class DeletedRecord(models.Model):
+    """
+    Tombstone of a deleted AttendanceLog or UserGroup, served by the
+    change feed so sync clients can remove their copy.
+    
+    Logs moved to the archive are not deleted as far as the feed is
+    concerned and leave no tombstone.
+    """
+    
+    KIND_ATTENDANCE_LOG = 'attendance_log'
+    KIND_USER_GROUP = 'user_group'
+    
+    KIND_CHOICES = [
+        (KIND_ATTENDANCE_LOG, 'Attendance Log'),
+        (KIND_USER_GROUP, 'User Group Assignment'),
+    ]
+    
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES
+    )
+    
+    object_id = models.BigIntegerField()
+    
+    # Natural key of the deleted row (user_id and date, or user_id and group_id)
+    data = models.JSONField(default=dict)
+    
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Deleted Record'
+        verbose_name_plural = 'Deleted Records'
+        ordering = ['deleted_at', 'id']
+        indexes = [
+            models.Index(fields=['deleted_at', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class ApiClient(models.Model):
+    """
+    An external system (payroll, data warehouse) allowed to read the
+    change feed. Tokens are stored as digests, as for KioskDevice.
+    """
+    
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Client Name'
+    )
+    
+    token_digest = models.CharField(
+        max_length=64,
+        unique=True,
+        editable=False
+    )
+    
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name='Active'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'API Client'
+        verbose_name_plural = 'API Clients'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    def set_new_token(self):
+        """Generate a fresh token, store its digest and return the token"""
+        token = secrets.token_urlsafe(32)
+        self.token_digest = KioskDevice.make_token_digest(token)
+        return token
+    
+    @classmethod
+    def authenticate(cls, token):
+        """Return the active client for token, or None"""
+        if not token:
+            return None
+        return cls.objects.filter(
+            token_digest=KioskDevice.make_token_digest(token),
+            is_active=True
+        ).only('id', 'name').first()
+
+
+class OutboxEvent(models.Model):
+    """
+    A domain event written in the same transaction as the change it
+    describes. The dispatch_webhooks command fans each event out to the
+    matching webhook endpoints; the request that caused it never waits
+    on delivery.
+    """
+    
+    EVENT_CHOICES = [
+        ('clock_in', 'Clock In'),
+        ('clock_out', 'Clock Out'),
+        ('group_assigned', 'Group Assigned'),
+        ('group_removed', 'Group Removed'),
+    ]
+    
+    event_type = models.CharField(
+        max_length=30,
+        choices=EVENT_CHOICES
+    )
+    
+    payload = models.JSONField(default=dict)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Set once deliveries have been created for every matching endpoint
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Outbox Event'
+        verbose_name_plural = 'Outbox Events'
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=Q(dispatched_at__isnull=True),
+                name='outbox_undispatched_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} #{self.pk}"
+
+
+class WebhookEndpoint(models.Model):
+    """An HTTP endpoint receiving batches of outbox events"""
+    
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Name'
+    )
+    
+    url = models.URLField(
+        max_length=500,
+        verbose_name='URL'
+    )
+    
+    # Used to sign each request body (X-SGA-Signature header); optional
+    secret = models.CharField(
+        max_length=128,
+        blank=True,
+        verbose_name='Signing Secret'
+    )
+    
+    event_types = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Event Types',
+        help_text='Event types to send, e.g. ["clock_in", "clock_out"]; empty sends all'
+    )
+    
+    max_concurrency = models.PositiveSmallIntegerField(
+        default=2,
+        verbose_name='Max Concurrent Requests'
+    )
+    
+    batch_size = models.PositiveSmallIntegerField(
+        default=100,
+        verbose_name='Events per Request'
+    )
+    
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name='Active'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Webhook Endpoint'
+        verbose_name_plural = 'Webhook Endpoints'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    def wants(self, event_type):
+        return not self.event_types or event_type in self.event_types
+
+
+class WebhookDelivery(models.Model):
+    """Delivery state of one outbox event to one endpoint"""
+    
+    STATUS_PENDING = 'PENDING'
+    STATUS_DELIVERED = 'DELIVERED'
+    STATUS_FAILED = 'FAILED'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DELIVERED, 'Delivered'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    event = models.ForeignKey(
+        OutboxEvent,
+        on_delete=models.CASCADE,
+        related_name='deliveries'
+    )
+    
+    endpoint = models.ForeignKey(
+        WebhookEndpoint,
+        on_delete=models.CASCADE,
+        related_name='deliveries'
+    )
+    
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    
+    attempts = models.PositiveSmallIntegerField(default=0)
+    
+    # Also pushed forward while a dispatcher holds the delivery
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    
+    last_error = models.TextField(blank=True)
+    
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Webhook Delivery'
+        verbose_name_plural = 'Webhook Deliveries'
+        unique_together = ['event', 'endpoint']
+        indexes = [
+            models.Index(fields=['endpoint', 'status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event} → {self.endpoint} ({self.get_status_display()})"
@@ -0,0 +1,211 @@
+"""
+Transactional outbox and webhook delivery.
+
+Punches and group assignment changes add an OutboxEvent row inside the
+transaction that makes the change, so an event exists exactly when the
+change was committed and the request only pays for one INSERT. The
+dispatch_webhooks command does the rest out of band:
+
+1. fan_out() creates a WebhookDelivery per event and matching endpoint
+2. claim_batch() leases up to batch_size due deliveries of an endpoint
+   by pushing their next_attempt_at forward, so several dispatchers
+   can run without sending the same batch twice
+3. deliver_batch() POSTs the batch as {"events": [...]} and marks the
+   deliveries delivered, or schedules a retry with exponential backoff
+
+Delivery is at least once: receivers should use the event ids to ignore
+repeats.
+
+Settings:
+    ATTENDANCE_WEBHOOK_MAX_ATTEMPTS    attempts before a delivery is marked
+                                       failed (default: 10)
+    ATTENDANCE_WEBHOOK_TIMEOUT         request timeout in seconds (default: 10)
+    ATTENDANCE_OUTBOX_RETENTION_DAYS   days delivered events are kept
+                                       (default: 7)
+"""
+import hashlib
+import hmac
+import json
+import random
+import urllib.error
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEvent, WebhookDelivery, WebhookEndpoint
+
+
+# Retry delays: BACKOFF_BASE * 2^(attempt - 1) seconds, capped
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60 * 60
+
+# Events fanned out per pass
+FAN_OUT_BATCH = 1000
+
+# How long a claimed batch is reserved before it may be sent again
+LEASE_SECONDS = 120
+
+SIGNATURE_HEADER = 'X-SGA-Signature'
+
+
+# Recording (called inside the caller's transaction)
+
+def punch_event(event_type, user_id, date, at):
+    return OutboxEvent(event_type=event_type, payload={
+        'user_id': user_id,
+        'date': date.isoformat(),
+        'time': at.isoformat(),
+    })
+
+
+def membership_event(event_type, user_id, group_id):
+    return OutboxEvent(event_type=event_type, payload={
+        'user_id': user_id,
+        'group_id': group_id,
+    })
+
+
+def record_events(*events):
+    """Save events with the current transaction"""
+    if len(events) == 1:
+        events[0].save()
+    elif events:
+        OutboxEvent.objects.bulk_create(events, batch_size=1000)
+
+
+# Dispatch
+
+def fan_out(batch_size=FAN_OUT_BATCH):
+    """Create deliveries for undispatched events; returns events handled"""
+    endpoints = list(WebhookEndpoint.objects.filter(is_active=True))
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.filter(dispatched_at__isnull=True)
+            .order_by('id')
+            .only('id', 'event_type')[:batch_size]
+        )
+        if not events:
+            return 0
+        WebhookDelivery.objects.bulk_create(
+            [
+                WebhookDelivery(event_id=event.id, endpoint_id=endpoint.id)
+                for event in events
+                for endpoint in endpoints
+                if endpoint.wants(event.event_type)
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+            dispatched_at=timezone.now()
+        )
+    return len(events)
+
+
+def claim_batch(endpoint):
+    """Lease the endpoint's next due deliveries, oldest first"""
+    now = timezone.now()
+    ids = list(
+        WebhookDelivery.objects.filter(
+            endpoint=endpoint,
+            status=WebhookDelivery.STATUS_PENDING,
+            next_attempt_at__lte=now,
+        )
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:endpoint.batch_size]
+    )
+    if not ids:
+        return []
+
+    # A lease time unique to this claim identifies the rows it won
+    lease_until = now + timedelta(seconds=LEASE_SECONDS, microseconds=random.randrange(1000000))
+    WebhookDelivery.objects.filter(
+        id__in=ids,
+        status=WebhookDelivery.STATUS_PENDING,
+        next_attempt_at__lte=now,
+    ).update(next_attempt_at=lease_until)
+    return list(
+        WebhookDelivery.objects.filter(id__in=ids, next_attempt_at=lease_until)
+        .select_related('event')
+        .order_by('id')
+    )
+
+
+def backoff_delay(attempts):
+    """Seconds before the next attempt, with jitter"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def encode_batch(deliveries):
+    return json.dumps({
+        'events': [
+            {
+                'id': delivery.event_id,
+                'type': delivery.event.event_type,
+                'created_at': delivery.event.created_at.isoformat(),
+                'data': delivery.event.payload,
+            }
+            for delivery in deliveries
+        ]
+    }, separators=(',', ':')).encode('utf-8')
+
+
+def post(endpoint, body):
+    """POST body to the endpoint; returns None on a 2xx, else the error"""
+    headers = {'Content-Type': 'application/json', 'User-Agent': 'SGA-Lite-Webhooks'}
+    if endpoint.secret:
+        headers[SIGNATURE_HEADER] = sign(endpoint.secret, body)
+    request = urllib.request.Request(endpoint.url, data=body, headers=headers, method='POST')
+    timeout = getattr(settings, 'ATTENDANCE_WEBHOOK_TIMEOUT', 10)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    except urllib.error.HTTPError as exc:
+        return f'HTTP {exc.code}'
+    except (urllib.error.URLError, OSError) as exc:
+        return str(getattr(exc, 'reason', exc))
+    return None
+
+
+def deliver_batch(endpoint, deliveries):
+    """Send one batch and record the outcome; returns True if delivered"""
+    error = post(endpoint, encode_batch(deliveries))
+    now = timezone.now()
+
+    if error is None:
+        WebhookDelivery.objects.filter(id__in=[d.id for d in deliveries]).update(
+            status=WebhookDelivery.STATUS_DELIVERED,
+            attempts=F('attempts') + 1,
+            delivered_at=now,
+            last_error='',
+        )
+        return True
+
+    max_attempts = getattr(settings, 'ATTENDANCE_WEBHOOK_MAX_ATTEMPTS', 10)
+    for delivery in deliveries:
+        delivery.attempts += 1
+        delivery.last_error = error[:1000]
+        if delivery.attempts >= max_attempts:
+            delivery.status = WebhookDelivery.STATUS_FAILED
+        else:
+            delivery.next_attempt_at = now + timedelta(seconds=backoff_delay(delivery.attempts))
+    WebhookDelivery.objects.bulk_update(deliveries, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return False
+
+
+def purge_delivered():
+    """Delete dispatched events past the retention period whose deliveries are all done"""
+    days = getattr(settings, 'ATTENDANCE_OUTBOX_RETENTION_DAYS', 7)
+    expired = OutboxEvent.objects.filter(
+        dispatched_at__lt=timezone.now() - timedelta(days=days)
+    ).exclude(deliveries__status=WebhookDelivery.STATUS_PENDING)
+    return expired.delete()[0]
@@ -0,0 +1,330 @@
+"""
+On-demand CPU profiling of individual requests.
+
+With ``attendance.profiling.ProfilingMiddleware`` in MIDDLEWARE (after
+AuthenticationMiddleware), an admin can arm a trigger from the
+Profiling page: a view, a user, or both, for the next N matching
+requests. Matching requests are profiled either with a stack sampler,
+which produces collapsed stacks ("frame;frame;frame count" lines, the
+input of flamegraph.pl and speedscope), or with cProfile, which produces
+a .prof file and a text report. Artifacts are written to
+ATTENDANCE_PROFILE_DIR and downloaded from the same page.
+
+The trigger lives in the cache so every worker sees it. Each process
+only re-reads it every few seconds, so while nothing is armed the
+middleware costs a clock comparison per request.
+
+Settings:
+    ATTENDANCE_PROFILE_DIR       where artifacts are written
+                                 (default: BASE_DIR/profiles)
+    ATTENDANCE_PROFILE_KEEP      artifacts kept, oldest are deleted (default: 50)
+    ATTENDANCE_PROFILE_INTERVAL  sampler interval in seconds (default: 0.005)
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+from .eligibility import get_cache
+
+
+MODES = (
+    ('sample', 'Stack sampler (collapsed stacks)'),
+    ('cprofile', 'cProfile (.prof and text report)'),
+)
+
+TRIGGER_KEY = 'attendance:profiling:trigger'
+
+# A trigger disarms itself after this many seconds even if unused
+TRIGGER_TIMEOUT = 60 * 60
+
+# Seconds between reads of the trigger from the cache, per process
+REFRESH_INTERVAL = 2
+
+ARTIFACT_NAME = re.compile(r'^[\w.-]+\.(collapsed|prof|txt)$')
+
+_local = {'checked_at': 0.0, 'trigger': None}
+
+# Only one cProfile profiler can be enabled per process at a time (on
+# Python 3.12+ a second enable() raises ValueError), so cProfile requests
+# that overlap one being profiled are left alone
+_cprofile_lock = threading.Lock()
+
+
+def get_profile_dir():
+    default = os.path.join(getattr(settings, 'BASE_DIR', os.getcwd()), 'profiles')
+    return str(getattr(settings, 'ATTENDANCE_PROFILE_DIR', default))
+
+
+def is_enabled():
+    return 'attendance.profiling.ProfilingMiddleware' in settings.MIDDLEWARE
+
+
+def remaining_key(trigger_id):
+    return f'attendance:profiling:remaining:{trigger_id}'
+
+
+# Trigger
+
+def arm(view=None, user_id=None, count=1, mode='sample'):
+    """Profile the next `count` requests matching view and user"""
+    trigger = {
+        'id': timezone.now().strftime('%Y%m%d%H%M%S%f'),
+        'view': view or None,
+        'user_id': user_id or None,
+        'count': count,
+        'mode': mode,
+        'armed_at': timezone.now().isoformat(),
+    }
+    cache = get_cache()
+    cache.set(remaining_key(trigger['id']), count, TRIGGER_TIMEOUT)
+    cache.set(TRIGGER_KEY, trigger, TRIGGER_TIMEOUT)
+    _local['checked_at'] = 0.0
+    return trigger
+
+
+def disarm():
+    get_cache().delete(TRIGGER_KEY)
+    _local['checked_at'] = 0.0
+    _local['trigger'] = None
+
+
+def get_trigger():
+    """The armed trigger and its remaining count, or (None, 0)"""
+    cache = get_cache()
+    trigger = cache.get(TRIGGER_KEY)
+    if trigger is None:
+        return None, 0
+    return trigger, cache.get(remaining_key(trigger['id']), 0)
+
+
+def current_trigger():
+    """This process's view of the trigger, refreshed every few seconds"""
+    now = time.monotonic()
+    if now - _local['checked_at'] > REFRESH_INTERVAL:
+        _local['checked_at'] = now
+        _local['trigger'] = get_cache().get(TRIGGER_KEY)
+    return _local['trigger']
+
+
+def claim(trigger):
+    """Take one of the trigger's remaining requests; False once used up"""
+    cache = get_cache()
+    try:
+        remaining = cache.decr(remaining_key(trigger['id']))
+    except ValueError:
+        remaining = -1
+    if remaining <= 0:
+        # This was the last one (or none were left)
+        if cache.get(TRIGGER_KEY, {}).get('id') == trigger['id']:
+            cache.delete(TRIGGER_KEY)
+        _local['trigger'] = None
+    return remaining >= 0
+
+
+# Profilers
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                module = frame.f_globals.get('__name__', '?')
+                stack.append(f'{module}.{getattr(code, "co_qualname", code.co_name)}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    """One profiled request, from view start until the response is done"""
+
+    def __init__(self, request, trigger):
+        self.request = request
+        self.mode = trigger['mode']
+        self.started = time.perf_counter()
+        if self.mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            interval = getattr(settings, 'ATTENDANCE_PROFILE_INTERVAL', 0.005)
+            self.profiler = StackSampler(threading.get_ident(), interval)
+            self.profiler.start()
+
+    def finish(self, response):
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        if self.mode == 'cprofile':
+            self.profiler.disable()
+            _cprofile_lock.release()
+        else:
+            self.profiler.stop()
+        try:
+            save_artifact(self, response, elapsed_ms)
+        except OSError:
+            # Never fail the request because of a profile
+            pass
+
+
+def save_artifact(profile, response, elapsed_ms):
+    directory = get_profile_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    request = profile.request
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else 'unresolved'
+    user = request.user.username if request.user.is_authenticated else 'anonymous'
+    stem = re.sub(r'[^\w.-]+', '-', f"{timezone.now():%Y%m%d-%H%M%S-%f}_{view}_{user}")
+
+    files = []
+    if profile.mode == 'cprofile':
+        profile.profiler.dump_stats(os.path.join(directory, f'{stem}.prof'))
+        report = io.StringIO()
+        pstats.Stats(profile.profiler, stream=report).sort_stats('cumulative').print_stats(60)
+        with open(os.path.join(directory, f'{stem}.txt'), 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        files = [f'{stem}.prof', f'{stem}.txt']
+    else:
+        with open(os.path.join(directory, f'{stem}.collapsed'), 'w', encoding='utf-8') as f:
+            f.write(profile.profiler.collapsed())
+        files = [f'{stem}.collapsed']
+
+    meta = {
+        'name': stem,
+        'created': timezone.now().isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'view': view,
+        'user': user,
+        'status': response.status_code,
+        'mode': profile.mode,
+        'elapsed_ms': round(elapsed_ms, 1),
+        'files': files,
+    }
+    with open(os.path.join(directory, f'{stem}.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    prune(directory)
+
+
+def list_artifacts():
+    """Metadata of stored profiles, newest first"""
+    directory = get_profile_dir()
+    try:
+        names = sorted((n for n in os.listdir(directory) if n.endswith('.json')), reverse=True)
+    except FileNotFoundError:
+        return []
+    artifacts = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta['downloads'] = [
+            {'name': file_name, 'label': file_name.rsplit('.', 1)[1]}
+            for file_name in meta['files']
+        ]
+        artifacts.append(meta)
+    return artifacts
+
+
+def prune(directory):
+    keep = getattr(settings, 'ATTENDANCE_PROFILE_KEEP', 50)
+    for meta in list_artifacts()[keep:]:
+        for name in meta['files'] + [f"{meta['name']}.json"]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def artifact_path(name):
+    """Absolute path of a downloadable artifact, or None if not valid"""
+    if not ARTIFACT_NAME.match(name):
+        return None
+    path = os.path.join(get_profile_dir(), name)
+    return path if os.path.isfile(path) else None
+
+
+# Middleware
+
+def matches(trigger, request):
+    if trigger['view'] and request.resolver_match.view_name != trigger['view']:
+        return False
+    if trigger['user_id'] and request.user.pk != trigger['user_id']:
+        return False
+    return True
+
+
+def finish_after_stream(content, profile, response):
+    try:
+        yield from content
+    finally:
+        profile.finish(response)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profile = getattr(request, '_attendance_profile', None)
+        if profile is None:
+            return response
+
+        if response.streaming and not response.is_async:
+            # Streamed bodies are generated after the view returns
+            response.streaming_content = finish_after_stream(response.streaming_content, profile, response)
+        else:
+            profile.finish(response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trigger = current_trigger()
+        if trigger is None or not matches(trigger, request):
+            return None
+        cprofile = trigger['mode'] == 'cprofile'
+        if cprofile and not _cprofile_lock.acquire(blocking=False):
+            # Busy; the request isn't counted, so a later one is profiled
+            return None
+        try:
+            if claim(trigger):
+                request._attendance_profile = RequestProfile(request, trigger)
+                return None
+        except ValueError:
+            # Another profiler outside this module is active
+            pass
+        if cprofile:
+            _cprofile_lock.release()
+        return None
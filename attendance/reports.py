@@ -0,0 +1,268 @@
+"""
+Report queries for the admin reports pages.
+
+The reports list is paginated with a keyset (cursor) over
+``(-date, user__username, id)`` so every page costs the same as the
+first one, and rows are fetched as plain values and shaped here so the
+template never calls model methods per row. Archived months are merged
+into a page only when it reaches back to them.
+
+The hours summary is paginated the same way over ``(period,
+user__username)`` and defaults to the last SUMMARY_DEFAULT_DAYS days;
+its spreadsheet export still covers every row of the requested range.
+"""
+import base64
+import json
+from datetime import date, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import archived_months, iter_month_values
+from .exports import duration_hours, filter_logs
+from .models import AttendanceLog
+
+
+REPORT_PAGE_SIZE = 50
+REPORT_MAX_PAGE_SIZE = 200
+
+REPORT_ORDERING = ('-date', 'user__username', 'id')
+
+REPORT_FIELDS = (
+    'id',
+    'date',
+    'check_in',
+    'check_out',
+    'worked',
+    'user__username',
+    'user__first_name',
+    'user__last_name',
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def pack_cursor(payload):
+    """Encode a JSON keyset position as an opaque token"""
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def unpack_cursor(token):
+    padded = token + '=' * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))
+
+
+def encode_cursor(row):
+    """Encode the keyset position of a report row as an opaque token"""
+    return pack_cursor([row['date'].isoformat(), row['username'], row['id']])
+
+
+def decode_cursor(token):
+    """Decode a cursor token back into (date, username, id)"""
+    try:
+        day, username, pk = unpack_cursor(token)
+        return date.fromisoformat(day), str(username), int(pk)
+    except (ValueError, TypeError):
+        raise InvalidCursor(f'Invalid cursor: {token!r}')
+
+
+def parse_page_size(value):
+    """Clamp a requested page size to 1..REPORT_MAX_PAGE_SIZE"""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        return REPORT_PAGE_SIZE
+    return max(1, min(page_size, REPORT_MAX_PAGE_SIZE))
+
+
+def after_cursor(queryset, cursor):
+    """Filter to rows strictly after cursor in REPORT_ORDERING"""
+    day, username, pk = cursor
+    return queryset.filter(
+        Q(date__lt=day)
+        | Q(date=day, user__username__gt=username)
+        | Q(date=day, user__username=username, id__gt=pk)
+    )
+
+
+def get_status(check_in, check_out):
+    if check_in is not None and check_out is not None:
+        return 'complete'
+    if check_in is not None:
+        return 'active'
+    return 'pending'
+
+
+def shape_report_row(values):
+    """Turn a REPORT_FIELDS dict into the row the template renders"""
+    check_in = values['check_in']
+    check_out = values['check_out']
+    full_name = f"{values['user__first_name']} {values['user__last_name']}".strip()
+    hours = duration_hours(values['worked'])
+    return {
+        'id': values['id'],
+        'date': values['date'],
+        'check_in': check_in,
+        'check_out': check_out,
+        'username': values['user__username'],
+        'display_name': full_name or values['user__username'],
+        'hours_display': f"{hours:.2f} hrs" if hours > 0 else "N/A",
+        'status': get_status(check_in, check_out),
+    }
+
+
+def report_sort_key(values):
+    """REPORT_ORDERING as a Python sort key over report values"""
+    return (-values['date'].toordinal(), values['user__username'], values['id'])
+
+
+def merge_archived(values, start_date, end_date, user_id, cursor, page_size):
+    """
+    Merge archived rows into a page fetched from the hot table.
+
+    Months are read newest first and only while they can still sort
+    before the last hot row, so recent pages never open an archive file.
+    """
+    bound = values[page_size]['date'] if len(values) > page_size else None
+    cursor_key = None
+    if cursor:
+        day, username, pk = cursor
+        cursor_key = (-day.toordinal(), username, pk)
+
+    archived = []
+    for key, info in reversed(archived_months(start_date, end_date, user_id)):
+        if bound and info['last_date'] < bound.isoformat():
+            break
+        if cursor and info['first_date'] > cursor[0].isoformat():
+            continue
+        archived.extend(
+            row for row in iter_month_values(key, info, start_date, end_date, user_id)
+            if cursor_key is None or report_sort_key(row) > cursor_key
+        )
+        # Older months all sort after these rows
+        if len(archived) > page_size:
+            break
+
+    if not archived:
+        return values
+    return sorted(values + archived, key=report_sort_key)[:page_size + 1]
+
+
+def get_report_page(start_date=None, end_date=None, user_id=None, cursor=None,
+                    page_size=REPORT_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for one page of the reports list.
+
+    One extra row is fetched to know whether a next page exists.
+    """
+    logs = AttendanceLog.objects.with_worked().order_by(*REPORT_ORDERING)
+    logs = filter_logs(logs, start_date, end_date, user_id)
+    if cursor:
+        cursor = decode_cursor(cursor)
+        logs = after_cursor(logs, cursor)
+
+    values = list(logs.values(*REPORT_FIELDS)[:page_size + 1])
+    values = merge_archived(values, start_date, end_date, user_id, cursor, page_size)
+    rows = [shape_report_row(v) for v in values]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+SUMMARY_PERIODS = [
+    ('day', 'Daily'),
+    ('week', 'Weekly'),
+    ('month', 'Monthly'),
+]
+
+SUMMARY_HEADERS = ['User', 'Username', 'Period Start', 'Total Hours', 'Days Worked', 'Incomplete Days']
+
+SUMMARY_PAGE_SIZE = 100
+
+# Range shown when the summary page is opened without a start date
+SUMMARY_DEFAULT_DAYS = 90
+
+
+def parse_period(value):
+    """Return a valid summary period, defaulting to month"""
+    periods = dict(SUMMARY_PERIODS)
+    return value if value in periods else 'month'
+
+
+def shape_summary_row(values):
+    """Turn an AttendanceLogQuerySet.summary() row into a display row"""
+    full_name = f"{values['user__first_name']} {values['user__last_name']}".strip()
+    return {
+        'user_id': values['user_id'],
+        'username': values['user__username'],
+        'display_name': full_name or values['user__username'],
+        'period': values['period'],
+        'total_hours': round(duration_hours(values['total_worked']), 2),
+        'days_worked': values['days_worked'],
+        'incomplete_days': values['incomplete_days'],
+    }
+
+
+def summary_range(start_date=None, end_date=None):
+    """
+    (start_date, end_date) for the summary page as ISO strings.
+
+    A missing start defaults to SUMMARY_DEFAULT_DAYS before the end date
+    (or today), so the page never aggregates the whole history.
+    """
+    if start_date:
+        return start_date, end_date
+    end = date.fromisoformat(end_date) if end_date else timezone.localdate()
+    return (end - timedelta(days=SUMMARY_DEFAULT_DAYS - 1)).isoformat(), end_date
+
+
+def get_summary_queryset(start_date=None, end_date=None, user_id=None, period='month'):
+    logs = filter_logs(AttendanceLog.objects.all(), start_date, end_date, user_id)
+    return logs.summary(period)
+
+
+def get_summary_page(start_date=None, end_date=None, user_id=None, period='month', cursor=None,
+                     page_size=SUMMARY_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for one page of the hours summary.
+
+    Each user has one row per period, so (period, username) is a unique
+    keyset; the filter on it lands in WHERE, before the GROUP BY.
+    """
+    summary = get_summary_queryset(start_date, end_date, user_id, period)
+    if cursor:
+        try:
+            period_start, username = unpack_cursor(cursor)
+            period_start, username = date.fromisoformat(period_start), str(username)
+        except (ValueError, TypeError):
+            raise InvalidCursor(f'Invalid cursor: {cursor!r}')
+        summary = summary.filter(
+            Q(period__gt=period_start) | Q(period=period_start, user__username__gt=username)
+        )
+
+    rows = [shape_summary_row(values) for values in summary[:page_size + 1]]
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = pack_cursor([rows[-1]['period'].isoformat(), rows[-1]['username']])
+    return rows, next_cursor
+
+
+def iter_summary_export_rows(queryset):
+    """Shape summary rows for the spreadsheet export"""
+    for values in queryset.iterator():
+        row = shape_summary_row(values)
+        yield [
+            row['display_name'],
+            row['username'],
+            row['period'].strftime('%Y-%m-%d'),
+            row['total_hours'],
+            row['days_worked'],
+            row['incomplete_days'],
+        ]
@@ -0,0 +1,273 @@
+"""
+Incrementally maintained daily attendance rollups.
+
+record_clock_in/record_clock_out wrap the atomic punch statements and
+bump the matching AttendanceDailySummary counters in the same
+transaction: the all-employees row for the date and the rows of the
+user's groups that allow it. A day's rows are built from AttendanceLog
+the first time it is punched, and rebuild_days() recomputes any range.
+Expected headcounts follow membership and group day changes from today
+on (see refresh_expected); earlier days keep the count they were built
+with.
+Each punch is also published to live dashboards once it commits, and
+written to the webhook outbox in the same transaction.
+"""
+import random
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from .archive import is_archived, read_manifest
+from .eligibility import allowed_group_ids, get_eligibility
+from .live import publish, publish_punch
+from .outbox import punch_event, record_events
+from .models import (
+    AttendanceDailySummary,
+    AttendanceGroup,
+    AttendanceLog,
+    AttendanceLogQuerySet,
+    UserGroup,
+)
+
+
+# Days shown in the admin dashboard trend
+TREND_DAYS = 14
+
+# Dates whose rows this process has seen committed, so the existence
+# check runs once per day and process rather than on every punch. Rows
+# that go missing later are caught by update_summaries().
+_ensured_dates = set()
+
+
+def mark_ensured(date):
+    """Remember date once the transaction that saw its rows commits"""
+    transaction.on_commit(lambda: _ensured_dates.add(date))
+
+
+def compute_day(date):
+    """Build (unsaved) summary rows for a date from AttendanceLog"""
+    logs = AttendanceLog.objects.filter(date=date)
+    totals = logs.aggregate(
+        clocked_in=Count('id', filter=Q(check_in__isnull=False, check_out__isnull=True)),
+        completed=Count('id', filter=AttendanceLogQuerySet.COMPLETE),
+        worked=Sum(AttendanceLogQuerySet.worked_expression()),
+    )
+
+    groups = AttendanceGroup.objects.allowing(date)
+    members = UserGroup.objects.filter(
+        group__in=groups,
+        user__is_active=True,
+        user__role='EMPLOYEE'
+    )
+    expected = dict(members.values_list('group_id').annotate(count=Count('id')).order_by())
+    per_group = (
+        logs.filter(user__user_groups__group__in=groups)
+        .values_list('user__user_groups__group')
+        .annotate(
+            clocked_in=Count('id', filter=Q(check_in__isnull=False, check_out__isnull=True)),
+            completed=Count('id', filter=AttendanceLogQuerySet.COMPLETE),
+            worked=Sum(AttendanceLogQuerySet.worked_expression()),
+        )
+        .order_by()
+    )
+    per_group = {group_id: counts for group_id, *counts in per_group}
+
+    rows = [AttendanceDailySummary(
+        date=date,
+        group=None,
+        clocked_in_count=totals['clocked_in'],
+        completed_count=totals['completed'],
+        total_worked=totals['worked'] or timedelta(),
+        expected_count=members.values('user_id').distinct().count(),
+    )]
+    for group_id in groups.values_list('id', flat=True):
+        clocked_in, completed, worked = per_group.get(group_id, (0, 0, None))
+        rows.append(AttendanceDailySummary(
+            date=date,
+            group_id=group_id,
+            clocked_in_count=clocked_in,
+            completed_count=completed,
+            total_worked=worked or timedelta(),
+            expected_count=expected.get(group_id, 0),
+        ))
+    return rows
+
+
+def ensure_day(date):
+    """Create a date's rows from current logs if they don't exist yet"""
+    if date in _ensured_dates:
+        return
+    if not AttendanceDailySummary.objects.filter(date=date, group__isnull=True).exists():
+        # A concurrent first punch may insert the same rows; keep theirs
+        AttendanceDailySummary.objects.bulk_create(compute_day(date), ignore_conflicts=True)
+    mark_ensured(date)
+
+
+def rebuild_days(dates):
+    """
+    Recompute the rows of every date in dates from AttendanceLog.
+
+    Dates in archived months are skipped: most of their logs are no
+    longer in the table, so their rows are kept as they were. Returns
+    the dates rebuilt.
+    """
+    manifest = read_manifest()
+    dates = [date for date in dates if not is_archived(date, manifest)]
+    for date in dates:
+        with transaction.atomic():
+            AttendanceDailySummary.objects.filter(date=date).delete()
+            AttendanceDailySummary.objects.bulk_create(compute_day(date))
+            mark_ensured(date)
+    if timezone.localdate() in dates:
+        # Bulk changes to today are not sent as deltas
+        publish({'type': 'reload'})
+    return dates
+
+
+def refresh_expected(dates=None):
+    """
+    Recompute expected_count on the existing rows of dates.
+
+    Defaults to every date from today on that has rows. Only the
+    headcounts are written, so concurrent punch increments are kept;
+    rows of groups that now allow a date are created from the logs.
+    """
+    if dates is None:
+        dates = AttendanceDailySummary.objects.filter(
+            date__gte=timezone.localdate(), group__isnull=True
+        ).values_list('date', flat=True)
+    for date in list(dates):
+        rows = compute_day(date)
+        AttendanceDailySummary.objects.bulk_create(rows, ignore_conflicts=True)
+        counts = [
+            When(group__isnull=True, then=Value(row.expected_count)) if row.group_id is None
+            else When(group_id=row.group_id, then=Value(row.expected_count))
+            for row in rows
+        ]
+        # Groups that no longer allow the date expect nobody
+        AttendanceDailySummary.objects.filter(date=date).update(
+            expected_count=Case(*counts, default=Value(0)),
+            updated_at=timezone.now(),
+        )
+
+
+_expected = threading.local()
+
+
+def refresh_expected_on_commit():
+    """
+    Refresh the expected headcounts once the current transaction commits.
+
+    Called per membership row, so the callbacks of one transaction share
+    a flag and only the first one does the work. A rolled-back flag just
+    costs the next transaction one extra refresh.
+    """
+    _expected.dirty = True
+
+    def refresh():
+        if getattr(_expected, 'dirty', False):
+            _expected.dirty = False
+            refresh_expected()
+
+    transaction.on_commit(refresh)
+
+
+def day_total(date):
+    """The all-employees row for a date, created if missing"""
+    row = AttendanceDailySummary.objects.filter(date=date, group__isnull=True).first()
+    if row is None:
+        # Also covers rows deleted since this process last saw the date
+        _ensured_dates.discard(date)
+        ensure_day(date)
+        row = AttendanceDailySummary.objects.get(date=date, group__isnull=True)
+    return row
+
+
+def trend(end_date, days=TREND_DAYS):
+    """All-employees rows for the days up to end_date, newest first"""
+    return AttendanceDailySummary.objects.filter(
+        group__isnull=True,
+        date__gt=end_date - timedelta(days=days),
+        date__lte=end_date
+    ).order_by('-date')
+
+
+def update_summaries(user_id, date, **changes):
+    """
+    Apply changes to the all-employees row and the user's groups allowing date.
+
+    If fewer rows match than expected, some are missing: deleted since
+    this process saw the date, or belonging to a group created after the
+    date's rows were built. They are then created from the logs, which
+    already include the punch being recorded.
+    """
+    group_ids = allowed_group_ids(get_eligibility(user_id), date)
+    updated = AttendanceDailySummary.objects.filter(
+        Q(group__isnull=True) | Q(group_id__in=group_ids),
+        date=date
+    ).update(**changes, updated_at=timezone.now())
+    if updated < 1 + len(group_ids):
+        AttendanceDailySummary.objects.bulk_create(compute_day(date), ignore_conflicts=True)
+
+
+# SQLite can't let two transactions that have read both go on to write:
+# one of them fails with "database is locked" at once instead of waiting.
+# A punch is a conditional statement, so the whole transaction is retried.
+LOCK_RETRIES = 8
+
+
+def retry_if_locked(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        # Inside an outer transaction only the caller can retry
+        retries = 0 if connection.in_atomic_block or connection.vendor != 'sqlite' else LOCK_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == retries or 'locked' not in str(exc):
+                    raise
+                time.sleep(random.uniform(0.005, 0.02) * 2 ** attempt)
+    return wrapper
+
+
+@retry_if_locked
+def record_clock_in(user_id, date, at):
+    """AttendanceLog.objects.clock_in plus the rollup increment"""
+    with transaction.atomic():
+        ensure_day(date)
+        result = AttendanceLog.objects.clock_in(user_id, date, at)
+        if result == 'clocked_in':
+            update_summaries(user_id, date, clocked_in_count=F('clocked_in_count') + 1)
+            record_events(punch_event('clock_in', user_id, date, at))
+            publish_punch(user_id, date)
+    return result
+
+
+@retry_if_locked
+def record_clock_out(user_id, date, at):
+    """AttendanceLog.objects.clock_out plus the rollup increment"""
+    with transaction.atomic():
+        ensure_day(date)
+        result = AttendanceLog.objects.clock_out(user_id, date, at)
+        if result == 'clocked_out':
+            # The worked time is read from the updated log inside the UPDATE
+            worked = AttendanceLog.objects.filter(
+                user_id=user_id,
+                date=OuterRef('date')
+            ).with_worked().values('worked')[:1]
+            update_summaries(
+                user_id,
+                date,
+                clocked_in_count=F('clocked_in_count') - 1,
+                completed_count=F('completed_count') + 1,
+                total_worked=F('total_worked') + Subquery(worked),
+            )
+            record_events(punch_event('clock_out', user_id, date, at))
+            publish_punch(user_id, date)
+    return result
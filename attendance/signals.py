@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .changes import record_log_deletion, record_user_group_deletion
+from .eligibility import invalidate_group, invalidate_users
+from .models import AttendanceGroup, AttendanceLog, UserGroup
+from .outbox import membership_event, record_events
+from .rollups import refresh_expected_on_commit
+
+
+@receiver([post_save, post_delete], sender=UserGroup)
+def user_group_changed(sender, instance, **kwargs):
+    """
+    Invalidate a user's eligibility when an assignment is added or removed.
+
+    Queryset deletes and cascades from a deleted AttendanceGroup or User
+    also send post_delete per row, so they are covered here. The
+    expected headcounts of today's rollup rows change with it.
+    """
+    invalidate_users([instance.user_id])
+    refresh_expected_on_commit()
+
+
+@receiver(post_save, sender=AttendanceGroup)
+def attendance_group_saved(sender, instance, created, **kwargs):
+    """Invalidate every member when a group's days or name change"""
+    if not created:
+        invalidate_group(instance.id)
+        refresh_expected_on_commit()
+
+
+@receiver(post_save, sender=UserGroup)
+def user_group_saved(sender, instance, created, **kwargs):
+    """Outbox event for assignments saved one by one (e.g. in the admin)"""
+    if created:
+        record_events(membership_event('group_assigned', instance.user_id, instance.group_id))
+
+
+@receiver(post_delete, sender=UserGroup)
+def user_group_deleted(sender, instance, **kwargs):
+    """Leave a tombstone for the change feed and an outbox event"""
+    record_user_group_deletion(instance)
+    record_events(membership_event('group_removed', instance.user_id, instance.group_id))
+
+
+@receiver(post_delete, sender=AttendanceLog)
+def attendance_log_deleted(sender, instance, **kwargs):
+    """
+    Leave a tombstone for the change feed.
+
+    Covers every path: the admin, queryset deletes and cascades from a
+    deleted User. archive_attendance opts out with without_log_tombstones.
+    """
+    record_log_deletion(instance)
@@ -0,0 +1,376 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, time as clock_time, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import changes, outbox
+from .models import (
+    ApiClient, AttendanceDailySummary, AttendanceGroup, AttendanceLog, DeletedRecord, OutboxEvent,
+    UserGroup, WebhookDelivery, WebhookEndpoint,
+)
+from .rollups import _ensured_dates
+from users.models import User
+
+
+class ConcurrentPunchTests(TransactionTestCase):
+    """
+    Simultaneous punches by one user through the real views.
+
+    Threads need a database they can all open. PostgreSQL and SQLite with
+    a file-based TEST NAME are used as configured; the in-memory SQLite
+    default is swapped for a throwaway file for the length of the class.
+    """
+
+    PUNCHES = 300
+
+    @classmethod
+    def setUpClass(cls):
+        cls.memory_connection = None
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            cls.use_file_database()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls.memory_connection is not None:
+            cls.restore_memory_database()
+
+    @classmethod
+    def use_file_database(cls):
+        handle, cls.database_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        # The in-memory database lives only while its connection is open,
+        # so it is set aside rather than closed; threads build their own
+        # connections from the shared settings dict
+        cls.memory_connection = connections['default']
+        cls.memory_name = cls.memory_connection.settings_dict['NAME']
+        cls.memory_connection.settings_dict['NAME'] = cls.database_path
+        connections['default'] = connections.create_connection('default')
+        call_command('migrate', run_syncdb=True, verbosity=0, interactive=False)
+
+    @classmethod
+    def restore_memory_database(cls):
+        connections['default'].close()
+        cls.memory_connection.settings_dict['NAME'] = cls.memory_name
+        connections['default'] = cls.memory_connection
+        os.remove(cls.database_path)
+
+    def setUp(self):
+        _ensured_dates.clear()
+        self.user = User.objects.create_user(username='punch_test', password='x')
+        group = AttendanceGroup.objects.create(name='Every Day', allowed_days=list(range(7)))
+        UserGroup.objects.create(user=self.user, group=group)
+
+    def fire(self, url_name):
+        """POST url_name from PUNCHES logged-in clients released at once"""
+        clients = []
+        for _ in range(self.PUNCHES):
+            client = Client()
+            client.force_login(self.user)
+            clients.append(client)
+
+        barrier = threading.Barrier(len(clients))
+        statuses = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(client):
+            try:
+                barrier.wait()
+                response = client.post(reverse(url_name))
+                with lock:
+                    statuses.append(response.status_code)
+            except Exception as exc:
+                with lock:
+                    errors.append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses, errors
+
+    def test_one_complete_row_and_rollup(self):
+        for url_name in ('clock_in', 'clock_out'):
+            statuses, errors = self.fire(url_name)
+            self.assertEqual(errors, [])
+            self.assertEqual(set(statuses), {302})
+
+        today = timezone.localdate()
+        logs = list(AttendanceLog.objects.filter(user=self.user, date=today))
+        self.assertEqual(len(logs), 1)
+        self.assertTrue(logs[0].is_complete())
+
+        total = AttendanceDailySummary.objects.get(date=today, group__isnull=True)
+        self.assertEqual((total.clocked_in_count, total.completed_count), (0, 1))
+        self.assertEqual(
+            sorted(OutboxEvent.objects.filter(
+                event_type__in=['clock_in', 'clock_out']
+            ).values_list('event_type', flat=True)),
+            ['clock_in', 'clock_out'],
+        )
+
+
+@override_settings(ATTENDANCE_CHANGES_LAG_SECONDS=0)
+class ChangeFeedTests(TestCase):
+    """Cursor handling, paging and tombstones of the change feed"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='feed_test', password='x')
+        self.logs = [
+            AttendanceLog.objects.create(user=self.user, date=date(2024, 1, day), check_in=clock_time(8))
+            for day in range(1, 6)
+        ]
+
+    def read_all(self, cursor=None, limit=2):
+        """Follow the feed until has_more is false; returns (changes, cursor)"""
+        seen = []
+        while True:
+            page, cursor, has_more = changes.get_changes(cursor, limit)
+            self.assertLessEqual(len(page), limit)
+            seen.extend(page)
+            if not has_more:
+                return seen, cursor
+
+    def test_cursor_round_trip(self):
+        positions = {'attendance_log': (timezone.now(), 7), 'deleted': (timezone.now(), 3)}
+        self.assertEqual(changes.decode_cursor(changes.encode_cursor(positions)), positions)
+        self.assertEqual(changes.decode_cursor(None), {})
+        with self.assertRaises(changes.InvalidCursor):
+            changes.decode_cursor(changes.encode_cursor(positions)[:-2] + 'xx')
+
+    def test_has_more_pages_cover_every_change_once(self):
+        seen, cursor = self.read_all()
+        self.assertEqual(
+            [(change['type'], change['id']) for change in seen],
+            [('attendance_log', log.pk) for log in self.logs],
+        )
+        self.assertEqual(changes.get_changes(cursor, 2), ([], cursor, False))
+
+        self.logs[0].check_out = clock_time(16)
+        self.logs[0].save()
+        page, _, has_more = changes.get_changes(cursor, 2)
+        self.assertEqual([change['id'] for change in page], [self.logs[0].pk])
+        self.assertFalse(has_more)
+
+    def test_deleted_log_leaves_a_tombstone(self):
+        _, cursor = self.read_all()
+        deleted_pk = self.logs[1].pk
+        self.logs[1].delete()
+        with changes.without_log_tombstones():
+            self.logs[2].delete()
+
+        page, _, _ = changes.get_changes(cursor, 10)
+        self.assertEqual(page, [{
+            'type': 'attendance_log',
+            'op': 'delete',
+            'id': deleted_pk,
+            'user_id': self.user.pk,
+            'date': '2024-01-02',
+            'changed_at': page[0]['changed_at'],
+        }])
+
+    def test_purge_and_expired_cursor(self):
+        self.logs[0].delete()
+        DeletedRecord.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        self.logs[1].delete()
+        self.assertEqual(changes.purge_tombstones(), 1)
+        self.assertEqual(DeletedRecord.objects.count(), 1)
+
+        _, cursor = self.read_all()
+        client = ApiClient(name='Feed Test')
+        token = client.set_new_token()
+        client.save()
+        url = reverse('change_feed')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        self.assertEqual(self.client.get(url, {'cursor': cursor}, **headers).status_code, 200)
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 31 * 86400):
+            with self.assertRaises(changes.CursorExpired):
+                changes.decode_cursor(cursor)
+            self.assertEqual(self.client.get(url, {'cursor': cursor}, **headers).status_code, 410)
+
+
+class StubReceiver:
+    """Local webhook endpoint answering with scripted status codes, then 204"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.batches = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                receiver.batches.append([event['id'] for event in json.loads(body)['events']])
+                self.send_response(receiver.statuses.pop(0) if receiver.statuses else 204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookDeliveryTests(TestCase):
+    """claim_batch / deliver_batch against a local endpoint"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='webhook_test', password='x')
+        outbox.record_events(*(
+            outbox.punch_event('clock_in', user.pk, date(2024, 1, day), clock_time(8))
+            for day in range(1, 4)
+        ))
+        self.event_ids = sorted(OutboxEvent.objects.values_list('id', flat=True))
+
+    def make_endpoint(self, receiver):
+        endpoint = WebhookEndpoint.objects.create(name='Stub', url=receiver.url)
+        outbox.fan_out()
+        return endpoint
+
+    def later(self, seconds):
+        return mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=seconds))
+
+    def statuses(self):
+        return list(WebhookDelivery.objects.order_by('id').values_list('status', 'attempts'))
+
+    def test_failed_batch_is_retried_with_backoff(self):
+        with StubReceiver(503) as receiver:
+            endpoint = self.make_endpoint(receiver)
+            before = timezone.now()
+            self.assertFalse(outbox.deliver_batch(endpoint, outbox.claim_batch(endpoint)))
+
+            self.assertEqual(self.statuses(), [(WebhookDelivery.STATUS_PENDING, 1)] * 3)
+            for delivery in WebhookDelivery.objects.all():
+                self.assertEqual(delivery.last_error, 'HTTP 503')
+                # First retry after BACKOFF_BASE seconds, jittered down to half
+                delay = (delivery.next_attempt_at - before).total_seconds()
+                self.assertTrue(outbox.BACKOFF_BASE / 2 <= delay <= outbox.BACKOFF_BASE + 1, delay)
+            self.assertEqual(outbox.claim_batch(endpoint), [])
+
+            with self.later(outbox.BACKOFF_BASE + 1):
+                self.assertTrue(outbox.deliver_batch(endpoint, outbox.claim_batch(endpoint)))
+
+        self.assertEqual(self.statuses(), [(WebhookDelivery.STATUS_DELIVERED, 2)] * 3)
+        self.assertEqual(receiver.batches, [self.event_ids, self.event_ids])
+
+    def test_batch_sent_before_a_crash_is_sent_again(self):
+        with StubReceiver() as receiver:
+            endpoint = self.make_endpoint(receiver)
+            deliveries = outbox.claim_batch(endpoint)
+            # The POST succeeds but the dispatcher dies before recording it
+            self.assertIsNone(outbox.post(endpoint, outbox.encode_batch(deliveries)))
+            self.assertEqual(self.statuses(), [(WebhookDelivery.STATUS_PENDING, 0)] * 3)
+
+            with self.later(outbox.LEASE_SECONDS + 2):
+                self.assertTrue(outbox.deliver_batch(endpoint, outbox.claim_batch(endpoint)))
+
+        self.assertEqual(self.statuses(), [(WebhookDelivery.STATUS_DELIVERED, 1)] * 3)
+        # At least once: the receiver saw the batch twice, with the same ids
+        self.assertEqual(receiver.batches, [self.event_ids, self.event_ids])
+
+    def test_expired_lease_is_reclaimed(self):
+        with StubReceiver() as receiver:
+            endpoint = self.make_endpoint(receiver)
+            claimed = outbox.claim_batch(endpoint)
+            self.assertEqual([d.event_id for d in claimed], self.event_ids)
+
+            # Leased to the first dispatcher until it expires
+            self.assertEqual(outbox.claim_batch(endpoint), [])
+            with self.later(outbox.LEASE_SECONDS - 1):
+                self.assertEqual(outbox.claim_batch(endpoint), [])
+            with self.later(outbox.LEASE_SECONDS + 2):
+                reclaimed = outbox.claim_batch(endpoint)
+                self.assertEqual([d.id for d in reclaimed], [d.id for d in claimed])
+                self.assertTrue(outbox.deliver_batch(endpoint, reclaimed))
+
+        self.assertEqual(receiver.batches, [self.event_ids])
+        self.assertEqual(self.statuses(), [(WebhookDelivery.STATUS_DELIVERED, 1)] * 3)
+
+
+class ExportCacheTests(TestCase):
+    """Cached exports of a closed range are replaced when their data changes"""
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, archive_dir, ignore_errors=True)
+        overrides = override_settings(ATTENDANCE_EXPORT_CACHE_DIR=cache_dir, ATTENDANCE_ARCHIVE_DIR=archive_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.cache_dir = cache_dir
+
+        admin = User.objects.create_user(username='cache_admin', password='x', role='ADMIN')
+        self.client.force_login(admin)
+        self.employee = User.objects.create_user(username='cache_test', password='x', first_name='Ann')
+        self.logs = [
+            AttendanceLog.objects.create(
+                user=self.employee, date=date(2024, 1, day), check_in=clock_time(8), check_out=clock_time(16)
+            )
+            for day in range(1, 11)
+        ]
+
+    def export(self):
+        response = self.client.get(
+            reverse('export_data', args=['csv']), {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def entries(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_cached_until_the_range_changes(self):
+        first = self.export()
+        entries = self.entries()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(self.export(), first)
+        self.assertEqual(self.entries(), entries)
+
+    def test_edit_in_closed_range_replaces_the_entry(self):
+        self.export()
+        entries = self.entries()
+
+        log = self.logs[4]
+        log.check_out = clock_time(17, 30)
+        log.save()
+
+        self.assertIn('17:30', self.export())
+        self.assertEqual(len(self.entries()), 1)
+        self.assertNotEqual(self.entries(), entries)
+
+    def test_user_rename_replaces_the_entry(self):
+        self.assertIn('Ann', self.export())
+        entries = self.entries()
+
+        self.employee.first_name = 'Anna'
+        self.employee.save()
+
+        self.assertIn('Anna', self.export())
+        self.assertEqual(len(self.entries()), 1)
+        self.assertNotEqual(self.entries(), entries)
@@ -7,8 +7,16 @@ urlpatterns = [
     path('clock-in/', views.clock_in, name='clock_in'),
     path('clock-out/', views.clock_out, name='clock_out'),
     
+    # Kiosk terminals
+    path('kiosk/punch/', views.kiosk_punch, name='kiosk_punch'),
+    path('kiosk/punches/batch/', views.kiosk_punch_batch, name='kiosk_punch_batch'),
+    
+    # Sync API
+    path('api/changes/', views.change_feed, name='change_feed'),
+    
     # Admin URLs
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin-dashboard/events/', views.live_events, name='live_events'),
     
     # Group Management
     path('groups/', views.manage_groups, name='manage_groups'),
@@ -19,8 +27,22 @@ urlpatterns = [
     # User Management
     path('users/', views.manage_users, name='manage_users'),
     path('users/<int:user_id>/assign-groups/', views.assign_user_to_group, name='assign_user_groups'),
+    path('users/bulk-assign/', views.bulk_assign_groups, name='bulk_assign_groups'),
     
     # Reports
     path('reports/', views.reports, name='reports'),
     path('reports/export/', views.export_excel, name='export_excel'),
+    path('reports/export/<str:fmt>/', views.export_data, name='export_data'),
+    path('reports/jobs/', views.submit_export_job, name='submit_export_job'),
+    path('reports/jobs/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('reports/jobs/<int:job_id>/download/', views.download_export_job, name='download_export_job'),
+    path('reports/summary/', views.summary_report, name='summary_report'),
+    path('reports/summary/export/', views.export_summary, name='export_summary'),
+    path('reports/absences/', views.absence_matrix, name='absence_matrix'),
+    path('reports/absences/export/', views.export_absence_matrix, name='export_absence_matrix'),
+    
+    # Diagnostics
+    path('metrics/', views.request_metrics, name='request_metrics'),
+    path('profiling/', views.profiling_settings, name='profiling_settings'),
+    path('profiling/<str:name>/', views.download_profile, name='download_profile'),
 ]
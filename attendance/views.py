@@ -3,11 +3,38 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 from django.db.models import Q, Count, Sum
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse,
+)
+from django.views.decorators.csrf import csrf_exempt
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.http import require_GET, require_POST
 from datetime import datetime, date, time, timedelta
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from .models import AttendanceGroup, UserGroup, AttendanceLog
+import json
+from .models import AttendanceGroup, UserGroup, AttendanceLog, ExportJob
+from .assignments import (
+    bulk_assign_group, bulk_remove_group, existing_group_ids, parse_ids, set_user_groups,
+)
+from .eligibility import allowed_group_names, get_eligibility, is_allowed_on
+from . import absence, changes, export_jobs, watermarks
+from .exports import (
+    STREAM_FORMATS, data_export_response, excel_export_response, export_filename, parse_filters,
+    xlsx_response,
+)
+from .ingest import BATCH_MAX_PUNCHES, ingest_punches
+from . import instrumentation, profiling
+from .kiosk import (
+    DIRECTIONS, find_kiosk_user, get_device, get_lockout, is_locked_out, record_failure, record_punch,
+)
+from .live import get_backend, stream
+from .reports import (
+    InvalidCursor, SUMMARY_HEADERS, SUMMARY_PERIODS, get_report_page, get_summary_page,
+    get_summary_queryset, iter_summary_export_rows, parse_page_size, parse_period,
+    summary_range,
+)
+from .rollups import day_total, record_clock_in, record_clock_out, trend
 from users.models import User
 
 
@@ -16,6 +43,20 @@ def user_is_admin(user):
     return user.is_authenticated and user.is_admin()
 
 
+def get_report_filters(request):
+    """
+    The validated start_date / end_date / user filters; raises ValueError.
+
+    Parsed once per request, as the page watermarks need them before the
+    view runs.
+    """
+    if not hasattr(request, '_report_filters'):
+        request._report_filters = parse_filters(
+            request.GET.get('start_date'), request.GET.get('end_date'), request.GET.get('user'),
+        )
+    return request._report_filters
+
+
 @login_required
 def employee_dashboard(request):
     """
@@ -27,17 +68,13 @@ def employee_dashboard(request):
     today = timezone.localdate()
     user = request.user
     
-    # Get user's attendance groups
-    user_groups = UserGroup.objects.filter(user=user).select_related('group')
+    # Get user's attendance groups from the eligibility cache
+    eligibility = get_eligibility(user.id)
+    user_groups = eligibility['groups']
     
     # Check if today is an allowed day for any of the user's groups
-    is_allowed_today = False
-    allowed_groups = []
-    
-    for ug in user_groups:
-        if ug.group.is_day_allowed(today):
-            is_allowed_today = True
-            allowed_groups.append(ug.group.name)
+    allowed_groups = allowed_group_names(eligibility, today)
+    is_allowed_today = bool(allowed_groups)
     
     # Get today's attendance log if exists
     today_log = AttendanceLog.objects.filter(user=user, date=today).first()
@@ -80,27 +117,17 @@ def clock_in(request):
     now = timezone.localtime().time()
     
     # Verify user has permission to clock in today
-    user_groups = UserGroup.objects.filter(user=user).select_related('group')
-    is_allowed = any(ug.group.is_day_allowed(today) for ug in user_groups)
+    is_allowed = is_allowed_on(user.id, today)
     
     if not is_allowed:
         messages.error(request, f'You are not allowed to clock in on {today.strftime("%A")}.')
         return redirect('employee_dashboard')
     
-    # Check if already clocked in today
-    log, created = AttendanceLog.objects.get_or_create(
-        user=user,
-        date=today,
-        defaults={'check_in': now}
-    )
+    # Single INSERT, or a conditional UPDATE if today's row already exists
+    result = record_clock_in(user.id, today, now)
     
-    if not created:
-        if log.check_in is not None:
-            messages.warning(request, 'You have already clocked in today.')
-        else:
-            log.check_in = now
-            log.save()
-            messages.success(request, f'Successfully clocked in at {now.strftime("%I:%M %p")}.')
+    if result == 'already_clocked_in':
+        messages.warning(request, 'You have already clocked in today.')
     else:
         messages.success(request, f'Successfully clocked in at {now.strftime("%I:%M %p")}.')
     
@@ -117,31 +144,154 @@ def clock_out(request):
     today = timezone.localdate()
     now = timezone.localtime().time()
     
-    try:
-        log = AttendanceLog.objects.get(user=user, date=today)
-        
-        if log.check_in is None:
-            messages.error(request, 'You must clock in before clocking out.')
-        elif log.check_out is not None:
-            messages.warning(request, 'You have already clocked out today.')
-        else:
-            log.check_out = now
-            log.save()
-            
-            total_hours = log.get_total_hours()
-            messages.success(
-                request,
-                f'Successfully clocked out at {now.strftime("%I:%M %p")}. '
-                f'Total hours: {total_hours:.2f}'
-            )
+    # Conditional UPDATE ... WHERE check_out IS NULL
+    result = record_clock_out(user.id, today, now)
     
-    except AttendanceLog.DoesNotExist:
+    if result == 'clocked_out':
+        messages.success(request, f'Successfully clocked out at {now.strftime("%I:%M %p")}.')
+    elif result == 'already_clocked_out':
+        messages.warning(request, 'You have already clocked out today.')
+    elif result == 'not_clocked_in':
+        messages.error(request, 'You must clock in before clocking out.')
+    else:
         messages.error(request, 'No clock in record found for today.')
     
     return redirect('employee_dashboard')
 
 
+# HTTP status for each punch outcome
+KIOSK_PUNCH_STATUS = {
+    'clocked_in': 200,
+    'clocked_out': 200,
+    'already_clocked_in': 409,
+    'already_clocked_out': 409,
+    'not_clocked_in': 409,
+    'no_record': 409,
+    'not_allowed': 403,
+}
+
+
+@csrf_exempt
+@require_POST
+def kiosk_punch(request):
+    """
+    Record a punch from a kiosk terminal in a single request.
+    
+    Expects a device token in the Authorization header and a JSON body
+    with "badge" or "pin", and optionally "direction" (in, out or auto).
+    """
+    device = get_device(request)
+    if device is None:
+        return JsonResponse({'error': 'Invalid device token.'}, status=401)
+    
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    
+    direction = payload.get('direction', 'auto')
+    if direction not in DIRECTIONS:
+        return JsonResponse({'error': f'Invalid direction: {direction}.'}, status=400)
+    
+    badge, pin = payload.get('badge'), payload.get('pin')
+    if not isinstance(badge, (str, type(None))) or not isinstance(pin, (str, type(None))):
+        return JsonResponse({'error': 'badge and pin must be strings.'}, status=400)
+    
+    if is_locked_out(device):
+        response = JsonResponse(
+            {'error': 'Too many unknown badges or PINs; try again later.'}, status=429
+        )
+        response['Retry-After'] = str(get_lockout())
+        return response
+    
+    user = find_kiosk_user(badge=badge, pin=pin)
+    if user is None:
+        record_failure(device)
+        return JsonResponse({'error': 'Unknown badge or PIN.'}, status=404)
+    
+    today = timezone.localdate()
+    now = timezone.localtime().time()
+    result = record_punch(user.id, today, now, direction)
+    
+    return JsonResponse({
+        'status': result,
+        'user': user.get_full_name() or user.username,
+        'date': today.isoformat(),
+        'time': now.strftime('%H:%M:%S'),
+    }, status=KIOSK_PUNCH_STATUS[result])
+
+
+@csrf_exempt
+@require_POST
+def kiosk_punch_batch(request):
+    """
+    Ingest punches buffered by an offline terminal.
+    
+    Expects a device token and a JSON body {"punches": [...]} where each
+    punch has "user" or "badge", "timestamp" and "direction".
+    """
+    device = get_device(request)
+    if device is None:
+        return JsonResponse({'error': 'Invalid device token.'}, status=401)
+    
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+    
+    punches = payload.get('punches') if isinstance(payload, dict) else None
+    if not isinstance(punches, list):
+        return JsonResponse({'error': 'Expected a "punches" list.'}, status=400)
+    if len(punches) > BATCH_MAX_PUNCHES:
+        return JsonResponse(
+            {'error': f'At most {BATCH_MAX_PUNCHES} punches per request.'},
+            status=413
+        )
+    
+    report = ingest_punches(punches)
+    return JsonResponse(report.as_dict())
+
+
+@require_GET
+def change_feed(request):
+    """
+    Attendance logs and group assignments changed after a cursor.
+    
+    Expects an API client token in the Authorization header. Pass the
+    returned next_cursor back as ?cursor= to continue; deletions are
+    returned as "op": "delete" entries.
+    """
+    client = changes.get_api_client(request)
+    if client is None:
+        return JsonResponse({'error': 'Invalid API token.'}, status=401)
+    
+    try:
+        page, next_cursor, has_more = changes.get_changes(
+            request.GET.get('cursor'),
+            changes.parse_page_size(request.GET.get('limit'))
+        )
+    except changes.CursorExpired:
+        return JsonResponse({'error': 'Cursor expired, sync again without a cursor.'}, status=410)
+    except changes.InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    
+    return JsonResponse({
+        'changes': page,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    })
+
+
+def admin_dashboard_watermark(request):
+    if not user_is_admin(request.user):
+        return None
+    return watermarks.dashboard_watermark(timezone.localdate())
+
+
 @login_required
+@watermarks.conditional(admin_dashboard_watermark)
 def admin_dashboard(request):
     """
     Admin dashboard - Overview and management
@@ -165,11 +315,10 @@ def admin_dashboard(request):
         check_out__isnull=False
     ).select_related('user').order_by('-check_out')
     
-    # Statistics
+    # Statistics; today's counts come from the maintained rollup row
     total_users = User.objects.filter(is_active=True, role='EMPLOYEE').count()
     total_groups = AttendanceGroup.objects.count()
-    clocked_in_count = active_today.count()
-    completed_count = completed_today.count()
+    today_summary = day_total(today)
     
     context = {
         'today': today,
@@ -177,13 +326,39 @@ def admin_dashboard(request):
         'completed_today': completed_today,
         'total_users': total_users,
         'total_groups': total_groups,
-        'clocked_in_count': clocked_in_count,
-        'completed_count': completed_count,
+        'expected_count': today_summary.expected_count,
+        'clocked_in_count': today_summary.clocked_in_count,
+        'completed_count': today_summary.completed_count,
+        'trend': trend(today),
     }
     
     return render(request, 'attendance/admin_dashboard.html', context)
 
 
+async def live_events(request):
+    """
+    Server-Sent Events stream of today's punches for the admin dashboard.
+    
+    Needs the ASGI entry point (sga_project.asgi); under WSGI a stream
+    would hold a worker forever, so it answers 204, which tells
+    EventSource not to reconnect.
+    """
+    user = await request.auser()
+    if not user_is_admin(user):
+        return HttpResponse(status=403)
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    response = StreamingHttpResponse(
+        stream(get_backend().subscribe()),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 def manage_groups(request):
     """Manage attendance groups"""
@@ -304,15 +479,15 @@ def assign_user_to_group(request, user_id):
     user = get_object_or_404(User, id=user_id)
     
     if request.method == 'POST':
-        selected_groups = request.POST.getlist('groups')
+        selected_groups = parse_ids(request.POST.getlist('groups'))
         
-        # Remove all current assignments
-        UserGroup.objects.filter(user=user).delete()
+        # Validate all selected groups in one query
+        if existing_group_ids(selected_groups) != selected_groups:
+            messages.error(request, 'One or more selected groups no longer exist.')
+            return redirect('assign_user_groups', user_id=user.id)
         
-        # Add new assignments
-        for group_id in selected_groups:
-            group = AttendanceGroup.objects.get(id=group_id)
-            UserGroup.objects.create(user=user, group=group)
+        # Only insert and delete the assignments that changed
+        set_user_groups(user.id, selected_groups)
         
         messages.success(request, f'Groups updated for {user.get_full_name() or user.username}.')
         return redirect('manage_users')
@@ -329,6 +504,61 @@ def assign_user_to_group(request, user_id):
 
 
 @login_required
+def bulk_assign_groups(request):
+    """Add or remove one group for many selected users at once"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        group = AttendanceGroup.objects.filter(id__in=parse_ids([request.POST.get('group')])).first()
+        user_ids = parse_ids(request.POST.getlist('users'))
+        
+        if group is None or action not in ('add', 'remove') or not user_ids:
+            messages.error(request, 'Please select a group, an action and at least one user.')
+            return redirect('bulk_assign_groups')
+        
+        # Drop ids of users that don't exist
+        user_ids = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        
+        if action == 'add':
+            count = len(bulk_assign_group(group.id, user_ids))
+            messages.success(request, f'Added {count} users to "{group.name}".')
+        else:
+            count = bulk_remove_group(group.id, user_ids)
+            messages.success(request, f'Removed {count} users from "{group.name}".')
+        return redirect('bulk_assign_groups')
+    
+    users = User.objects.filter(is_active=True).prefetch_related('user_groups__group')
+    all_groups = AttendanceGroup.objects.all()
+    
+    context = {
+        'users': users,
+        'all_groups': all_groups,
+    }
+    return render(request, 'attendance/bulk_assign_groups.html', context)
+
+
+def reports_watermark(request):
+    if not user_is_admin(request.user):
+        return None
+    # Invalid filters are rejected by the view, not hashed into an ETag
+    try:
+        filters = get_report_filters(request)
+    except ValueError:
+        return None
+    return watermarks.reports_watermark(
+        filters['start_date'],
+        filters['end_date'],
+        filters['user_id'],
+        request.GET.get('cursor'),
+        parse_page_size(request.GET.get('page_size')),
+    )
+
+
+@login_required
+@watermarks.conditional(reports_watermark)
 def reports(request):
     """View and export attendance reports"""
     if not user_is_admin(request.user):
@@ -336,19 +566,30 @@ def reports(request):
         return redirect('employee_dashboard')
     
     # Get filter parameters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    user_id = request.GET.get('user')
+    try:
+        filters = get_report_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    start_date, end_date, user_id = filters['start_date'], filters['end_date'], filters['user_id']
+    cursor = request.GET.get('cursor')
+    page_size = parse_page_size(request.GET.get('page_size'))
+    
+    # Fetch one keyset page of pre-shaped rows
+    try:
+        logs, next_cursor = get_report_page(start_date, end_date, user_id, cursor, page_size)
+    except InvalidCursor:
+        messages.error(request, 'Invalid page cursor, showing the first page.')
+        cursor = None
+        logs, next_cursor = get_report_page(start_date, end_date, user_id, None, page_size)
     
-    # Build query
-    logs = AttendanceLog.objects.select_related('user').order_by('-date', 'user__username')
+    # Filter parameters without the cursor, for export and pagination links
+    filter_params = request.GET.copy()
+    filter_params.pop('cursor', None)
     
-    if start_date:
-        logs = logs.filter(date__gte=start_date)
-    if end_date:
-        logs = logs.filter(date__lte=end_date)
-    if user_id:
-        logs = logs.filter(user_id=user_id)
+    next_params = None
+    if next_cursor:
+        next_params = filter_params.copy()
+        next_params['cursor'] = next_cursor
     
     # Get all users for filter dropdown
     all_users = User.objects.filter(is_active=True, role='EMPLOYEE').order_by('username')
@@ -356,77 +597,389 @@ def reports(request):
     context = {
         'logs': logs,
         'all_users': all_users,
-        'start_date': start_date,
-        'end_date': end_date,
-        'selected_user': user_id,
+        'start_date': request.GET.get('start_date'),
+        'end_date': request.GET.get('end_date'),
+        'selected_user': request.GET.get('user'),
+        'is_first_page': not cursor,
+        'filter_query': filter_params.urlencode(),
+        'next_query': next_params.urlencode() if next_params else '',
+        'export_jobs': ExportJob.objects.select_related('requested_by')[:10],
+        'export_formats': ExportJob.FORMAT_CHOICES,
     }
     return render(request, 'attendance/reports.html', context)
 
 
+def export_excel_watermark(request):
+    if not user_is_admin(request.user):
+        return None
+    try:
+        filters = get_report_filters(request)
+    except ValueError:
+        return None
+    start_date, end_date, user_id = filters['start_date'], filters['end_date'], filters['user_id']
+    version, last_modified = watermarks.logs_watermark(start_date, end_date, user_id)
+    # The download name carries today's date
+    parts = ['export_excel', start_date, end_date, user_id, version, timezone.localdate()]
+    return parts, last_modified
+
+
 @login_required
+@watermarks.conditional(export_excel_watermark)
 def export_excel(request):
     """Export attendance records to Excel"""
     if not user_is_admin(request.user):
         messages.error(request, 'Access denied.')
         return redirect('employee_dashboard')
     
-    # Get filter parameters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    user_id = request.GET.get('user')
-    
-    # Build query
-    logs = AttendanceLog.objects.select_related('user').order_by('date', 'user__username')
-    
-    if start_date:
-        logs = logs.filter(date__gte=start_date)
-    if end_date:
-        logs = logs.filter(date__lte=end_date)
-    if user_id:
-        logs = logs.filter(user_id=user_id)
-    
-    # Create workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Attendance Report"
-    
-    # Headers
-    headers = ['User', 'Date', 'Check In', 'Check Out', 'Total Hours']
-    ws.append(headers)
-    
-    # Style headers
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Add data
-    for log in logs:
-        ws.append([
-            log.user.get_full_name() or log.user.username,
-            log.date.strftime('%Y-%m-%d'),
-            log.check_in.strftime('%I:%M %p') if log.check_in else 'N/A',
-            log.check_out.strftime('%I:%M %p') if log.check_out else 'N/A',
-            f"{log.get_total_hours():.2f}" if log.is_complete() else 'N/A',
-        ])
-    
-    # Adjust column widths
-    ws.column_dimensions['A'].width = 25
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 15
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 15
-    
-    # Create HTTP response
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    try:
+        filters = get_report_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    
+    # Closed ranges come from the export cache; otherwise rows stream
+    # straight from the database (and any archived months the range
+    # reaches) into a write-only workbook
+    return excel_export_response(filters['start_date'], filters['end_date'], filters['user_id'])
+
+
+@login_required
+def export_data(request, fmt):
+    """Export attendance records as CSV or newline-delimited JSON"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    if fmt not in STREAM_FORMATS:
+        raise Http404('Unknown export format')
+    
+    # Same filters as the Excel export; ?compress=gzip for a .gz file
+    try:
+        filters = get_report_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    compress = request.GET.get('compress') == 'gzip'
+    
+    return data_export_response(
+        request, fmt, compress, filters['start_date'], filters['end_date'], filters['user_id'],
     )
+
+
+@login_required
+@require_POST
+def submit_export_job(request):
+    """Queue a background export of the current report filters"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
     
-    filename = f"attendance_report_{timezone.localdate().strftime('%Y%m%d')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    start_date = request.POST.get('start_date')
+    end_date = request.POST.get('end_date')
+    user_id = request.POST.get('user')
     
-    wb.save(response)
+    try:
+        job, created = export_jobs.submit(
+            request.user,
+            request.POST.get('format', 'xlsx'),
+            compress=request.POST.get('compress') == 'gzip',
+            start_date=start_date,
+            end_date=end_date,
+            user_id=user_id,
+        )
+    except ValueError as e:
+        messages.error(request, str(e))
+    else:
+        if created:
+            messages.success(request, f'Export #{job.pk} queued. It will be ready to download below.')
+        else:
+            messages.info(request, f'An identical export (#{job.pk}) is already in progress.')
+    
+    filters = {k: v for k, v in (('start_date', start_date), ('end_date', end_date), ('user', user_id)) if v}
+    return redirect(f"{reverse('reports')}?{urlencode(filters)}")
+
+
+@login_required
+def export_job_status(request, job_id):
+    """Progress of a background export, polled by the reports page"""
+    if not user_is_admin(request.user):
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    job = get_object_or_404(ExportJob, pk=job_id)
+    payload = export_jobs.job_payload(job)
+    payload['download_url'] = (
+        reverse('download_export_job', args=[job.pk]) if job.status == ExportJob.STATUS_DONE else None
+    )
+    return JsonResponse(payload)
+
+
+@login_required
+def download_export_job(request, job_id):
+    """Download the file of a finished background export"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    job = get_object_or_404(ExportJob, pk=job_id)
+    path = export_jobs.result_file(job)
+    if path is None:
+        raise Http404('Export file not available')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=export_jobs.download_name(job))
+
+
+@login_required
+def summary_report(request):
+    """Per-user hours totals grouped by day, week or month"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    try:
+        filters = get_report_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    period = parse_period(request.GET.get('period'))
+    start_date, end_date = summary_range(filters['start_date'], filters['end_date'])
+    cursor = request.GET.get('cursor')
+    
+    # Totals are aggregated in a single GROUP BY query, one page at a time
+    try:
+        summary, next_cursor = get_summary_page(start_date, end_date, filters['user_id'], period, cursor)
+    except InvalidCursor:
+        messages.error(request, 'Invalid page cursor, showing the first page.')
+        cursor = None
+        summary, next_cursor = get_summary_page(start_date, end_date, filters['user_id'], period)
+    
+    # The defaulted start date is kept in the links, so paging and the
+    # export cover the range shown
+    filter_params = request.GET.copy()
+    filter_params.pop('cursor', None)
+    filter_params['start_date'] = start_date
+    next_query = None
+    if next_cursor:
+        next_params = filter_params.copy()
+        next_params['cursor'] = next_cursor
+        next_query = next_params.urlencode()
+    
+    # Get all users for filter dropdown
+    all_users = User.objects.filter(is_active=True, role='EMPLOYEE').order_by('username')
+    
+    context = {
+        'summary': summary,
+        'all_users': all_users,
+        'periods': SUMMARY_PERIODS,
+        'start_date': start_date,
+        'end_date': request.GET.get('end_date'),
+        'selected_user': request.GET.get('user'),
+        'selected_period': period,
+        'is_first_page': not cursor,
+        'filter_query': filter_params.urlencode(),
+        'next_query': next_query,
+    }
+    return render(request, 'attendance/summary_report.html', context)
+
+
+@login_required
+def export_summary(request):
+    """Export the hours summary report to Excel"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    try:
+        filters = get_report_filters(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    period = parse_period(request.GET.get('period'))
+    
+    # Every row of the requested range, not just the page on screen
+    summary = get_summary_queryset(filters['start_date'], filters['end_date'], filters['user_id'], period)
+    return xlsx_response(
+        iter_summary_export_rows(summary),
+        headers=SUMMARY_HEADERS,
+        title="Hours Summary",
+        prefix=f'attendance_summary_{period}',
+    )
+
+
+@login_required
+def absence_matrix(request):
+    """Worked / incomplete / absent / not scheduled grid of employees by day"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    group_id = absence.parse_group(request.GET.get('group'))
+    after = request.GET.get('after')
+    try:
+        start, end = absence.parse_range(request.GET.get('start_date'), request.GET.get('end_date'))
+    except ValueError as exc:
+        messages.error(request, str(exc))
+        start, end = absence.parse_range()
+    
+    # One page of employees, keyset-paginated by username
+    employees = absence.get_employees(group_id)
+    if after:
+        employees = employees.filter(username__gt=after)
+    page = list(absence.iter_matrix(employees[:absence.PAGE_SIZE + 1], start, end, group_id))
+    
+    next_params = None
+    if len(page) > absence.PAGE_SIZE:
+        page = page[:absence.PAGE_SIZE]
+        next_params = request.GET.copy()
+        next_params['after'] = page[-1][0]['username']
+    
+    filter_params = request.GET.copy()
+    filter_params.pop('after', None)
+    
+    days = absence.get_days(start, end)
+    rows = [
+        {
+            'username': values['username'],
+            'display_name': absence.display_name(values),
+            'cells': cells,
+            'counts': absence.count_statuses(cells),
+        }
+        for values, cells in page
+    ]
+    
+    context = {
+        'rows': rows,
+        'days': days,
+        'statuses': absence.STATUSES,
+        'all_groups': AttendanceGroup.objects.order_by('name'),
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'selected_group': group_id,
+        'is_first_page': not after,
+        'filter_query': filter_params.urlencode(),
+        'next_query': next_params.urlencode() if next_params else '',
+    }
+    return render(request, 'attendance/absence_matrix.html', context)
+
+
+@login_required
+def export_absence_matrix(request):
+    """Export the absence matrix as CSV, one row per employee"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    group_id = absence.parse_group(request.GET.get('group'))
+    try:
+        start, end = absence.parse_range(request.GET.get('start_date'), request.GET.get('end_date'))
+    except ValueError as exc:
+        messages.error(request, str(exc))
+        return redirect('absence_matrix')
+    
+    response = StreamingHttpResponse(
+        absence.iter_matrix_csv(absence.get_employees(group_id), start, end, group_id),
+        content_type='text/csv; charset=utf-8'
+    )
+    filename = export_filename('csv', prefix='absence_matrix')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
+
+
+@login_required
+def request_metrics(request):
+    """Slowest endpoints and N+1 offenders from the instrumentation buffer"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    if request.method == 'POST':
+        instrumentation.buffer.clear()
+        messages.success(request, 'Request metrics cleared.')
+        return redirect('request_metrics')
+    
+    records = instrumentation.buffer.snapshot()
+    
+    context = {
+        'enabled': instrumentation.is_enabled(),
+        'record_count': len(records),
+        'endpoints': instrumentation.slowest_endpoints(records),
+        'offenders': instrumentation.n_plus_one_offenders(records),
+        'recent': records[-20:][::-1],
+    }
+    return render(request, 'attendance/request_metrics.html', context)
+
+
+def profilable_views():
+    """URL names of the app's views, for the profiling form"""
+    from . import urls as attendance_urls
+    from users import urls as users_urls
+    
+    names = {
+        pattern.name
+        for module in (attendance_urls, users_urls)
+        for pattern in module.urlpatterns
+        if pattern.name
+    }
+    return sorted(names)
+
+
+@login_required
+def profiling_settings(request):
+    """Arm or disarm on-demand request profiling and list captured profiles"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    views_available = profilable_views()
+    
+    if request.method == 'POST':
+        if request.POST.get('action') == 'disarm':
+            profiling.disarm()
+            messages.success(request, 'Profiling stopped.')
+            return redirect('profiling_settings')
+        
+        view = request.POST.get('view') or None
+        username = request.POST.get('username', '').strip()
+        mode = request.POST.get('mode')
+        try:
+            count = int(request.POST.get('count', 1))
+        except ValueError:
+            count = 0
+        
+        user_id = None
+        if username:
+            user_id = User.objects.filter(username=username).values_list('id', flat=True).first()
+        
+        if view and view not in views_available:
+            messages.error(request, 'Unknown view.')
+        elif username and user_id is None:
+            messages.error(request, f'User "{username}" not found.')
+        elif mode not in dict(profiling.MODES):
+            messages.error(request, 'Unknown profiling mode.')
+        elif not 1 <= count <= 100:
+            messages.error(request, 'Number of requests must be between 1 and 100.')
+        else:
+            profiling.arm(view=view, user_id=user_id, count=count, mode=mode)
+            messages.success(request, f'Profiling the next {count} matching request(s).')
+        return redirect('profiling_settings')
+    
+    trigger, remaining = profiling.get_trigger()
+    if trigger and trigger['user_id']:
+        trigger['username'] = User.objects.filter(id=trigger['user_id']).values_list('username', flat=True).first()
+    
+    context = {
+        'enabled': profiling.is_enabled(),
+        'trigger': trigger,
+        'remaining': remaining,
+        'views_available': views_available,
+        'modes': profiling.MODES,
+        'artifacts': profiling.list_artifacts(),
+    }
+    return render(request, 'attendance/profiling.html', context)
+
+
+@login_required
+def download_profile(request, name):
+    """Download a stored profile artifact"""
+    if not user_is_admin(request.user):
+        messages.error(request, 'Access denied.')
+        return redirect('employee_dashboard')
+    
+    path = profiling.artifact_path(name)
+    if path is None:
+        raise Http404('Profile not found')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
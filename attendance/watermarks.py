@@ -0,0 +1,138 @@
+"""
+Conditional GET for the admin pages.
+
+Each page is identified by a watermark: the max updated_at and the row
+count of what it shows, read with aggregates the (date, user,
+updated_at) index covers. conditional() turns a watermark into ETag and
+Last-Modified headers, and Django answers 304 before the view runs when
+the client's copy is still current, so neither the page's main query
+nor a workbook build happens.
+
+Deletions don't leave an updated_at behind; they lower the count, which
+changes the ETag. Last-Modified also takes the newest log tombstone
+into account for clients that only send If-Modified-Since.
+
+Responses are marked ``private, no-cache``: browsers keep them but
+revalidate on every visit. The ETag includes the user and their CSRF
+cookie so a cached page never carries someone else's form token, and
+requests with pending flash messages are always rendered.
+"""
+from datetime import timedelta
+from functools import wraps
+
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .exports import export_etag, export_version
+from .models import AttendanceDailySummary, AttendanceGroup, DeletedRecord, ExportJob
+from .rollups import TREND_DAYS
+from users.models import User
+
+
+def table_state(queryset, field='updated_at'):
+    """(max timestamp, count) of a queryset"""
+    state = queryset.aggregate(last=Max(field), count=Count('pk'))
+    return state['last'], state['count']
+
+
+def latest_log_deletion():
+    return DeletedRecord.objects.filter(
+        kind=DeletedRecord.KIND_ATTENDANCE_LOG
+    ).aggregate(last=Max('deleted_at'))['last']
+
+
+def employees_state():
+    """Backs the employee lists and counts shown on the admin pages"""
+    return table_state(User.objects.filter(is_active=True, role='EMPLOYEE'))
+
+
+def newest(*timestamps):
+    timestamps = [at for at in timestamps if at is not None]
+    return max(timestamps) if timestamps else None
+
+
+def conditional(get_watermark):
+    """
+    Decorator adding ETag/Last-Modified handling to a view.
+
+    get_watermark(request, *args, **kwargs) returns (parts, last_modified),
+    where parts is anything JSON-serializable that changes with the page,
+    or None to render the page normally.
+    """
+    def watermark(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately
+        if not hasattr(request, '_attendance_watermark'):
+            state = None
+            if request.method in ('GET', 'HEAD') and not messages.get_messages(request):
+                state = get_watermark(request, *args, **kwargs)
+            request._attendance_watermark = state
+        return request._attendance_watermark
+
+    def etag_func(request, *args, **kwargs):
+        state = watermark(request, *args, **kwargs)
+        if state is None:
+            return None
+        # The page's form token comes from the CSRF cookie. Create it now
+        # if the request has none, rather than while rendering, so the
+        # first response's ETag already matches the cookie it sets.
+        get_token(request)
+        return export_etag(request.user.pk, request.META.get('CSRF_COOKIE'), state[0])
+
+    def last_modified_func(request, *args, **kwargs):
+        state = watermark(request, *args, **kwargs)
+        return state[1] if state else None
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if watermark(request, *args, **kwargs) is not None:
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+# Page watermarks
+
+def logs_watermark(start_date=None, end_date=None, user_id=None):
+    """The filtered logs (and archived months) behind a report or export"""
+    version = export_version(start_date, end_date, user_id)
+    return version, newest(version['last_updated'], latest_log_deletion())
+
+
+def reports_watermark(start_date, end_date, user_id, cursor, page_size):
+    # The export job panel changes while jobs run; it polls anyway
+    if ExportJob.objects.filter(status__in=ExportJob.IN_FLIGHT).exists():
+        return None
+    version, last_modified = logs_watermark(start_date, end_date, user_id)
+    users_updated, users_count = employees_state()
+    jobs = ExportJob.objects.aggregate(
+        created=Max('created_at'), finished=Max('finished_at'), count=Count('pk')
+    )
+    parts = [
+        'reports', start_date, end_date, user_id, cursor, page_size, version,
+        users_updated, users_count, jobs,
+    ]
+    return parts, newest(last_modified, users_updated, jobs['created'], jobs['finished'])
+
+
+def dashboard_watermark(today):
+    logs_version, logs_modified = logs_watermark(today, today)
+    summaries_updated, summaries_count = table_state(AttendanceDailySummary.objects.filter(
+        group__isnull=True,
+        date__gt=today - timedelta(days=TREND_DAYS),
+        date__lte=today,
+    ))
+    users_updated, users_count = employees_state()
+    groups_updated, groups_count = table_state(AttendanceGroup.objects.all())
+    parts = [
+        'admin_dashboard', today, logs_version, summaries_updated, summaries_count,
+        users_updated, users_count, groups_updated, groups_count,
+    ]
+    return parts, newest(logs_modified, summaries_updated, users_updated, groups_updated)
@@ -10,7 +10,7 @@ class UserAdmin(BaseUserAdmin):
     search_fields = ('username', 'email', 'first_name', 'last_name')
     
     fieldsets = BaseUserAdmin.fieldsets + (
-        ('Additional Info', {'fields': ('role',)}),
+        ('Additional Info', {'fields': ('role', 'badge_id')}),
     )
     
     add_fieldsets = BaseUserAdmin.add_fieldsets + (
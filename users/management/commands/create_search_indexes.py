@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from users.models import User
+
+
+# Columns matched by the admin's name searches (icontains)
+SEARCH_COLUMNS = ('username', 'first_name', 'last_name', 'email')
+
+
+class Command(BaseCommand):
+    help = 'Creates trigram indexes backing user name searches (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help='Drop the indexes instead of creating them'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'Skipped: trigram indexes need PostgreSQL (database is {connection.vendor})'
+            ))
+            return
+
+        table = User._meta.db_table
+        quote = connection.ops.quote_name
+        statements = []
+        if not options['drop']:
+            statements.append('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+        for column in SEARCH_COLUMNS:
+            name = f'{table}_{column}_trgm'
+            if options['drop']:
+                statements.append(f'DROP INDEX IF EXISTS {quote(name)}')
+            else:
+                # Same expression as Django's icontains lookup on PostgreSQL,
+                # UPPER("column"::text) LIKE UPPER('%term%'), so the planner
+                # can use the index for substring searches
+                statements.append(
+                    f'CREATE INDEX IF NOT EXISTS {quote(name)} ON {quote(table)} '
+                    f'USING gin (UPPER({quote(column)}::text) gin_trgm_ops)'
+                )
+
+        self.stdout.write(self.style.WARNING(
+            'Dropping search indexes...' if options['drop'] else 'Creating search indexes...'
+        ))
+        try:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+        except DatabaseError as exc:
+            raise CommandError(f'Could not update search indexes: {exc}')
+
+        action = 'Dropped' if options['drop'] else 'Created'
+        for column in SEARCH_COLUMNS:
+            self.stdout.write(self.style.SUCCESS(f'✓ {action} index on {table}.{column}'))
+
+        self.stdout.write(self.style.SUCCESS('\n=== Search indexes updated ==='))
@@ -0,0 +1,209 @@
+import random
+import re
+import time as time_module
+from datetime import time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from attendance.models import AttendanceGroup, AttendanceLog, UserGroup, days_to_mask
+
+User = get_user_model()
+
+FIRST_NAMES = (
+    'Ana', 'Carlos', 'Lucía', 'Miguel', 'Sofía', 'Javier', 'Valentina', 'Diego',
+    'Camila', 'Andrés', 'Isabella', 'Mateo', 'Daniela', 'Sebastián', 'Paula', 'Tomás',
+)
+
+LAST_NAMES = (
+    'García', 'Rodríguez', 'Martínez', 'López', 'González', 'Pérez', 'Sánchez', 'Ramírez',
+    'Torres', 'Flores', 'Rivera', 'Gómez', 'Díaz', 'Cruz', 'Morales', 'Ortiz',
+)
+
+# (label, allowed days, weight) for generated groups
+GROUP_PATTERNS = (
+    ('Weekday', [0, 1, 2, 3, 4], 50),
+    ('Weekend', [5, 6], 10),
+    ('Full Time', [0, 1, 2, 3, 4, 5, 6], 10),
+    ('Mon-Thu', [0, 1, 2, 3], 15),
+    ('Part Time', None, 15),
+)
+
+# (shift start, weight): most people start in the morning
+SHIFT_STARTS = ((time(6), 15), (time(8), 60), (time(9), 15), (time(14), 10))
+
+# Share of users in one, two or three groups
+GROUP_COUNTS = ((1, 80), (2, 15), (3, 5))
+
+ABSENCE_RATE = 0.06
+MISSING_CHECK_OUT_RATE = 0.03
+
+
+def weighted(rng, choices):
+    values = [value for value, weight in choices]
+    weights = [weight for value, weight in choices]
+    return rng.choices(values, weights)[0]
+
+
+def next_number(names, pattern, default):
+    """One past the highest number captured by pattern in names"""
+    numbers = [int(match.group(1)) for name in names if (match := re.match(pattern, name))]
+    return max(numbers) + 1 if numbers else default
+
+
+def minutes_to_time(minutes):
+    minutes = max(0, min(int(minutes), 24 * 60 - 1))
+    return time(minutes // 60, minutes % 60)
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic users, groups and attendance logs for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Employees to create (default: 1000)')
+        parser.add_argument('--groups', type=int, default=10, help='Groups to create (default: 10)')
+        parser.add_argument('--days', type=int, default=90, help='Days of history before today (default: 90)')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible data')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)'
+        )
+        parser.add_argument(
+            '--password',
+            default='password123',
+            help='Password of every generated user (default: password123)'
+        )
+        parser.add_argument(
+            '--prefix',
+            default='load',
+            help='Username prefix of generated users (default: load)'
+        )
+
+    def create_groups(self, rng, count, prefix):
+        groups = []
+        # Continue after the highest existing number; earlier runs may have
+        # been partly deleted, so counting the matches could reuse a name
+        existing = AttendanceGroup.objects.filter(name__startswith=f'{prefix.title()} ')
+        first = next_number(
+            existing.values_list('name', flat=True).iterator(),
+            rf'{re.escape(prefix.title())} (\d+) ',
+            1
+        )
+        for number in range(first, first + count):
+            label, days, _ = weighted(rng, [(pattern, pattern[2]) for pattern in GROUP_PATTERNS])
+            if days is None:
+                days = sorted(rng.sample(range(7), rng.randint(2, 4)))
+            # bulk_create skips save(), so the mask is set here
+            groups.append(AttendanceGroup(
+                name=f'{prefix.title()} {number:04d} {label}',
+                allowed_days=days,
+                allowed_days_mask=days_to_mask(days),
+            ))
+        AttendanceGroup.objects.bulk_create(groups)
+        names = [group.name for group in groups]
+        return list(AttendanceGroup.objects.filter(name__in=names).values_list('id', 'allowed_days_mask'))
+
+    def create_users(self, rng, count, prefix, password, chunk_size):
+        # One hash for everyone instead of one per create_user call
+        password_hash = make_password(password)
+        existing = User.objects.filter(username__startswith=prefix)
+        offset = next_number(
+            existing.values_list('username', flat=True).iterator(),
+            rf'{re.escape(prefix)}(\d+)$',
+            0
+        )
+        user_ids = []
+        for start in range(offset, offset + count, chunk_size):
+            users = []
+            for number in range(start, min(start + chunk_size, offset + count)):
+                username = f'{prefix}{number:06d}'
+                users.append(User(
+                    username=username,
+                    email=f'{username}@example.com',
+                    password=password_hash,
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    role='EMPLOYEE',
+                ))
+            User.objects.bulk_create(users)
+            user_ids.extend(
+                User.objects.filter(username__in=[user.username for user in users]).values_list('id', flat=True)
+            )
+            self.stdout.write(f'  {len(user_ids)} users')
+        return sorted(user_ids), f'{prefix}{offset:06d}'
+
+    def handle(self, *args, **options):
+        users = options['users']
+        group_count = options['groups']
+        days = options['days']
+        chunk_size = options['chunk_size']
+        if users < 1 or group_count < 1 or days < 0 or chunk_size < 1:
+            raise CommandError('--users, --groups and --chunk-size must be positive and --days not negative')
+
+        rng = random.Random(options['seed'])
+        started = time_module.perf_counter()
+
+        self.stdout.write(self.style.WARNING(
+            f'Generating {users} users, {group_count} groups and {days} days of attendance...'
+        ))
+
+        groups = self.create_groups(rng, group_count, options['prefix'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Created {len(groups)} groups'))
+
+        user_ids, first_username = self.create_users(rng, users, options['prefix'], options['password'], chunk_size)
+        self.stdout.write(self.style.SUCCESS(f'✓ Created {len(user_ids)} users'))
+
+        # Memberships, with some users in more than one group
+        memberships = []
+        masks = {}
+        for user_id in user_ids:
+            chosen = rng.sample(groups, min(weighted(rng, GROUP_COUNTS), len(groups)))
+            masks[user_id] = 0
+            for group_id, mask in chosen:
+                memberships.append(UserGroup(user_id=user_id, group_id=group_id))
+                masks[user_id] |= mask
+        UserGroup.objects.bulk_create(memberships, batch_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(f'✓ Created {len(memberships)} group memberships'))
+
+        # Logs on each user's allowed weekdays up to yesterday
+        today = timezone.localdate()
+        dates = [today - timedelta(days=offset) for offset in range(days, 0, -1)]
+        logs = []
+        log_count = 0
+        for user_id in user_ids:
+            mask = masks[user_id]
+            shift_start = weighted(rng, SHIFT_STARTS)
+            start_minutes = shift_start.hour * 60
+            shift_minutes = rng.choice((6 * 60, 8 * 60, 8 * 60, 10 * 60))
+            for day in dates:
+                if not mask & (1 << day.weekday()) or rng.random() < ABSENCE_RATE:
+                    continue
+                check_in = start_minutes + rng.gauss(0, 12)
+                check_out = None
+                if rng.random() >= MISSING_CHECK_OUT_RATE:
+                    check_out = minutes_to_time(check_in + shift_minutes + rng.gauss(10, 25))
+                check_in = minutes_to_time(check_in)
+                if check_out is not None and check_out <= check_in:
+                    check_out = None
+                logs.append(AttendanceLog(user_id=user_id, date=day, check_in=check_in, check_out=check_out))
+
+                if len(logs) >= chunk_size:
+                    AttendanceLog.objects.bulk_create(logs)
+                    log_count += len(logs)
+                    logs.clear()
+                    if log_count % (chunk_size * 20) == 0:
+                        elapsed = time_module.perf_counter() - started
+                        self.stdout.write(f'  {log_count} logs ({log_count / elapsed:.0f} rows/s)')
+        AttendanceLog.objects.bulk_create(logs)
+        log_count += len(logs)
+        self.stdout.write(self.style.SUCCESS(f'✓ Created {log_count} attendance logs'))
+
+        elapsed = time_module.perf_counter() - started
+        self.stdout.write(self.style.WARNING(
+            'Run "python manage.py rebuild_rollups" to update the daily summaries'
+        ))
+        self.stdout.write(self.style.SUCCESS(f'\n=== Done in {elapsed:.2f}s ==='))
+        self.stdout.write(self.style.SUCCESS(f'\nGenerated users log in with: {first_username} / {options["password"]}'))
@@ -0,0 +1,231 @@
+import csv
+import time as time_module
+import zlib
+from zipfile import BadZipFile
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.utils.dateparse import parse_date, parse_time
+from attendance.models import AttendanceLog
+
+User = get_user_model()
+
+# Accepted 12-hour formats, besides ISO times
+TIME_FORMATS = ('%I:%M %p', '%I:%M:%S %p')
+
+EMPTY_VALUES = ('', 'n/a', '-', '—')
+
+MAX_REPORTED_ERRORS = 20
+
+# What a truncated, corrupt or wrongly encoded file raises while being read;
+# broken worksheet XML raises a SyntaxError subclass (ElementTree or lxml)
+READ_ERRORS = (OSError, KeyError, ValueError, SyntaxError, BadZipFile, csv.Error, zlib.error)
+
+
+class RowError(ValueError):
+    pass
+
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        parsed = parse_date(str(value).strip()) if value is not None else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise RowError(f'invalid date: {value!r}')
+    return parsed
+
+
+def to_time(value):
+    if value is None or str(value).strip().lower() in EMPTY_VALUES:
+        return None
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, time):
+        return value
+    text = str(value).strip()
+    try:
+        parsed = parse_time(text)
+    except ValueError:
+        parsed = None
+    if parsed is not None:
+        return parsed
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(text.upper(), time_format).time()
+        except ValueError:
+            continue
+    raise RowError(f'invalid time: {value!r}')
+
+
+class Command(BaseCommand):
+    help = 'Imports historical attendance from a CSV or XLSX file (columns: username, date, check_in, check_out)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file to import')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk insert (default: 5000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the file without writing anything'
+        )
+        parser.add_argument(
+            '--sheet',
+            help='XLSX worksheet name (default: the first sheet)'
+        )
+
+    def iter_rows(self, path, sheet):
+        """Stream rows as tuples, header first, without loading the file"""
+        if path.lower().endswith(('.xlsx', '.xlsm')):
+            from openpyxl import load_workbook
+
+            wb = load_workbook(path, read_only=True, data_only=True)
+            try:
+                ws = wb[sheet] if sheet else wb.worksheets[0]
+                yield from ws.iter_rows(values_only=True)
+            finally:
+                wb.close()
+        else:
+            # Decoded line by line so an encoding error stops at its own row
+            # rather than at the start of the buffer it was read with
+            with open(path, 'rb') as f:
+                yield from csv.reader(line.decode('utf-8-sig') for line in f)
+
+    def numbered_rows(self, rows, path):
+        """(line, row) pairs after the header; read errors name the line"""
+        line = 1
+        while True:
+            line += 1
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            except READ_ERRORS as exc:
+                raise CommandError(f'Could not read {path} at line {line}: {exc}')
+            yield line, row
+
+    def column_indexes(self, header):
+        # The Excel report's "User" column holds display names, so it is not
+        # accepted; the CSV data export (/reports/export/csv/) re-imports as is
+        names = [str(name or '').strip().lower().replace(' ', '_') for name in header]
+        aliases = {
+            'username': ('username',),
+            'date': ('date',),
+            'check_in': ('check_in', 'checkin', 'in'),
+            'check_out': ('check_out', 'checkout', 'out'),
+        }
+        indexes = {}
+        for column, options in aliases.items():
+            for option in options:
+                if option in names:
+                    indexes[column] = names.index(option)
+                    break
+        missing = {'username', 'date'} - set(indexes)
+        if missing:
+            raise CommandError(f'Missing required column(s): {", ".join(sorted(missing))}')
+        return indexes
+
+    def parse_row(self, row, indexes, user_ids):
+        def cell(column):
+            index = indexes.get(column)
+            return row[index] if index is not None and index < len(row) else None
+
+        username = str(cell('username') or '').strip()
+        user_id = user_ids.get(username)
+        if user_id is None:
+            raise RowError(f'unknown user: {username!r}')
+
+        log = AttendanceLog(
+            user_id=user_id,
+            date=to_date(cell('date')),
+            check_in=to_time(cell('check_in')),
+            check_out=to_time(cell('check_out')),
+        )
+        # Same rule as AttendanceLog.clean, applied without a query per row
+        if log.check_in and log.check_out and log.check_out <= log.check_in:
+            raise RowError('check out time must be after check in time')
+        if log.check_out and not log.check_in:
+            raise RowError('check out without check in')
+        return log
+
+    def handle(self, *args, **options):
+        path = options['path']
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+
+        self.stdout.write(self.style.WARNING(
+            f'{"Validating" if dry_run else "Importing"} {path}...'
+        ))
+
+        # One query for every username -> id
+        user_ids = dict(User.objects.values_list('username', 'id'))
+
+        try:
+            rows = self.iter_rows(path, options['sheet'])
+            header = next(rows, None)
+        except READ_ERRORS as exc:
+            raise CommandError(f'Could not read {path}: {exc}')
+        if header is None:
+            raise CommandError('The file is empty')
+        indexes = self.column_indexes(header)
+
+        started = time_module.perf_counter()
+        read = valid = invalid = 0
+        chunk = []
+
+        def flush():
+            if chunk and not dry_run:
+                # Rows for an existing (user, date) are left untouched
+                AttendanceLog.objects.bulk_create(chunk, ignore_conflicts=True)
+            chunk.clear()
+
+        for line, row in self.numbered_rows(rows, path):
+            if not any(value not in (None, '') for value in row):
+                continue
+            read += 1
+            try:
+                chunk.append(self.parse_row(row, indexes, user_ids))
+                valid += 1
+            except RowError as exc:
+                invalid += 1
+                if invalid <= MAX_REPORTED_ERRORS:
+                    self.stdout.write(self.style.ERROR(f'  line {line}: {exc}'))
+            except (TypeError, ValueError) as exc:
+                # A cell no parser expected; earlier chunks are already saved
+                raise CommandError(f'Could not import line {line}: {exc}')
+
+            if len(chunk) >= chunk_size:
+                flush()
+                elapsed = time_module.perf_counter() - started
+                self.stdout.write(f'  {read} rows read, {valid} valid ({read / elapsed:.0f} rows/s)')
+
+        flush()
+
+        if invalid > MAX_REPORTED_ERRORS:
+            self.stdout.write(self.style.ERROR(f'  ... {invalid - MAX_REPORTED_ERRORS} more invalid rows'))
+
+        elapsed = time_module.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Rows read: {read}'))
+        self.stdout.write(self.style.SUCCESS(f'✓ Valid rows: {valid}'))
+        if invalid:
+            self.stdout.write(self.style.ERROR(f'✗ Invalid rows: {invalid}'))
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Dry run: nothing was written'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Valid rows were inserted; days that already had a log were left unchanged'
+            ))
+            self.stdout.write(self.style.WARNING(
+                'Run "python manage.py rebuild_rollups" to update the daily summaries'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'\n=== Done in {elapsed:.2f}s ==='))
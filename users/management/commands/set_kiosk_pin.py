@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Sets or clears the kiosk PIN of a user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('pin', nargs='?', help='New PIN; omit to clear it')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+        
+        pin = options['pin']
+        if pin and not pin.isdigit():
+            raise CommandError('PIN must contain digits only')
+        
+        user.set_kiosk_pin(pin)
+        try:
+            user.save(update_fields=['kiosk_pin_digest'])
+        except IntegrityError:
+            raise CommandError('That PIN is already in use by another user')
+        
+        if pin:
+            self.stdout.write(self.style.SUCCESS(f'✓ Kiosk PIN set for {user.username}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Kiosk PIN cleared for {user.username}'))
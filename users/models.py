@@ -1,5 +1,28 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.db import models
+from django.db.models import F
+from django.utils.crypto import salted_hmac
+
+
+class UserManager(BaseUserManager):
+    
+    def expected_on(self, date):
+        """
+        Active users with at least one attendance group allowing date.
+        
+        Eligibility is resolved with a single bitwise filter on the
+        groups' allowed-days mask, joined through UserGroup.
+        """
+        # attendance.models imports this module
+        from attendance.models import weekday_bit
+        
+        bit = weekday_bit(date)
+        return (
+            self.filter(is_active=True)
+            .alias(day_bit=F('user_groups__group__allowed_days_mask').bitand(bit))
+            .filter(day_bit=bit)
+            .distinct()
+        )
 
 
 class User(AbstractUser):
@@ -28,9 +51,28 @@ class User(AbstractUser):
         verbose_name='Active'
     )
     
+    # Kiosk credentials, used to punch from shared terminals without a login
+    badge_id = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name='Badge ID'
+    )
+    
+    kiosk_pin_digest = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = UserManager()
+    
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
@@ -44,3 +86,11 @@ class User(AbstractUser):
     
     def is_employee(self):
         return self.role == 'EMPLOYEE'
+    
+    @staticmethod
+    def make_kiosk_pin_digest(pin):
+        """Keyed digest of a kiosk PIN, indexed for a single-query lookup"""
+        return salted_hmac('users.User.kiosk_pin', str(pin)).hexdigest()
+    
+    def set_kiosk_pin(self, pin):
+        self.kiosk_pin_digest = self.make_kiosk_pin_digest(pin) if pin else None